@@ -1,5 +1,18 @@
-import copy
+import ctypes
+import ctypes.util
+import functools
+import hmac
+import os
+import queue
 import struct
+import threading
+import weakref
+from parallel import parallel_map
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 def _compact_word(word):
@@ -436,77 +449,39 @@ class AES(object):
           0x2acbd7c5, 0x15e8e6ef, 0x1ce5ede1, 0x07f2f0f3, 0x0efffbfd, 0x79b492a7, 0x70b999a9, 0x6bae84bb, 0x62a38fb5,
           0x5d80be9f, 0x548db591, 0x4f9aa883, 0x4697a38d]
 
-    def __init__(self, key):
+    def __init__(self, key, backend=None):
 
         if len(key) not in (16, 24, 32):
             raise ValueError('Invalid key size')
 
-        rounds = self.number_of_rounds[len(key)]
+        self._key = bytes(key)
 
-        # Encryption round keys
-        self._Ke = [[0] * 4 for _ in range(rounds + 1)]
+        # Native engine from the backend (see get_backend), or None
+        self._native = get_backend(backend).engine(self._key)
 
-        # Decryption round keys
-        self._Kd = [[0] * 4 for _ in range(rounds + 1)]
+        # Round keys for each direction, expanded on first use
+        self._ke = None
+        self._kd = None
 
-        round_key_count = (rounds + 1) * 4
-        kc = len(key) // 4
+        # Vectorized engines, created on first use
+        self._numpy = None
+        self._bitsliced = None
 
-        # Convert the key into ints
-        tk = [struct.unpack('>i', key[i:i + 4])[0] for i in range(0, len(key), 4)]
+    @property
+    def _Ke(self):
+        """Encryption round keys."""
 
-        # Copy values into round key arrays
-        for i in range(0, kc):
-            self._Ke[i // 4][i % 4] = tk[i]
-            self._Kd[rounds - (i // 4)][i % 4] = tk[i]
-
-        # Key expansion (fips-197 section 5.2)
-        rconpointer = 0
-        t = kc
-        while t < round_key_count:
-
-            tt = tk[kc - 1]
-            tk[0] ^= ((self.S[(tt >> 16) & 0xFF] << 24) ^
-                      (self.S[(tt >> 8) & 0xFF] << 16) ^
-                      (self.S[tt & 0xFF] << 8) ^
-                      self.S[(tt >> 24) & 0xFF] ^
-                      (self.rcon[rconpointer] << 24))
-            rconpointer += 1
-
-            if kc != 8:
-                for i in range(1, kc):
-                    tk[i] ^= tk[i - 1]
-
-            # Key expansion for 256-bit keys is "slightly different" (fips-197)
-            else:
-                for i in range(1, kc // 2):
-                    tk[i] ^= tk[i - 1]
-                tt = tk[kc // 2 - 1]
-
-                tk[kc // 2] ^= (self.S[tt & 0xFF] ^
-                                (self.S[(tt >> 8) & 0xFF] << 8) ^
-                                (self.S[(tt >> 16) & 0xFF] << 16) ^
-                                (self.S[(tt >> 24) & 0xFF] << 24))
-
-                for i in range(kc // 2 + 1, kc):
-                    tk[i] ^= tk[i - 1]
-
-            # Copy values into round key arrays
-            j = 0
-            while j < kc and t < round_key_count:
-                self._Ke[t // 4][t % 4] = tk[j]
-                self._Kd[rounds - (t // 4)][t % 4] = tk[j]
-                j += 1
-                t += 1
-
-        # Inverse-Cipher-ify the decryption round key (fips-197 section 5.3)
-        for r in range(1, rounds):
-            for j in range(0, 4):
-                tt = self._Kd[r][j]
-                self._Kd[r][j] = (self.U1[(tt >> 24) & 0xFF] ^
-                                  self.U2[(tt >> 16) & 0xFF] ^
-                                  self.U3[(tt >> 8) & 0xFF] ^
-                                  self.U4[tt & 0xFF])
+        if self._ke is None:
+            self._ke = _expand_key(self._key)
+        return self._ke
+
+    @property
+    def _Kd(self):
+        """Decryption round keys."""
+
+        if self._kd is None:
+            self._kd = _invert_key_schedule(self._key)
+        return self._kd
 
     def encrypt(self, plaintext):
         """"Encrypt a block of plain text using the AES block cipher."""
@@ -514,99 +489,833 @@ class AES(object):
         if len(plaintext) != 16:
             raise ValueError('wrong block length')
 
-        rounds = len(self._Ke) - 1
-        (s1, s2, s3) = [1, 2, 3]
-        a = [0, 0, 0, 0]
+        return list(struct.pack('>4I', *self._encrypt_words(*struct.unpack('>4I', bytes(plaintext)))))
+
+    def decrypt(self, ciphertext):
+        """Decrypt a block of cipher text using the AES block cipher."""
+
+        if len(ciphertext) != 16:
+            raise ValueError('wrong block length')
+
+        return list(struct.pack('>4I', *self._decrypt_words(*struct.unpack('>4I', bytes(ciphertext)))))
+
+    def encrypt_blocks(self, plaintext, out=None):
+        """Encrypt a buffer of whole blocks independently (ECB) into out.
+           A native backend engine is used when there is one. Otherwise
+           large buffers use the NumPy engine when it is available,
+           or the bitsliced engine.
 
-        # Convert plaintext to (ints ^ key)
-        t = [(_compact_word(plaintext[4 * i:4 * i + 4]) ^ self._Ke[0][i]) for i in range(0, 4)]
+           Returns out, which is allocated if not given."""
+
+        engine = self._bulk_engine(len(plaintext))
+        if engine is not None:
+            return engine.encrypt_blocks(plaintext, out)
+
+        return self._crypt_blocks(self._encrypt_words, plaintext, out)
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        """Decrypt a buffer of whole blocks independently (ECB) into out.
+           A native backend engine is used when there is one. Otherwise
+           large buffers use the NumPy engine when it is available,
+           or the bitsliced engine.
+
+           Returns out, which is allocated if not given."""
+
+        engine = self._bulk_engine(len(ciphertext))
+        if engine is not None:
+            return engine.decrypt_blocks(ciphertext, out)
+
+        return self._crypt_blocks(self._decrypt_words, ciphertext, out)
+
+    def _bulk_engine(self, size):
+        """Returns the bulk engine to use for size bytes, or None for the scalar core."""
+
+        if self._native is not None:
+            return self._native
+
+        if numpy is not None and size >= NUMPY_MIN_BYTES:
+            if self._numpy is None:
+                self._numpy = NumpyAES(self)
+            return self._numpy
+
+        if numpy is None and size >= BITSLICE_MIN_BYTES:
+            if self._bitsliced is None:
+                self._bitsliced = BitslicedAES(self)
+            return self._bitsliced
+
+        return None
+
+    @staticmethod
+    def _crypt_blocks(crypt_words, data, out):
+        if len(data) % 16 != 0:
+            raise ValueError('data must be a multiple of 16 bytes')
+
+        if out is None:
+            out = bytearray(len(data))
+
+        words = struct.unpack('>%dI' % (len(data) // 4), data)
+        result = []
+        for i in range(0, len(words), 4):
+            result.extend(crypt_words(words[i], words[i + 1], words[i + 2], words[i + 3]))
+
+        struct.pack_into('>%dI' % len(result), out, 0, *result)
+        return out
+
+    def _encrypt_words(self, s0, s1, s2, s3):
+        """Encrypt one block given as four big-endian words, returning four words."""
+
+        Ke = self._Ke
+        T1, T2, T3, T4, S = self.T1, self.T2, self.T3, self.T4, self.S
+
+        k = Ke[0]
+        s0 ^= k[0]
+        s1 ^= k[1]
+        s2 ^= k[2]
+        s3 ^= k[3]
 
         # Apply round transforms
-        for r in range(1, rounds):
-            for i in range(0, 4):
-                a[i] = (self.T1[(t[i] >> 24) & 0xFF] ^
-                        self.T2[(t[(i + s1) % 4] >> 16) & 0xFF] ^
-                        self.T3[(t[(i + s2) % 4] >> 8) & 0xFF] ^
-                        self.T4[t[(i + s3) % 4] & 0xFF] ^
-                        self._Ke[r][i])
-            t = copy.copy(a)
+        for r in range(1, len(Ke) - 1):
+            k = Ke[r]
+            s0, s1, s2, s3 = (
+                T1[s0 >> 24] ^ T2[(s1 >> 16) & 0xFF] ^ T3[(s2 >> 8) & 0xFF] ^ T4[s3 & 0xFF] ^ k[0],
+                T1[s1 >> 24] ^ T2[(s2 >> 16) & 0xFF] ^ T3[(s3 >> 8) & 0xFF] ^ T4[s0 & 0xFF] ^ k[1],
+                T1[s2 >> 24] ^ T2[(s3 >> 16) & 0xFF] ^ T3[(s0 >> 8) & 0xFF] ^ T4[s1 & 0xFF] ^ k[2],
+                T1[s3 >> 24] ^ T2[(s0 >> 16) & 0xFF] ^ T3[(s1 >> 8) & 0xFF] ^ T4[s2 & 0xFF] ^ k[3])
 
         # The last round is special
-        result = []
-        for i in range(0, 4):
-            tt = self._Ke[rounds][i]
-            result.append((self.S[(t[i] >> 24) & 0xFF] ^ (tt >> 24)) & 0xFF)
-            result.append((self.S[(t[(i + s1) % 4] >> 16) & 0xFF] ^ (tt >> 16)) & 0xFF)
-            result.append((self.S[(t[(i + s2) % 4] >> 8) & 0xFF] ^ (tt >> 8)) & 0xFF)
-            result.append((self.S[t[(i + s3) % 4] & 0xFF] ^ tt) & 0xFF)
+        k = Ke[-1]
+        return (
+            ((S[s0 >> 24] << 24) | (S[(s1 >> 16) & 0xFF] << 16) | (S[(s2 >> 8) & 0xFF] << 8) | S[s3 & 0xFF]) ^ k[0],
+            ((S[s1 >> 24] << 24) | (S[(s2 >> 16) & 0xFF] << 16) | (S[(s3 >> 8) & 0xFF] << 8) | S[s0 & 0xFF]) ^ k[1],
+            ((S[s2 >> 24] << 24) | (S[(s3 >> 16) & 0xFF] << 16) | (S[(s0 >> 8) & 0xFF] << 8) | S[s1 & 0xFF]) ^ k[2],
+            ((S[s3 >> 24] << 24) | (S[(s0 >> 16) & 0xFF] << 16) | (S[(s1 >> 8) & 0xFF] << 8) | S[s2 & 0xFF]) ^ k[3])
 
-        return result
+    def _decrypt_words(self, s0, s1, s2, s3):
+        """Decrypt one block given as four big-endian words, returning four words."""
 
-    def decrypt(self, ciphertext):
-        """Decrypt a block of cipher text using the AES block cipher."""
+        Kd = self._Kd
+        T5, T6, T7, T8, Si = self.T5, self.T6, self.T7, self.T8, self.Si
 
-        if len(ciphertext) != 16:
-            raise ValueError('wrong block length')
+        k = Kd[0]
+        s0 ^= k[0]
+        s1 ^= k[1]
+        s2 ^= k[2]
+        s3 ^= k[3]
+
+        # Apply round transforms
+        for r in range(1, len(Kd) - 1):
+            k = Kd[r]
+            s0, s1, s2, s3 = (
+                T5[s0 >> 24] ^ T6[(s3 >> 16) & 0xFF] ^ T7[(s2 >> 8) & 0xFF] ^ T8[s1 & 0xFF] ^ k[0],
+                T5[s1 >> 24] ^ T6[(s0 >> 16) & 0xFF] ^ T7[(s3 >> 8) & 0xFF] ^ T8[s2 & 0xFF] ^ k[1],
+                T5[s2 >> 24] ^ T6[(s1 >> 16) & 0xFF] ^ T7[(s0 >> 8) & 0xFF] ^ T8[s3 & 0xFF] ^ k[2],
+                T5[s3 >> 24] ^ T6[(s2 >> 16) & 0xFF] ^ T7[(s1 >> 8) & 0xFF] ^ T8[s0 & 0xFF] ^ k[3])
+
+        # The last round is special
+        k = Kd[-1]
+        return (
+            ((Si[s0 >> 24] << 24) | (Si[(s3 >> 16) & 0xFF] << 16) | (Si[(s2 >> 8) & 0xFF] << 8) | Si[s1 & 0xFF]) ^ k[0],
+            ((Si[s1 >> 24] << 24) | (Si[(s0 >> 16) & 0xFF] << 16) | (Si[(s3 >> 8) & 0xFF] << 8) | Si[s2 & 0xFF]) ^ k[1],
+            ((Si[s2 >> 24] << 24) | (Si[(s1 >> 16) & 0xFF] << 16) | (Si[(s0 >> 8) & 0xFF] << 8) | Si[s3 & 0xFF]) ^ k[2],
+            ((Si[s3 >> 24] << 24) | (Si[(s2 >> 16) & 0xFF] << 16) | (Si[(s1 >> 8) & 0xFF] << 8) | Si[s0 & 0xFF]) ^ k[3])
+
+
+# Number of expanded key schedules (per direction) kept in the cache.
+# The caches are sized when they are built; change it with set_key_cache_size
+KEY_SCHEDULE_CACHE_SIZE = 64
+
+
+@functools.lru_cache(maxsize=KEY_SCHEDULE_CACHE_SIZE)
+def _expand_key(key):
+    """Returns the encryption round keys for key (fips-197 section 5.2).
+
+       Results are cached, so repeated use of a session key skips key
+       expansion entirely. Note the cache keeps recently used keys in
+       memory; call clear_key_cache to drop them."""
+
+    rounds = AES.number_of_rounds[len(key)]
+    S, rcon = AES.S, AES.rcon
+
+    round_keys = [[0] * 4 for _ in range(rounds + 1)]
+    round_key_count = (rounds + 1) * 4
+    kc = len(key) // 4
+
+    # Convert the key into ints
+    tk = [struct.unpack('>I', key[i:i + 4])[0] for i in range(0, len(key), 4)]
+
+    # Copy values into round key arrays
+    for i in range(0, kc):
+        round_keys[i // 4][i % 4] = tk[i]
+
+    # Key expansion
+    rconpointer = 0
+    t = kc
+    while t < round_key_count:
+
+        tt = tk[kc - 1]
+        tk[0] ^= ((S[(tt >> 16) & 0xFF] << 24) ^
+                  (S[(tt >> 8) & 0xFF] << 16) ^
+                  (S[tt & 0xFF] << 8) ^
+                  S[(tt >> 24) & 0xFF] ^
+                  (rcon[rconpointer] << 24))
+        rconpointer += 1
+
+        if kc != 8:
+            for i in range(1, kc):
+                tk[i] ^= tk[i - 1]
+
+        # Key expansion for 256-bit keys is "slightly different" (fips-197)
+        else:
+            for i in range(1, kc // 2):
+                tk[i] ^= tk[i - 1]
+            tt = tk[kc // 2 - 1]
+
+            tk[kc // 2] ^= (S[tt & 0xFF] ^
+                            (S[(tt >> 8) & 0xFF] << 8) ^
+                            (S[(tt >> 16) & 0xFF] << 16) ^
+                            (S[(tt >> 24) & 0xFF] << 24))
+
+            for i in range(kc // 2 + 1, kc):
+                tk[i] ^= tk[i - 1]
+
+        # Copy values into round key arrays
+        j = 0
+        while j < kc and t < round_key_count:
+            round_keys[t // 4][t % 4] = tk[j]
+            j += 1
+            t += 1
+
+    return tuple(tuple(k) for k in round_keys)
+
+
+@functools.lru_cache(maxsize=KEY_SCHEDULE_CACHE_SIZE)
+def _invert_key_schedule(key):
+    """Returns the decryption round keys for key, cached like _expand_key."""
+
+    round_keys = _expand_key(key)
+    rounds = len(round_keys) - 1
+
+    # The decryption round keys are the encryption round keys in reverse,
+    # Inverse-Cipher-ified (fips-197 section 5.3)
+    inverted = [round_keys[rounds]]
+    for r in range(rounds - 1, 0, -1):
+        inverted.append(tuple(AES.U1[(tt >> 24) & 0xFF] ^
+                              AES.U2[(tt >> 16) & 0xFF] ^
+                              AES.U3[(tt >> 8) & 0xFF] ^
+                              AES.U4[tt & 0xFF] for tt in round_keys[r]))
+    inverted.append(round_keys[0])
+
+    return tuple(inverted)
+
+
+def clear_key_cache():
+    """Drops every cached key schedule."""
+
+    _expand_key.cache_clear()
+    _invert_key_schedule.cache_clear()
+
+
+def set_key_cache_size(size):
+    """Resizes the key schedule caches to hold size schedules per direction
+       (None for no limit, 0 to disable caching). Drops every cached schedule."""
+
+    global KEY_SCHEDULE_CACHE_SIZE, _expand_key, _invert_key_schedule
+
+    if size is not None and size < 0:
+        raise ValueError('cache size must be non-negative')
+
+    KEY_SCHEDULE_CACHE_SIZE = size
+    _expand_key = functools.lru_cache(maxsize=size)(_expand_key.__wrapped__)
+    _invert_key_schedule = functools.lru_cache(maxsize=size)(_invert_key_schedule.__wrapped__)
+
+
+# Environment variable naming the AES backend to use, overriding automatic selection
+AES_BACKEND_ENV = 'FINCRYPT_AES_BACKEND'
+
+
+class PythonBackend(object):
+    """The pure Python AES implementation in this module.
+
+       Always available. Bulk operations use the NumPy or bitsliced
+       engines where they apply, and the scalar core otherwise."""
+
+    name = 'python'
+
+    def engine(self, key):
+        """Returns a native engine for key, or None to use the Python engines."""
+
+        return None
+
+
+class OpenSSLBackend(object):
+    """AES from the system OpenSSL libcrypto, called through ctypes.
+
+       Raises OSError if libcrypto cannot be loaded. The raw block cipher
+       (ECB) and CBC encryption are run natively, and every mode in this
+       module is built on those, so output is identical to PythonBackend."""
+
+    name = 'openssl'
+
+    def __init__(self, path=None):
+        path = path or ctypes.util.find_library('crypto')
+        if path is None:
+            raise OSError('libcrypto not found')
+
+        lib = ctypes.CDLL(path)
+
+        lib.EVP_CIPHER_CTX_new.restype = ctypes.c_void_p
+        lib.EVP_CIPHER_CTX_new.argtypes = []
+        lib.EVP_CIPHER_CTX_free.restype = None
+        lib.EVP_CIPHER_CTX_free.argtypes = [ctypes.c_void_p]
+        lib.EVP_CipherInit_ex.restype = ctypes.c_int
+        lib.EVP_CipherInit_ex.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+                                          ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+        lib.EVP_CIPHER_CTX_set_padding.restype = ctypes.c_int
+        lib.EVP_CIPHER_CTX_set_padding.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.EVP_CipherUpdate.restype = ctypes.c_int
+        lib.EVP_CipherUpdate.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                         ctypes.c_char_p, ctypes.c_int]
+
+        self._lib = lib
+        self._ciphers = {}
+        for bits in (128, 192, 256):
+            for mode in ('ecb', 'cbc'):
+                function = getattr(lib, 'EVP_aes_%d_%s' % (bits, mode))
+                function.restype = ctypes.c_void_p
+                function.argtypes = []
+                self._ciphers[bits // 8, mode] = function()
+
+    def engine(self, key):
+        return _OpenSSLEngine(self, key)
+
+
+class _OpenSSLEngine(object):
+    """One key's libcrypto cipher contexts, created on first use."""
+
+    def __init__(self, backend, key):
+        self._backend = backend
+        self._lib = backend._lib
+        self._key = key
+        self._contexts = {}
+
+    def _context(self, mode, encrypting):
+        context = self._contexts.get((mode, encrypting))
+        if context is None:
+            lib = self._lib
+            context = lib.EVP_CIPHER_CTX_new()
+            if not context:
+                raise MemoryError('EVP_CIPHER_CTX_new failed')
+            weakref.finalize(self, lib.EVP_CIPHER_CTX_free, context)
+
+            cipher = self._backend._ciphers[len(self._key), mode]
+            if lib.EVP_CipherInit_ex(context, cipher, None, self._key, None, int(encrypting)) != 1:
+                raise ValueError('EVP_CipherInit_ex failed')
+            lib.EVP_CIPHER_CTX_set_padding(context, 0)
+
+            self._contexts[mode, encrypting] = context
+        return context
+
+    def _update(self, context, data, out):
+        if len(data) % 16 != 0:
+            raise ValueError('data must be a multiple of 16 bytes')
+
+        out = _output_buffer(out, len(data))
+        if not data:
+            return out
+
+        written = ctypes.c_int(0)
+        target = (ctypes.c_char * len(data)).from_buffer(out)
+        if self._lib.EVP_CipherUpdate(context, target, ctypes.byref(written), bytes(data), len(data)) != 1:
+            raise ValueError('EVP_CipherUpdate failed')
+        if written.value != len(data):
+            raise ValueError('EVP_CipherUpdate returned a short block')
+
+        return out
+
+    def encrypt_blocks(self, plaintext, out=None):
+        return self._update(self._context('ecb', True), plaintext, out)
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        return self._update(self._context('ecb', False), ciphertext, out)
+
+    def cbc_encrypt_blocks(self, iv, plaintext, out=None):
+        """CBC encrypts plaintext chained from iv; the caller keeps track of the chain."""
+
+        context = self._context('cbc', True)
+        if self._lib.EVP_CipherInit_ex(context, None, None, None, bytes(iv), 1) != 1:
+            raise ValueError('EVP_CipherInit_ex failed')
+        return self._update(context, plaintext, out)
+
+
+BACKENDS = dict(
+    python=PythonBackend,
+    openssl=OpenSSLBackend,
+)
+
+# Automatic selection tries these in order
+BACKEND_PREFERENCE = ('openssl', 'python')
+
+_backends = {}
+_default_backend = None
+
+
+def get_backend(name=None):
+    """Returns the AES backend called name.
+
+       With no name, returns the backend chosen by set_backend, or else
+       the one named by the FINCRYPT_AES_BACKEND environment variable, or
+       else the first available one in BACKEND_PREFERENCE."""
+
+    if name is None:
+        if _default_backend is not None:
+            return _default_backend
+
+        name = os.environ.get(AES_BACKEND_ENV)
+        if name is None:
+            for name in BACKEND_PREFERENCE:
+                try:
+                    return get_backend(name)
+                except OSError:
+                    pass
+
+    if name not in BACKENDS:
+        raise ValueError('Unknown AES backend: %s' % name)
+
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
 
-        rounds = len(self._Kd) - 1
-        (s1, s2, s3) = [3, 2, 1]
-        a = [0, 0, 0, 0]
 
-        # Convert ciphertext to (ints ^ key)
-        t = [(_compact_word(ciphertext[4 * i:4 * i + 4]) ^ self._Kd[0][i]) for i in range(0, 4)]
+def set_backend(name=None):
+    """Makes the backend called name the default for new AES instances.
+       None restores automatic selection. Returns the backend."""
+
+    global _default_backend
+
+    _default_backend = get_backend(name) if name is not None else None
+    return get_backend()
+
+
+def available_backends():
+    """Returns the names of the backends that can be loaded here."""
+
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except OSError:
+            continue
+        names.append(name)
+    return names
+
+
+# Buffers of at least this many bytes are handed to the NumPy engine, if available
+NUMPY_MIN_BYTES = (1 << 10)
+
+# Number of blocks the NumPy engine keeps in flight at once
+NUMPY_BATCH_BLOCKS = (1 << 14)
+
+
+def _uint32_array(values):
+    return numpy.array(values, dtype=numpy.uint32)
+
+
+class NumpyAES(object):
+    """Vectorized AES over many independent blocks at once.
+
+       The state of every block is held in four uint32 arrays (one per
+       column) and each round is applied to all of them with table
+       gathers. This is the same T-table algorithm as AES, so results are
+       identical. Requires NumPy; AES.encrypt_blocks and
+       AES.decrypt_blocks use it automatically for large buffers.
+
+       Given a list of AES instances instead of one, every call must be
+       exactly one block per instance and block i uses the i-th key."""
+
+    # Lookup tables as arrays, shared by every instance
+    _tables = None
+
+    def __init__(self, aes):
+        if numpy is None:
+            raise RuntimeError('NumPy is not available')
+
+        if NumpyAES._tables is None:
+            NumpyAES._tables = [_uint32_array(t) for t in (AES.T1, AES.T2, AES.T3, AES.T4, AES.S,
+                                                           AES.T5, AES.T6, AES.T7, AES.T8, AES.Si)]
+        t = NumpyAES._tables
+
+        self._aes = aes
+        self._lanes = len(aes) if isinstance(aes, list) else None
+        self._encryption = (t[0:4], t[4], self._round_keys('_Ke'), (1, 2, 3))
+
+        # Built on the first decryption, so encrypt-only modes never invert the key schedule
+        self._decryption = None
+
+    def _round_keys(self, name):
+        """Returns the round keys named name of every key as an array."""
+
+        if self._lanes is not None:
+            # Round keys indexed by (round, lane, word)
+            return _uint32_array([getattr(a, name) for a in self._aes]).transpose(1, 0, 2)
+        return _uint32_array(getattr(self._aes, name))
+
+    def encrypt_blocks(self, plaintext, out=None):
+        return self._crypt_blocks(self._encryption, plaintext, out)
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        if self._decryption is None:
+            t = NumpyAES._tables
+            self._decryption = (t[5:9], t[9], self._round_keys('_Kd'), (3, 2, 1))
+
+        return self._crypt_blocks(self._decryption, ciphertext, out)
+
+    def narrow(self, lanes):
+        """Returns an engine for the first lanes keys of a per-lane engine, reusing its round keys."""
+
+        tables, sbox, keys, shifts = self._encryption
+
+        engine = object.__new__(NumpyAES)
+        engine._aes = self._aes[:lanes]
+        engine._lanes = lanes
+        engine._encryption = (tables, sbox, keys[:, :lanes], shifts)
+        engine._decryption = None
+        return engine
+
+    def _crypt_blocks(self, schedule, data, out):
+        if len(data) % 16 != 0:
+            raise ValueError('data must be a multiple of 16 bytes')
+
+        if self._lanes is not None and len(data) != 16 * self._lanes:
+            raise ValueError('data must be one block per key')
+
+        out = _output_buffer(out, len(data))
+        words = numpy.frombuffer(data, dtype='>u4').reshape(-1, 4)
+        output = numpy.frombuffer(out, dtype=numpy.uint8, count=len(data)).reshape(-1, 16)
+        tables, sbox, keys, shifts = schedule
+
+        for i in range(0, len(words), NUMPY_BATCH_BLOCKS):
+            if self._lanes is not None:
+                schedule = (tables, sbox, keys[:, i:i + NUMPY_BATCH_BLOCKS], shifts)
+            result = NumpyAES._crypt_words(schedule, words[i:i + NUMPY_BATCH_BLOCKS].astype(numpy.uint32))
+            output[i:i + len(result)] = result.astype('>u4').view(numpy.uint8).reshape(-1, 16)
+
+        return out
+
+    @staticmethod
+    def _crypt_words(schedule, words):
+        (t1, t2, t3, t4), sbox, keys, (s1, s2, s3) = schedule
+
+        t = [words[:, i] ^ keys[0, ..., i] for i in range(4)]
 
         # Apply round transforms
-        for r in range(1, rounds):
-            for i in range(0, 4):
-                a[i] = (self.T5[(t[i] >> 24) & 0xFF] ^
-                        self.T6[(t[(i + s1) % 4] >> 16) & 0xFF] ^
-                        self.T7[(t[(i + s2) % 4] >> 8) & 0xFF] ^
-                        self.T8[t[(i + s3) % 4] & 0xFF] ^
-                        self._Kd[r][i])
-            t = copy.copy(a)
+        for r in range(1, len(keys) - 1):
+            t = [t1.take(t[i] >> 24) ^
+                 t2.take((t[(i + s1) % 4] >> 16) & 0xFF) ^
+                 t3.take((t[(i + s2) % 4] >> 8) & 0xFF) ^
+                 t4.take(t[(i + s3) % 4] & 0xFF) ^
+                 keys[r, ..., i]
+                 for i in range(4)]
 
         # The last round is special
-        result = []
-        for i in range(0, 4):
-            tt = self._Kd[rounds][i]
-            result.append((self.Si[(t[i] >> 24) & 0xFF] ^ (tt >> 24)) & 0xFF)
-            result.append((self.Si[(t[(i + s1) % 4] >> 16) & 0xFF] ^ (tt >> 16)) & 0xFF)
-            result.append((self.Si[(t[(i + s2) % 4] >> 8) & 0xFF] ^ (tt >> 8)) & 0xFF)
-            result.append((self.Si[t[(i + s3) % 4] & 0xFF] ^ tt) & 0xFF)
+        t = [((sbox.take(t[i] >> 24) << 24) |
+              (sbox.take((t[(i + s1) % 4] >> 16) & 0xFF) << 16) |
+              (sbox.take((t[(i + s2) % 4] >> 8) & 0xFF) << 8) |
+              sbox.take(t[(i + s3) % 4] & 0xFF)) ^
+             keys[-1, ..., i]
+             for i in range(4)]
+
+        return numpy.stack(t, axis=1)
+
+
+# Buffers of at least this many bytes use the bitsliced engine when NumPy is not available
+BITSLICE_MIN_BYTES = (1 << 12)
+
+# Number of blocks the bitsliced engine packs into each integer
+BITSLICE_BATCH_BLOCKS = (1 << 12)
+
+# Tables to translate bytes to and from ASCII binary digits, one per bit-plane
+_BIT_TO_DIGIT = [bytes(b'01'[(b >> i) & 1] for b in range(256)) for i in range(8)]
+_DIGIT_TO_BIT = [bytes((1 << i) if b == ord('1') else 0 for b in range(256)) for i in range(8)]
+
+
+def _gf_reduce(c):
+    """Reduces a 15-plane bitsliced polynomial modulo the AES polynomial x^8 + x^4 + x^3 + x + 1."""
+
+    for k in range(14, 7, -1):
+        ck = c[k]
+        c[k - 4] ^= ck
+        c[k - 5] ^= ck
+        c[k - 7] ^= ck
+        c[k - 8] ^= ck
+    return c[:8]
+
+
+def _gf_mul(a, b):
+    """Bitsliced GF(2^8) multiplication."""
+
+    c = [0] * 15
+    for i in range(8):
+        ai = a[i]
+        for j in range(8):
+            c[i + j] ^= ai & b[j]
+    return _gf_reduce(c)
+
+
+def _gf_square(a, times=1):
+    """Bitsliced GF(2^8) squaring, which is linear (and so XOR-only)."""
+
+    for _ in range(times):
+        c = [0] * 15
+        c[0::2] = a
+        a = _gf_reduce(c)
+    return a
+
+
+def _gf_inverse(x):
+    """Bitsliced GF(2^8) inversion as x^254 (zero maps to zero)."""
+
+    x2 = _gf_square(x)
+    x3 = _gf_mul(x2, x)
+    x12 = _gf_square(x3, 2)
+    x15 = _gf_mul(x12, x3)
+    x240 = _gf_square(x15, 4)
+    x252 = _gf_mul(x240, x12)
+    return _gf_mul(x252, x2)
+
+
+class BitslicedAES(object):
+    """AES over many independent blocks, bitsliced onto arbitrary-width integers.
+
+       The state is held as eight bit-planes: plane i is a single Python
+       int whose bits are bit i of every state byte of every block in the
+       batch. SubBytes runs as a Boolean circuit (GF(2^8) inversion and
+       the affine map) over the planes, and ShiftRows and MixColumns are
+       shifts and XORs, so every Python operation processes all blocks of
+       the batch at once. Results are identical to AES; AES.encrypt_blocks
+       and AES.decrypt_blocks use it for large buffers when NumPy is absent.
+
+       Given a list of AES instances instead of one, every call must be
+       exactly one block per instance and block i uses the i-th key."""
+
+    def __init__(self, aes):
+        # Plain (not inverse-cipher) round keys as 16 bytes per round
+        if isinstance(aes, list):
+            self._round_keys = [b''.join(struct.pack('>4I', *a._Ke[r]) for a in aes) for r in range(len(aes[0]._Ke))]
+            self._lanes = len(aes)
+        else:
+            self._round_keys = [struct.pack('>4I', *k) for k in aes._Ke]
+            self._lanes = None
+        self._key_planes = {}
 
+    def narrow(self, lanes):
+        """Returns an engine for the first lanes keys of a per-lane engine, reusing its round keys."""
+
+        engine = object.__new__(BitslicedAES)
+        engine._round_keys = [k[:16 * lanes] for k in self._round_keys]
+        engine._lanes = lanes
+        engine._key_planes = {}
+        return engine
+
+    def encrypt_blocks(self, plaintext, out=None):
+        return self._crypt_blocks(self._encrypt_planes, plaintext, out)
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        return self._crypt_blocks(self._decrypt_planes, ciphertext, out)
+
+    # Bits are ordered row-major by state position: bit (r * 4 + c) * n + j
+    # of a plane belongs to row r, column c of block j. A row is then a
+    # contiguous run of 4n bits, and a column within it a run of n bits.
+    _positions = [4 * c + r for r in range(4) for c in range(4)]
+
+    def _crypt_blocks(self, crypt_planes, data, out):
+        if len(data) % 16 != 0:
+            raise ValueError('data must be a multiple of 16 bytes')
+
+        if self._lanes is not None and len(data) != 16 * self._lanes:
+            raise ValueError('data must be one block per key')
+
+        out = _output_buffer(out, len(data))
+        data = bytes(data)
+
+        for start in range(0, len(data), 16 * BITSLICE_BATCH_BLOCKS):
+            batch = data[start:start + 16 * BITSLICE_BATCH_BLOCKS]
+            planes = crypt_planes(self._to_planes(batch), len(batch) // 16, start // 16)
+            out[start:start + len(batch)] = self._from_planes(planes, len(batch) // 16)
+
+        return out
+
+    @classmethod
+    def _to_planes(cls, batch):
+        """Transposes whole blocks into bit-planes by way of ASCII binary digits."""
+
+        lanes = b''.join(batch[p::16] for p in cls._positions)[::-1]
+        return [int(lanes.translate(_BIT_TO_DIGIT[i]), 2) for i in range(8)]
+
+    @classmethod
+    def _from_planes(cls, planes, n):
+        """Transposes bit-planes for n blocks back into bytes."""
+
+        lanes = 0
+        for i in range(8):
+            digits = format(planes[i], '0%db' % (16 * n)).encode('ascii')
+            lanes |= int.from_bytes(digits.translate(_DIGIT_TO_BIT[i]), 'big')
+        lanes = lanes.to_bytes(16 * n, 'little')
+
+        result = bytearray(16 * n)
+        for q, p in enumerate(cls._positions):
+            result[p::16] = lanes[q * n:(q + 1) * n]
         return result
 
+    def _keys(self, n, first):
+        """Returns the bit-planes of every round key for a batch of n blocks starting at block first."""
+
+        if self._lanes is None:
+            # Only full batches are cached; a tail can be any length, and caching
+            # every one would grow without bound over a long-lived instance
+            if n != BITSLICE_BATCH_BLOCKS:
+                return [self._to_planes(k * n) for k in self._round_keys]
+
+            if n not in self._key_planes:
+                self._key_planes[n] = [self._to_planes(k * n) for k in self._round_keys]
+            return self._key_planes[n]
+
+        # With one key per block the batches are fixed by the number of keys
+        if (n, first) not in self._key_planes:
+            self._key_planes[(n, first)] = [self._to_planes(k[16 * first:16 * (first + n)])
+                                            for k in self._round_keys]
+        return self._key_planes[(n, first)]
+
+    @staticmethod
+    def _sub_bytes(b, ones, inverse=False):
+        if inverse:
+            # Inverse affine transform, then inversion
+            return _gf_inverse([b[(i + 2) % 8] ^ b[(i + 5) % 8] ^ b[(i + 7) % 8] ^ (ones if i in (0, 2) else 0)
+                                for i in range(8)])
+
+        # Inversion, then the affine transform
+        b = _gf_inverse(b)
+        return [b[i] ^ b[(i + 4) % 8] ^ b[(i + 5) % 8] ^ b[(i + 6) % 8] ^ b[(i + 7) % 8] ^
+                (ones if i in (0, 1, 5, 6) else 0) for i in range(8)]
+
+    @staticmethod
+    def _shift_rows(b, n, inverse=False):
+        # Row r rotates left (or right) by r columns of n bits each
+        width = 4 * n
+        row = (1 << width) - 1
+        shifts = [n * ((4 - r) % 4 if inverse else r) for r in range(4)]
+
+        shifted = []
+        for plane in b:
+            result = plane & row
+            for r in range(1, 4):
+                a = (plane >> (r * width)) & row
+                s = shifts[r]
+                result |= (((a >> s) | (a << (width - s))) & row) << (r * width)
+            shifted.append(result)
+        return shifted
+
+    @staticmethod
+    def _mix_columns(b, n, ones, inverse=False):
+        width = 4 * n
+
+        def rotate(a, rows):
+            # Brings row r + rows into row r for every row at once
+            s = rows * width
+            return ((a >> s) | (a << (4 * width - s))) & ones
+
+        def xtime(a):
+            return [a[7], a[0] ^ a[7], a[1], a[2] ^ a[7], a[3] ^ a[7], a[4], a[5], a[6]]
+
+        if inverse:
+            # InvMixColumns is MixColumns after this preprocessing step
+            u = xtime(xtime([a ^ rotate(a, 2) for a in b]))
+            b = [a ^ x for a, x in zip(b, u)]
+
+        b1 = [rotate(a, 1) for a in b]
+        t = [a ^ a1 ^ rotate(a, 2) ^ rotate(a, 3) for a, a1 in zip(b, b1)]
+        x = xtime([a ^ a1 for a, a1 in zip(b, b1)])
+        return [a ^ ti ^ xi for a, ti, xi in zip(b, t, x)]
+
+    def _encrypt_planes(self, b, n, first):
+        keys = self._keys(n, first)
+        ones = (1 << (16 * n)) - 1
+
+        b = [a ^ k for a, k in zip(b, keys[0])]
+        for r in range(1, len(keys)):
+            b = self._shift_rows(self._sub_bytes(b, ones), n)
+            if r != len(keys) - 1:
+                b = self._mix_columns(b, n, ones)
+            b = [a ^ k for a, k in zip(b, keys[r])]
+
+        return b
+
+    def _decrypt_planes(self, b, n, first):
+        keys = self._keys(n, first)
+        ones = (1 << (16 * n)) - 1
+
+        b = [a ^ k for a, k in zip(b, keys[-1])]
+        for r in range(len(keys) - 2, -1, -1):
+            b = self._sub_bytes(self._shift_rows(b, n, inverse=True), ones, inverse=True)
+            b = [a ^ k for a, k in zip(b, keys[r])]
+            if r != 0:
+                b = self._mix_columns(b, n, ones, inverse=True)
+
+        return b
+
+
+_COUNTER_MASK = (1 << 128) - 1
+
 
 class Counter(object):
     """A counter object for the Counter (CTR) mode of operation.
 
+       The counter is a 128-bit integer, output big-endian. seek moves it
+       to any block offset from its initial value in constant time.
+
        To create a custom counter, you can usually just override the
        increment method."""
 
     def __init__(self, initial_value=1):
-
-        # Convert the value into an array of bytes long
-        self._counter = [((initial_value >> i) % 256) for i in range(128 - 8, -1, -8)]
+        self._initial_value = initial_value & _COUNTER_MASK
+        self._value = self._initial_value
 
     @property
     def value(self):
-        return self._counter
+        return list(self.value_bytes)
+
+    @property
+    def value_bytes(self):
+        return self._value.to_bytes(16, 'big')
 
     def increment(self):
         """Increment the counter (overflow rolls back to 0)."""
 
-        for i in range(len(self._counter) - 1, -1, -1):
-            self._counter[i] += 1
+        self._value = (self._value + 1) & _COUNTER_MASK
 
-            if self._counter[i] < 256:
-                break
+    def advance(self, blocks):
+        """Advance the counter by blocks increments."""
 
-            # Carry the one
-            self._counter[i] = 0
+        self._value = (self._value + blocks) & _COUNTER_MASK
 
-        # Overflow
-        else:
-            self._counter = [0] * len(self._counter)
+    def seek(self, block_index):
+        """Set the counter to the value for block block_index, counting from the initial value."""
+
+        self._value = (self._initial_value + block_index) & _COUNTER_MASK
+
+    def blocks(self, count):
+        """Returns the next count counter values as bytes, advancing past them."""
+
+        # A subclass with its own increment has to be stepped one value at a time
+        if type(self).increment is not Counter.increment:
+            values = bytearray()
+            for _ in range(count):
+                values += self.value_bytes
+                self.increment()
+            return bytes(values)
+
+        start = self._value
+        self.advance(count)
+        return b''.join(((start + i) & _COUNTER_MASK).to_bytes(16, 'big') for i in range(count))
 
 
 class AESBlockModeOfOperation(object):
@@ -621,10 +1330,86 @@ class AESBlockModeOfOperation(object):
     def encrypt(self, plaintext):
         raise Exception('not implemented')
 
+    def encrypt_blocks(self, plaintext, out=None):
+        """Encrypt a whole aligned buffer in one call, writing the result
+           into out (a writable buffer at least as long as plaintext).
+
+           Returns out, which is allocated if not given."""
+
+        out = _output_buffer(out, len(plaintext))
+        out[:len(plaintext)] = self.encrypt(plaintext)
+        return out
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        """Decrypt a whole aligned buffer in one call, writing the result
+           into out (a writable buffer at least as long as ciphertext).
+
+           Returns out, which is allocated if not given."""
+
+        out = _output_buffer(out, len(ciphertext))
+        out[:len(ciphertext)] = self.decrypt(ciphertext)
+        return out
+
+
+def _output_buffer(out, size):
+    if out is None:
+        return bytearray(size)
+    if len(out) < size:
+        raise ValueError('output buffer is too small')
+    return out
+
+
+def xor_bytes(a, b):
+    """XORs two equal length byte strings in a single big integer operation."""
+
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
 
 class AESStreamModeOfOperation(AESBlockModeOfOperation):
     """Super-class for AES modes of operation that are stream-ciphers."""
 
+    _remaining_keystream = b''
+    _prefetcher = None
+
+    def encrypt_blocks(self, plaintext, out=None):
+        out = _output_buffer(out, len(plaintext))
+        out[:len(plaintext)] = xor_bytes(plaintext, self._keystream(len(plaintext)))
+        return out
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        return self.encrypt_blocks(ciphertext, out)
+
+    def close(self):
+        """Stops keystream prefetching, if it was enabled. Keystream that
+           was prefetched but not used is kept, so the mode carries on from
+           the same position."""
+
+        if self._prefetcher is not None:
+            self._remaining_keystream = self._prefetcher.close()
+            self._prefetcher = None
+
+    def _start_prefetch(self):
+        self._prefetcher = KeystreamPrefetcher(self._generate_keystream)
+
+    def _keystream(self, length):
+        """Returns the next length bytes of keystream."""
+
+        if self._prefetcher is not None:
+            return self._prefetcher.read(length)
+
+        needed = length - len(self._remaining_keystream)
+        if needed > 0:
+            self._remaining_keystream += self._generate_keystream((needed + 15) // 16)
+
+        keystream = self._remaining_keystream[:length]
+        self._remaining_keystream = self._remaining_keystream[length:]
+        return keystream
+
+    def _generate_keystream(self, blocks):
+        """Returns the next blocks blocks of keystream, advancing the mode."""
+
+        raise Exception('not implemented')
+
 
 class AESSegmentModeOfOperation(AESStreamModeOfOperation):
     """Super-class for AES modes of operation that segment data."""
@@ -652,15 +1437,19 @@ class AESModeOfOperationECB(AESBlockModeOfOperation):
         if len(plaintext) != 16:
             raise ValueError('plaintext block must be 16 bytes')
 
-        plaintext = _string_to_bytes(plaintext)
-        return _bytes_to_string(self._aes.encrypt(plaintext))
+        return bytes(self.encrypt_blocks(plaintext))
 
     def decrypt(self, ciphertext):
         if len(ciphertext) != 16:
             raise ValueError('ciphertext block must be 16 bytes')
 
-        ciphertext = _string_to_bytes(ciphertext)
-        return _bytes_to_string(self._aes.decrypt(ciphertext))
+        return bytes(self.decrypt_blocks(ciphertext))
+
+    def encrypt_blocks(self, plaintext, out=None):
+        return self._aes.encrypt_blocks(plaintext, _output_buffer(out, len(plaintext)))
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        return self._aes.decrypt_blocks(ciphertext, _output_buffer(out, len(ciphertext)))
 
 
 class AESModeOfOperationCBC(AESBlockModeOfOperation):
@@ -685,11 +1474,11 @@ class AESModeOfOperationCBC(AESBlockModeOfOperation):
 
     def __init__(self, key, iv=None):
         if iv is None:
-            self._last_cipherblock = [0] * 16
+            self._last_cipherblock = bytes(16)
         elif len(iv) != 16:
             raise ValueError('initialization vector must be 16 bytes')
         else:
-            self._last_cipherblock = _string_to_bytes(iv)
+            self._last_cipherblock = bytes(_string_to_bytes(iv))
 
         AESBlockModeOfOperation.__init__(self, key)
 
@@ -697,21 +1486,55 @@ class AESModeOfOperationCBC(AESBlockModeOfOperation):
         if len(plaintext) != 16:
             raise ValueError('plaintext block must be 16 bytes')
 
-        plaintext = _string_to_bytes(plaintext)
-        precipherblock = [(p ^ l) for (p, l) in zip(plaintext, self._last_cipherblock)]
-        self._last_cipherblock = self._aes.encrypt(precipherblock)
-
-        return _bytes_to_string(self._last_cipherblock)
+        return bytes(self.encrypt_blocks(plaintext))
 
     def decrypt(self, ciphertext):
         if len(ciphertext) != 16:
             raise ValueError('ciphertext block must be 16 bytes')
 
-        cipherblock = _string_to_bytes(ciphertext)
-        plaintext = [(p ^ l) for (p, l) in zip(self._aes.decrypt(cipherblock), self._last_cipherblock)]
-        self._last_cipherblock = cipherblock
+        return bytes(self.decrypt_blocks(ciphertext))
+
+    def encrypt_blocks(self, plaintext, out=None):
+        if len(plaintext) % 16 != 0:
+            raise ValueError('plaintext must be a multiple of 16 bytes')
+
+        out = _output_buffer(out, len(plaintext))
+        if not plaintext:
+            return out
+
+        if self._aes._native is not None:
+            self._aes._native.cbc_encrypt_blocks(self._last_cipherblock, plaintext, out)
+            self._last_cipherblock = bytes(out[len(plaintext) - 16:len(plaintext)])
+            return out
+
+        words = struct.unpack('>%dI' % (len(plaintext) // 4), plaintext)
+        encrypt_words = self._aes._encrypt_words
+        c0, c1, c2, c3 = struct.unpack('>4I', self._last_cipherblock)
+
+        result = []
+        for i in range(0, len(words), 4):
+            c0, c1, c2, c3 = encrypt_words(words[i] ^ c0, words[i + 1] ^ c1, words[i + 2] ^ c2, words[i + 3] ^ c3)
+            result.extend((c0, c1, c2, c3))
+
+        struct.pack_into('>%dI' % len(result), out, 0, *result)
+        self._last_cipherblock = bytes(out[len(plaintext) - 16:len(plaintext)])
 
-        return _bytes_to_string(plaintext)
+        return out
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        if len(ciphertext) % 16 != 0:
+            raise ValueError('ciphertext must be a multiple of 16 bytes')
+
+        out = _output_buffer(out, len(ciphertext))
+        if not ciphertext:
+            return out
+
+        ciphertext = bytes(ciphertext)
+        decrypted = self._aes.decrypt_blocks(ciphertext)
+        out[:len(ciphertext)] = xor_bytes(decrypted, self._last_cipherblock + ciphertext[:-16])
+        self._last_cipherblock = ciphertext[-16:]
+
+        return out
 
 
 class AESModeOfOperationCFB(AESSegmentModeOfOperation):
@@ -731,11 +1554,11 @@ class AESModeOfOperationCFB(AESSegmentModeOfOperation):
             segment_size = 1
 
         if iv is None:
-            self._shift_register = [0] * 16
+            self._shift_register = bytes(16)
         elif len(iv) != 16:
             raise ValueError('initialization vector must be 16 bytes')
         else:
-            self._shift_register = _string_to_bytes(iv)
+            self._shift_register = bytes(_string_to_bytes(iv))
 
         self._segment_bytes = segment_size
 
@@ -747,41 +1570,42 @@ class AESModeOfOperationCFB(AESSegmentModeOfOperation):
         if len(plaintext) % self._segment_bytes != 0:
             raise ValueError('plaintext block must be a multiple of segment_size')
 
-        plaintext = _string_to_bytes(plaintext)
+        return bytes(self.encrypt_blocks(plaintext))
 
-        # Break block into segments
-        encrypted = []
-        for i in range(0, len(plaintext), self._segment_bytes):
-            plaintext_segment = plaintext[i: i + self._segment_bytes]
-            xor_segment = self._aes.encrypt(self._shift_register)[:len(plaintext_segment)]
-            cipher_segment = [(p ^ x) for (p, x) in zip(plaintext_segment, xor_segment)]
+    def decrypt(self, ciphertext):
+        if len(ciphertext) % self._segment_bytes != 0:
+            raise ValueError('ciphertext block must be a multiple of segment_size')
 
-            # Shift the top bits out and the ciphertext in
-            self._shift_register = _concat_list(self._shift_register[len(cipher_segment):], cipher_segment)
+        return bytes(self.decrypt_blocks(ciphertext))
 
-            encrypted.extend(cipher_segment)
+    def encrypt_blocks(self, plaintext, out=None):
+        return self._crypt_segments(plaintext, out, True)
 
-        return _bytes_to_string(encrypted)
+    def decrypt_blocks(self, ciphertext, out=None):
+        return self._crypt_segments(ciphertext, out, False)
 
-    def decrypt(self, ciphertext):
-        if len(ciphertext) % self._segment_bytes != 0:
-            raise ValueError('ciphertext block must be a multiple of segment_size')
+    def _crypt_segments(self, data, out, encrypting):
+        size = self._segment_bytes
+        if len(data) % size != 0:
+            raise ValueError('data must be a multiple of segment_size')
 
-        ciphertext = _string_to_bytes(ciphertext)
+        out = _output_buffer(out, len(data))
+        data = bytes(data)
+        encrypt_words = self._aes._encrypt_words
+        register = self._shift_register
 
         # Break block into segments
-        decrypted = []
-        for i in range(0, len(ciphertext), self._segment_bytes):
-            cipher_segment = ciphertext[i: i + self._segment_bytes]
-            xor_segment = self._aes.encrypt(self._shift_register)[:len(cipher_segment)]
-            plaintext_segment = [(p ^ x) for (p, x) in zip(cipher_segment, xor_segment)]
+        for i in range(0, len(data), size):
+            segment = data[i:i + size]
+            xor_segment = struct.pack('>4I', *encrypt_words(*struct.unpack('>4I', register)))[:size]
+            converted = xor_bytes(segment, xor_segment)
+            out[i:i + size] = converted
 
             # Shift the top bits out and the ciphertext in
-            self._shift_register = _concat_list(self._shift_register[len(cipher_segment):], cipher_segment)
+            register = register[size:] + (converted if encrypting else segment)
 
-            decrypted.extend(plaintext_segment)
-
-        return _bytes_to_string(decrypted)
+        self._shift_register = register
+        return out
 
 
 class AESModeOfOperationOFB(AESStreamModeOfOperation):
@@ -799,35 +1623,42 @@ class AESModeOfOperationOFB(AESStreamModeOfOperation):
 
     name = "Output Feedback (OFB)"
 
-    def __init__(self, key, iv=None):
+    def __init__(self, key, iv=None, prefetch=False):
         if iv is None:
-            self._last_precipherblock = [0] * 16
+            self._last_precipherblock = bytes(16)
         elif len(iv) != 16:
             raise ValueError('initialization vector must be 16 bytes')
         else:
-            self._last_precipherblock = _string_to_bytes(iv)
-
-        self._remaining_block = []
+            self._last_precipherblock = bytes(_string_to_bytes(iv))
 
         AESBlockModeOfOperation.__init__(self, key)
 
+        if prefetch:
+            self._start_prefetch()
+
     def encrypt(self, plaintext):
-        encrypted = []
-        for p in _string_to_bytes(plaintext):
-            if len(self._remaining_block) == 0:
-                self._remaining_block = self._aes.encrypt(self._last_precipherblock)
-                self._last_precipherblock = []
-            precipherbyte = self._remaining_block.pop(0)
-            self._last_precipherblock.append(precipherbyte)
-            cipherbyte = p ^ precipherbyte
-            encrypted.append(cipherbyte)
-
-        return _bytes_to_string(encrypted)
+        return bytes(self.encrypt_blocks(plaintext))
 
     def decrypt(self, ciphertext):
         # AES-OFB is symetric
         return self.encrypt(ciphertext)
 
+    def _generate_keystream(self, blocks):
+        if self._aes._native is not None:
+            # CBC encrypting zeros chains each block straight into the next
+            keystream = bytes(self._aes._native.cbc_encrypt_blocks(self._last_precipherblock, bytes(16 * blocks)))
+            self._last_precipherblock = keystream[-16:]
+            return keystream
+
+        encrypt_words = self._aes._encrypt_words
+        words = struct.unpack('>4I', self._last_precipherblock)
+        result = []
+        for _ in range(blocks):
+            words = encrypt_words(*words)
+            result.extend(words)
+        self._last_precipherblock = struct.pack('>4I', *words)
+        return struct.pack('>%dI' % len(result), *result)
+
 
 class AESModeOfOperationCTR(AESStreamModeOfOperation):
     """AES Counter Mode of Operation.
@@ -857,31 +1688,456 @@ class AESModeOfOperationCTR(AESStreamModeOfOperation):
 
     name = "Counter (CTR)"
 
-    def __init__(self, key, counter=None):
+    def __init__(self, key, counter=None, block_index=None, prefetch=False):
         AESBlockModeOfOperation.__init__(self, key)
 
         if counter is None:
             counter = Counter()
 
         self._counter = counter
-        self._remaining_counter = []
 
-    def encrypt(self, plaintext):
-        while len(self._remaining_counter) < len(plaintext):
-            self._remaining_counter += self._aes.encrypt(self._counter.value)
-            self._counter.increment()
+        if block_index is not None:
+            self._seek_counter(block_index)
+
+        if prefetch:
+            self._start_prefetch()
+
+    def seek(self, block_index):
+        """Position the keystream at the start of block block_index, for random access."""
 
-        plaintext = _string_to_bytes(plaintext)
+        prefetch = self._prefetcher is not None
+        self.close()
 
-        encrypted = [(p ^ c) for (p, c) in zip(plaintext, self._remaining_counter)]
-        self._remaining_counter = self._remaining_counter[len(encrypted):]
+        self._seek_counter(block_index)
+        self._remaining_keystream = b''
 
-        return _bytes_to_string(encrypted)
+        if prefetch:
+            self._start_prefetch()
+
+    def encrypt(self, plaintext):
+        return bytes(self.encrypt_blocks(plaintext))
 
     def decrypt(self, crypttext):
         # AES-CTR is symetric
         return self.encrypt(crypttext)
 
+    def _seek_counter(self, block_index):
+        if not hasattr(self._counter, 'seek'):
+            raise ValueError('counter does not support seek')
+
+        self._counter.seek(block_index)
+
+    def _generate_keystream(self, blocks):
+        counter = self._counter
+
+        # Custom counters may only provide value and increment, like pyaes counters
+        if hasattr(counter, 'blocks'):
+            values = counter.blocks(blocks)
+        else:
+            values = bytearray()
+            for _ in range(blocks):
+                values += bytes(counter.value)
+                counter.increment()
+
+        return bytes(self._aes.encrypt_blocks(values))
+
+
+# GHASH reduction constant (x^128 + x^7 + x^2 + x + 1, bit-reflected)
+_GHASH_R = 0xe1 << 120
+
+
+def _ghash_tables(h):
+    """Builds the 8-bit GHASH multiplication tables for the hash key h.
+
+       tables[i][b] is the product with h of the block whose only non-zero
+       byte is b at position i, so one multiplication is sixteen lookups."""
+
+    # powers[j] is h * x^j
+    powers = [h]
+    for _ in range(127):
+        v = powers[-1]
+        powers.append((v >> 1) ^ _GHASH_R if v & 1 else v >> 1)
+
+    tables = []
+    for i in range(16):
+        table = [0] * 256
+        for b in range(1, 256):
+            low = b & -b
+            table[b] = table[b ^ low] ^ powers[8 * i + 7 - low.bit_length() + 1]
+        tables.append(table)
+
+    return tables
+
+
+class AESModeOfOperationGCM(AESStreamModeOfOperation):
+    """AES Galois/Counter Mode of Operation.
+
+       o A stream-cipher (CTR), so input does not need to be padded
+       o Authenticated: a tag computed over the associated data and the
+         ciphertext is checked with verify() after decrypting, so
+         tampering is detected in the same pass as decryption
+       o GHASH uses precomputed 8-bit multiplication tables
+
+   Security Notes:
+       o An IV must never be reused with the same key.
+       o Decrypted data must not be trusted until verify() succeeds.
+
+    Also see:
+       o https://en.wikipedia.org/wiki/Galois/Counter_Mode
+       o See NIST SP800-38D (https://nvlpubs.nist.gov/nistpubs/Legacy/SP/nistspecialpublication800-38d.pdf)"""
+
+    name = "Galois/Counter Mode (GCM)"
+
+    def __init__(self, key, iv, associated_data=b''):
+        AESBlockModeOfOperation.__init__(self, key)
+
+        if len(iv) == 0:
+            raise ValueError('initialization vector must not be empty')
+
+        self._tables = _ghash_tables(int.from_bytes(bytes(self._aes.encrypt_blocks(bytes(16))), 'big'))
+
+        iv = bytes(iv)
+        if len(iv) == 12:
+            j0 = iv + b'\x00\x00\x00\x01'
+        else:
+            padded = iv + bytes(-len(iv) % 16) + (8 * len(iv)).to_bytes(16, 'big')
+            j0 = self._ghash(0, padded).to_bytes(16, 'big')
+
+        self._tag_mask = bytes(self._aes.encrypt_blocks(j0))
+        self._counter_prefix = j0[:12]
+        self._counter = (int.from_bytes(j0[12:], 'big') + 1) & 0xFFFFFFFF
+
+        associated_data = bytes(associated_data)
+        self._aad_length = len(associated_data)
+        self._hash = self._ghash(0, associated_data + bytes(-len(associated_data) % 16))
+
+        self._length = 0
+        self._pending = b''
+        self._tag = None
+
+    def encrypt(self, plaintext):
+        return bytes(self.encrypt_blocks(plaintext))
+
+    def decrypt(self, ciphertext):
+        return bytes(self.decrypt_blocks(ciphertext))
+
+    def encrypt_blocks(self, plaintext, out=None):
+        out = AESStreamModeOfOperation.encrypt_blocks(self, plaintext, out)
+        self._authenticate(out[:len(plaintext)])
+        return out
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        self._authenticate(ciphertext)
+        return AESStreamModeOfOperation.encrypt_blocks(self, ciphertext, out)
+
+    def digest(self):
+        """Returns the 16 byte authentication tag. No more data may be processed afterwards."""
+
+        if self._tag is None:
+            y = self._hash
+            if self._pending:
+                y = self._ghash(y, self._pending + bytes(16 - len(self._pending)))
+            lengths = ((8 * self._aad_length) << 64) | (8 * self._length)
+            y = self._ghash(y, lengths.to_bytes(16, 'big'))
+            self._tag = xor_bytes(y.to_bytes(16, 'big'), self._tag_mask)
+
+        return self._tag
+
+    def verify(self, tag):
+        """Raises ValueError unless tag authenticates everything decrypted so far."""
+
+        if not hmac.compare_digest(self.digest(), bytes(tag)):
+            raise ValueError('authentication tag does not match')
+
+    def _authenticate(self, ciphertext):
+        if self._tag is not None:
+            raise ValueError('cannot process data after the tag has been computed')
+
+        self._length += len(ciphertext)
+        data = self._pending + bytes(ciphertext)
+        whole = len(data) - (len(data) % 16)
+        self._hash = self._ghash(self._hash, data[:whole])
+        self._pending = data[whole:]
+
+    def _ghash(self, y, data):
+        """Folds whole blocks of data into the GHASH accumulator y."""
+
+        t0, t1, t2, t3, t4, t5, t6, t7, t8, t9, t10, t11, t12, t13, t14, t15 = self._tables
+
+        for i in range(0, len(data), 16):
+            b = (y ^ int.from_bytes(data[i:i + 16], 'big')).to_bytes(16, 'big')
+            y = (t0[b[0]] ^ t1[b[1]] ^ t2[b[2]] ^ t3[b[3]] ^ t4[b[4]] ^ t5[b[5]] ^ t6[b[6]] ^ t7[b[7]] ^
+                 t8[b[8]] ^ t9[b[9]] ^ t10[b[10]] ^ t11[b[11]] ^ t12[b[12]] ^ t13[b[13]] ^ t14[b[14]] ^ t15[b[15]])
+
+        return y
+
+    def _generate_keystream(self, blocks):
+        # Only the low 32 bits of the counter block are incremented (inc32)
+        start, prefix = self._counter, self._counter_prefix
+        self._counter = (start + blocks) & 0xFFFFFFFF
+        counters = b''.join(prefix + ((start + i) & 0xFFFFFFFF).to_bytes(4, 'big') for i in range(blocks))
+        return bytes(self._aes.encrypt_blocks(counters))
+
+
+# XTS reduction constant (x^128 + x^7 + x^2 + x + 1), applied to the little-endian tweak
+_XTS_R = 0x87
+_XTS_MASK = (1 << 128) - 1
+
+# Default XTS sector (data unit) size in bytes
+XTS_SECTOR_SIZE = 512
+
+
+class AESModeOfOperationXTS(object):
+    """AES XEX-based Tweaked-codebook mode with ciphertext Stealing (XTS).
+
+       o Built for disk images: data is a sequence of fixed-size sectors,
+         each encrypted independently under a tweak derived from its
+         sector number, so any range of sectors can be read or rewritten
+         on its own, in any order, or in parallel
+       o The key is two AES keys back to back (32 or 64 bytes); the first
+         encrypts the data, the second encrypts sector numbers into tweaks
+       o sector_size must be at least 16; sectors that are not a multiple
+         of 16 bytes end with ciphertext stealing (IEEE 1619 section 5.3.2)
+       o Ciphertext is exactly the size of the plaintext
+
+   Security Notes:
+       o There is no IV and no authentication; rewriting a sector with the
+         same plaintext gives the same ciphertext, and changes to the
+         ciphertext are not detected.
+       o The two key halves must be independent keys.
+
+    Also see:
+       o https://en.wikipedia.org/wiki/Disk_encryption_theory#XEX-based_tweaked-codebook_mode_with_ciphertext_stealing_(XTS)
+       o See NIST SP800-38E and IEEE 1619"""
+
+    name = "XEX Tweaked-codebook with ciphertext Stealing (XTS)"
+
+    def __init__(self, key, sector_size=XTS_SECTOR_SIZE):
+        if len(key) not in (32, 64):
+            raise ValueError('key must be 32 or 64 bytes')
+        if sector_size < 16:
+            raise ValueError('sector_size must be at least 16')
+
+        half = len(key) // 2
+        self._aes = AES(key[:half])
+        self._tweak_aes = AES(key[half:])
+        self._sector_size = sector_size
+
+    sector_size = property(lambda self: self._sector_size)
+
+    def encrypt_sector(self, sector, plaintext):
+        if len(plaintext) != self._sector_size:
+            raise ValueError('plaintext must be exactly one sector')
+
+        return bytes(self.encrypt_sectors(sector, plaintext))
+
+    def decrypt_sector(self, sector, ciphertext):
+        if len(ciphertext) != self._sector_size:
+            raise ValueError('ciphertext must be exactly one sector')
+
+        return bytes(self.decrypt_sectors(sector, ciphertext))
+
+    def encrypt_sectors(self, first_sector, plaintext, out=None):
+        """Encrypt whole sectors, the first of which is number first_sector,
+           writing the result into out (a writable buffer at least as long
+           as plaintext).
+
+           Returns out, which is allocated if not given."""
+
+        return self._crypt_sectors(first_sector, plaintext, out, self._aes.encrypt_blocks, True)
+
+    def decrypt_sectors(self, first_sector, ciphertext, out=None):
+        """Decrypt whole sectors, the first of which is number first_sector,
+           writing the result into out (a writable buffer at least as long
+           as ciphertext).
+
+           Returns out, which is allocated if not given."""
+
+        return self._crypt_sectors(first_sector, ciphertext, out, self._aes.decrypt_blocks, False)
+
+    def _crypt_sectors(self, first_sector, data, out, crypt_blocks, encrypting):
+        if len(data) % self._sector_size != 0:
+            raise ValueError('data must be a whole number of sectors')
+        if first_sector < 0:
+            raise ValueError('sector numbers must not be negative')
+
+        out = _output_buffer(out, len(data))
+        if not data:
+            return out
+
+        count = len(data) // self._sector_size
+        masks = self._masks(first_sector, count)
+
+        if self._sector_size % 16 == 0:
+            out[:len(data)] = self._crypt_masked(crypt_blocks, bytes(data), masks)
+        else:
+            out[:len(data)] = self._crypt_stolen(crypt_blocks, bytes(data), masks, count, encrypting)
+
+        return out
+
+    @staticmethod
+    def _crypt_masked(crypt_blocks, data, masks):
+        return xor_bytes(bytes(crypt_blocks(xor_bytes(data, masks))), masks)
+
+    def _crypt_stolen(self, crypt_blocks, data, masks, count, encrypting):
+        """Converts sectors ending in a partial block. The last full block is
+           converted first, and its output both pads the partial block and
+           supplies the partial block's output; encrypting and decrypting
+           differ only in which of the two final tweaks is used first."""
+
+        size = self._sector_size
+        full, tail = divmod(size, 16)
+        stride = 16 * (full + 1)
+
+        # Every full block of every sector, then the stolen block of every sector
+        first, first_masks, second_masks = [], [], []
+        for i in range(count):
+            sector_masks = masks[i * stride:(i + 1) * stride]
+            last, stolen = sector_masks[16 * (full - 1):16 * full], sector_masks[16 * full:]
+            if not encrypting:
+                last, stolen = stolen, last
+
+            first.append(data[i * size:i * size + 16 * full])
+            first_masks.append(sector_masks[:16 * (full - 1)] + last)
+            second_masks.append(stolen)
+
+        converted = self._crypt_masked(crypt_blocks, b''.join(first), b''.join(first_masks))
+
+        # The partial block, padded with the end of the last full block's output
+        second = []
+        for i in range(count):
+            end = 16 * full * (i + 1)
+            second.append(data[i * size + 16 * full:(i + 1) * size] + converted[end - 16 + tail:end])
+        stolen = self._crypt_masked(crypt_blocks, b''.join(second), b''.join(second_masks))
+
+        result = bytearray()
+        for i in range(count):
+            end = 16 * full * (i + 1)
+            result += converted[end - 16 * full:end - 16]
+            result += stolen[16 * i:16 * i + 16]
+            result += converted[end - 16:end - 16 + tail]
+        return result
+
+    def _masks(self, first_sector, count):
+        """Returns the tweak of every block in count sectors: block j of
+           sector s is masked with E2(s) * x^j in GF(2^128)."""
+
+        numbers = b''.join(((first_sector + i) & _XTS_MASK).to_bytes(16, 'little') for i in range(count))
+        tweaks = bytes(self._tweak_aes.encrypt_blocks(numbers))
+        blocks = -(-self._sector_size // 16)
+
+        masks = []
+        for i in range(0, len(tweaks), 16):
+            t = int.from_bytes(tweaks[i:i + 16], 'little')
+            for _ in range(blocks):
+                masks.append(t.to_bytes(16, 'little'))
+                t = ((t << 1) & _XTS_MASK) ^ (_XTS_R if t >> 127 else 0)
+
+        return b''.join(masks)
+
+
+# Keystream prefetchers generate this many bytes (a multiple of 16) at a time
+PREFETCH_CHUNK_SIZE = (1 << 14)
+
+# and keep at most this many chunks ready
+PREFETCH_DEPTH = 8
+
+
+class KeystreamPrefetcher(object):
+    """Computes keystream ahead of the caller on a background thread.
+
+       generate(blocks) is called repeatedly on a worker thread and the
+       chunks it returns are kept in a bounded queue, so encrypting and
+       decrypting reduce to XORs against keystream that is already
+       waiting. Cipher work overlaps with whatever the caller does
+       without holding the GIL, such as file I/O, compression, or the
+       NumPy engine's table gathers.
+
+       The worker only holds a weak reference to the mode, and exits
+       once the mode is closed or garbage collected."""
+
+    def __init__(self, generate, chunk_size=PREFETCH_CHUNK_SIZE, depth=PREFETCH_DEPTH):
+        if chunk_size <= 0 or chunk_size % 16 != 0:
+            raise ValueError('chunk_size must be a positive multiple of 16')
+
+        self._queue = queue.Queue(maxsize=depth)
+        self._stopped = threading.Event()
+        self._buffer = b''
+
+        # A chunk generated after close() that could not be queued
+        self._undelivered = []
+
+        self._thread = threading.Thread(target=self._run,
+                                        args=(weakref.WeakMethod(generate), chunk_size // 16,
+                                              self._queue, self._stopped, self._undelivered),
+                                        daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _run(generate_ref, blocks, chunks, stopped, undelivered):
+        while not stopped.is_set():
+            generate = generate_ref()
+            if generate is None:
+                return
+
+            try:
+                chunk = generate(blocks)
+            except Exception as e:
+                chunk = e
+            del generate
+
+            while True:
+                try:
+                    chunks.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    if stopped.is_set() or generate_ref() is None:
+                        undelivered.append(chunk)
+                        return
+
+            if isinstance(chunk, Exception):
+                return
+
+    def read(self, length):
+        """Returns the next length bytes of keystream, waiting for it if necessary."""
+
+        if self._stopped.is_set():
+            raise ValueError('prefetcher is closed')
+
+        parts = [self._buffer]
+        available = len(self._buffer)
+        while available < length:
+            chunk = self._queue.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            parts.append(chunk)
+            available += len(chunk)
+
+        keystream = b''.join(parts)
+        self._buffer = keystream[length:]
+        return keystream[:length]
+
+    def close(self):
+        """Stops the worker thread and returns the keystream it generated
+           that has not been read yet, so the caller can continue from the
+           same position without it."""
+
+        self._stopped.set()
+        self._thread.join()
+
+        parts = [self._buffer]
+        while not self._queue.empty():
+            parts.append(self._queue.get())
+        parts += self._undelivered
+
+        self._buffer = b''
+        del self._undelivered[:]
+
+        for part in parts:
+            if isinstance(part, Exception):
+                raise part
+        return b''.join(parts)
+
 
 # Simple lookup table for each mode
 AESModesOfOperation = dict(
@@ -890,9 +2146,204 @@ AESModesOfOperation = dict(
     cfb=AESModeOfOperationCFB,
     ecb=AESModeOfOperationECB,
     ofb=AESModeOfOperationOFB,
+    gcm=AESModeOfOperationGCM,
 )
 
 
+# Parallel engines farm independent blocks out to a pool of worker processes.
+# Work is split into chunks of this many bytes (a multiple of 16).
+PARALLEL_CHUNK_SIZE = (1 << 16)
+
+
+def _ctr_xor_chunk(key, counter_value, data):
+    """Worker for the parallel CTR engine; XORs data with the keystream
+       starting at the integer counter_value."""
+
+    blocks = (len(data) + 15) // 16
+    counters = b''.join(((counter_value + i) & _COUNTER_MASK).to_bytes(16, 'big') for i in range(blocks))
+    keystream = AES(key).encrypt_blocks(counters)
+    return xor_bytes(data, bytes(keystream[:len(data)]))
+
+
+class AESParallelModeOfOperationCTR(AESModeOfOperationCTR):
+    """AES Counter Mode of Operation, computing keystream on a process pool.
+
+       o Produces exactly the same output as AESModeOfOperationCTR
+       o Large buffers are split into counter ranges of chunk_size bytes,
+         each of which is encrypted on a worker process and reassembled
+         in order
+       o Small buffers, a single worker, a custom Counter subclass or a
+         native AES backend fall back to the serial implementation
+
+   Security Notes:
+       o The key is sent to the worker processes with every chunk."""
+
+    name = "Parallel Counter (CTR)"
+
+    def __init__(self, key, counter=None, workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+        AESModeOfOperationCTR.__init__(self, key, counter)
+
+        if chunk_size <= 0 or chunk_size % 16 != 0:
+            raise ValueError('chunk_size must be a positive multiple of 16')
+
+        self._key = bytes(key)
+        self._workers = workers or os.cpu_count() or 1
+        self._chunk_size = chunk_size
+
+    def encrypt_blocks(self, plaintext, out=None):
+        out = _output_buffer(out, len(plaintext))
+
+        # Use up any keystream left over from a previous call first
+        head = min(len(self._remaining_keystream), len(plaintext))
+        body = (len(plaintext) - head) & ~15
+
+        if (self._workers < 2 or body < 2 * self._chunk_size or type(self._counter) is not Counter or
+                self._aes._native is not None):
+            return AESModeOfOperationCTR.encrypt_blocks(self, plaintext, out)
+
+        view = memoryview(plaintext)
+        AESModeOfOperationCTR.encrypt_blocks(self, view[:head], memoryview(out)[:head])
+
+        start = int.from_bytes(self._counter.value_bytes, 'big')
+        jobs = [(self._key, start + (i // 16), bytes(view[head + i:head + min(i + self._chunk_size, body)]))
+                for i in range(0, body, self._chunk_size)]
+
+        offset = head
+        for converted in parallel_map(_ctr_xor_chunk, jobs, self._workers):
+            out[offset:offset + len(converted)] = converted
+            offset += len(converted)
+
+        self._counter.advance(body // 16)
+
+        # Whatever is left is less than a block
+        AESModeOfOperationCTR.encrypt_blocks(self, view[head + body:], memoryview(out)[head + body:len(plaintext)])
+
+        return out
+
+
+def _cbc_decrypt_chunk(key, previous, data):
+    """Worker for the parallel CBC decrypter; decrypts data whose preceding
+       ciphertext block (or IV) is previous."""
+
+    decrypted = bytes(AES(key).decrypt_blocks(data))
+    return xor_bytes(decrypted, previous + data[:-16])
+
+
+class AESParallelModeOfOperationCBC(AESModeOfOperationCBC):
+    """AES Cipher-Block Chaining Mode of Operation, decrypting on a process pool.
+
+       o Produces exactly the same output as AESModeOfOperationCBC
+       o Encryption is inherently serial and is not parallelized
+       o Decryption only needs the previous ciphertext block, so large
+         buffers are split into chunk_size segments which are decrypted
+         on worker processes and reassembled in order, unless a native
+         AES backend is in use, which is faster serially
+
+   Security Notes:
+       o The key is sent to the worker processes with every chunk."""
+
+    name = "Parallel Cipher-Block Chaining (CBC)"
+
+    def __init__(self, key, iv=None, workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+        AESModeOfOperationCBC.__init__(self, key, iv)
+
+        if chunk_size <= 0 or chunk_size % 16 != 0:
+            raise ValueError('chunk_size must be a positive multiple of 16')
+
+        self._key = bytes(key)
+        self._workers = workers or os.cpu_count() or 1
+        self._chunk_size = chunk_size
+
+    def decrypt_blocks(self, ciphertext, out=None):
+        if self._workers < 2 or len(ciphertext) < 2 * self._chunk_size or self._aes._native is not None:
+            return AESModeOfOperationCBC.decrypt_blocks(self, ciphertext, out)
+
+        if len(ciphertext) % 16 != 0:
+            raise ValueError('ciphertext must be a multiple of 16 bytes')
+
+        out = _output_buffer(out, len(ciphertext))
+        ciphertext = bytes(ciphertext)
+
+        jobs = [(self._key, self._last_cipherblock if i == 0 else ciphertext[i - 16:i],
+                 ciphertext[i:i + self._chunk_size])
+                for i in range(0, len(ciphertext), self._chunk_size)]
+
+        offset = 0
+        for converted in parallel_map(_cbc_decrypt_chunk, jobs, self._workers):
+            out[offset:offset + len(converted)] = converted
+            offset += len(converted)
+
+        self._last_cipherblock = ciphertext[-16:]
+
+        return out
+
+
+def _xts_crypt_chunk(key, sector_size, first_sector, data, encrypting):
+    """Worker for the parallel XTS engine; converts whole sectors starting at first_sector."""
+
+    mode = AESModeOfOperationXTS(key, sector_size)
+    if encrypting:
+        return bytes(mode.encrypt_sectors(first_sector, data))
+    return bytes(mode.decrypt_sectors(first_sector, data))
+
+
+class AESParallelModeOfOperationXTS(AESModeOfOperationXTS):
+    """AES XTS Mode of Operation, converting sector ranges on a process pool.
+
+       o Produces exactly the same output as AESModeOfOperationXTS
+       o Every sector is independent, so large ranges are split into
+         chunks of whole sectors (about chunk_size bytes each), which are
+         converted on worker processes and reassembled in order
+       o Small ranges, a single worker or a native AES backend fall back
+         to the serial implementation
+
+   Security Notes:
+       o The key is sent to the worker processes with every chunk."""
+
+    name = "Parallel XEX Tweaked-codebook with ciphertext Stealing (XTS)"
+
+    def __init__(self, key, sector_size=XTS_SECTOR_SIZE, workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+        AESModeOfOperationXTS.__init__(self, key, sector_size)
+
+        if chunk_size <= 0:
+            raise ValueError('chunk_size must be positive')
+
+        self._key = bytes(key)
+        self._workers = workers or os.cpu_count() or 1
+        self._chunk_size = max(1, chunk_size // sector_size) * sector_size
+
+    def encrypt_sectors(self, first_sector, plaintext, out=None):
+        return self._parallel_sectors(first_sector, plaintext, out, True)
+
+    def decrypt_sectors(self, first_sector, ciphertext, out=None):
+        return self._parallel_sectors(first_sector, ciphertext, out, False)
+
+    def _parallel_sectors(self, first_sector, data, out, encrypting):
+        if self._workers < 2 or len(data) < 2 * self._chunk_size or self._aes._native is not None:
+            if encrypting:
+                return AESModeOfOperationXTS.encrypt_sectors(self, first_sector, data, out)
+            return AESModeOfOperationXTS.decrypt_sectors(self, first_sector, data, out)
+
+        if len(data) % self._sector_size != 0:
+            raise ValueError('data must be a whole number of sectors')
+        if first_sector < 0:
+            raise ValueError('sector numbers must not be negative')
+
+        out = _output_buffer(out, len(data))
+        view = memoryview(data)
+
+        jobs = [(self._key, self._sector_size, first_sector + i // self._sector_size,
+                 bytes(view[i:i + self._chunk_size]), encrypting)
+                for i in range(0, len(data), self._chunk_size)]
+
+        offset = 0
+        for converted in parallel_map(_xts_crypt_chunk, jobs, self._workers):
+            out[offset:offset + len(converted)] = converted
+            offset += len(converted)
+
+        return out
+
+
 def to_bufferable(binary):
     if isinstance(binary, bytes):
         return binary
@@ -943,8 +2394,7 @@ PADDING_DEFAULT = 'default'
 
 # ECB and CBC are block-only ciphers
 def _block_can_consume(self, size):
-    if size >= 16: return 16
-    return 0
+    return size - (size % 16)
 
 
 # After padding, we may have more than one block
@@ -958,10 +2408,7 @@ def _block_final_encrypt(self, data, padding=PADDING_DEFAULT):
     else:
         raise Exception('invalid padding option')
 
-    if len(data) == 32:
-        return self.encrypt(data[:16]) + self.encrypt(data[16:])
-
-    return self.encrypt(data)
+    return bytes(self.encrypt_blocks(data))
 
 
 def _block_final_decrypt(self, data, padding=PADDING_DEFAULT):
@@ -1070,11 +2517,11 @@ class BlockFeeder(object):
 
         # We keep 16 bytes around so we can determine padding
         result = to_bufferable('')
-        while len(self._buffer) > 16:
+        if len(self._buffer) > 16:
             can_consume = self._mode._can_consume(len(self._buffer) - 16)
-            if can_consume == 0: break
-            result += self._feed(self._buffer[:can_consume])
-            self._buffer = self._buffer[can_consume:]
+            if can_consume:
+                result = bytes(self._feed(self._buffer[:can_consume]))
+                self._buffer = self._buffer[can_consume:]
 
         return result
 
@@ -1083,42 +2530,192 @@ class Encrypter(BlockFeeder):
     """Accepts bytes of plaintext and returns encrypted ciphertext."""
 
     def __init__(self, mode, padding=PADDING_DEFAULT):
-        BlockFeeder.__init__(self, mode, mode.encrypt, mode._final_encrypt, padding)
+        BlockFeeder.__init__(self, mode, mode.encrypt_blocks, mode._final_encrypt, padding)
 
 
 class Decrypter(BlockFeeder):
     """Accepts bytes of ciphertext and returns decrypted plaintext."""
 
     def __init__(self, mode, padding=PADDING_DEFAULT):
-        BlockFeeder.__init__(self, mode, mode.decrypt, mode._final_decrypt, padding)
+        BlockFeeder.__init__(self, mode, mode.decrypt_blocks, mode._final_decrypt, padding)
+
 
+# 64kb blocks
+BLOCK_SIZE = (1 << 16)
 
-# 8kb blocks
-BLOCK_SIZE = (1 << 13)
+# Room kept at the front of the stream buffer for bytes a feeder holds back;
+# 16 for padding plus at most one partial block or segment
+_STREAM_HOLDBACK = 32
 
 
 def _feed_stream(feeder, in_stream, out_stream, block_size=BLOCK_SIZE):
-    """Uses feeder to read and convert from in_stream and write to out_stream."""
+    """Uses feeder to read and convert from in_stream and write to out_stream.
+
+       Input is read with readinto (when in_stream has it) into one buffer
+       and converted into another, both allocated once, so memory use does
+       not depend on the length of the stream. Views of the output buffer
+       are passed to out_stream.write, which must not keep them."""
+
+    if block_size <= 0:
+        raise ValueError('block_size must be positive')
+
+    if feeder._buffer is None:
+        raise ValueError('already finished feeder')
+
+    buffer = bytearray(_STREAM_HOLDBACK + block_size)
+    output = bytearray(_STREAM_HOLDBACK + block_size)
+    view = memoryview(buffer)
+    out_view = memoryview(output)
+    readinto = getattr(in_stream, 'readinto', None)
+    can_consume = feeder._mode._can_consume
+
+    # Anything already fed to the feeder comes first
+    held = len(feeder._buffer)
+    view[:held] = feeder._buffer
 
     while True:
-        chunk = in_stream.read(block_size)
-        if not chunk:
+        if readinto is not None:
+            count = readinto(view[held:held + block_size])
+        else:
+            chunk = in_stream.read(block_size)
+            count = len(chunk)
+            view[held:held + count] = chunk
+        if not count:
             break
-        converted = feeder.feed(chunk)
-        out_stream.write(converted)
-    converted = feeder.feed()
-    out_stream.write(converted)
+
+        # As in BlockFeeder.feed, keep 16 bytes around so we can determine padding
+        available = held + count
+        consume = can_consume(available - 16) if available > 16 else 0
+        if consume:
+            feeder._feed(view[:consume], out_view)
+            out_stream.write(out_view[:consume])
+            view[:available - consume] = buffer[consume:available]
+        held = available - consume
+
+    feeder._buffer = bytes(view[:held])
+    out_stream.write(feeder.feed())
 
 
 def encrypt_stream(mode, in_stream, out_stream, block_size=BLOCK_SIZE, padding=PADDING_DEFAULT):
-    """Encrypts a stream of bytes from in_stream to out_stream using mode."""
+    """Encrypts a stream of bytes from in_stream to out_stream using mode,
+       reading block_size bytes at a time."""
 
     encrypter = Encrypter(mode, padding=padding)
     _feed_stream(encrypter, in_stream, out_stream, block_size)
 
 
 def decrypt_stream(mode, in_stream, out_stream, block_size=BLOCK_SIZE, padding=PADDING_DEFAULT):
-    """Decrypts a stream of bytes from in_stream to out_stream using mode."""
+    """Decrypts a stream of bytes from in_stream to out_stream using mode,
+       reading block_size bytes at a time."""
 
     decrypter = Decrypter(mode, padding=padding)
     _feed_stream(decrypter, in_stream, out_stream, block_size)
+
+
+class _ScalarLanes(object):
+    """Encrypts one block per AES instance with the scalar core."""
+
+    def __init__(self, lanes):
+        self._lanes = lanes
+
+    def narrow(self, lanes):
+        return _ScalarLanes(self._lanes[:lanes])
+
+    def encrypt_blocks(self, plaintext, out=None):
+        words = struct.unpack('>%dI' % (len(plaintext) // 4), plaintext)
+        result = []
+        for i, aes in enumerate(self._lanes):
+            result.extend(aes._encrypt_words(*words[4 * i:4 * i + 4]))
+        return struct.pack('>%dI' % len(result), *result)
+
+
+def _lane_engine(lanes):
+    """Returns the fastest available engine encrypting one block under each of lanes.
+       Only the encryption round keys are expanded."""
+
+    if numpy is not None:
+        return NumpyAES(lanes)
+    if 16 * len(lanes) >= BITSLICE_MIN_BYTES:
+        return BitslicedAES(lanes)
+    return _ScalarLanes(lanes)
+
+
+def _narrow_lane_engine(engine, lanes):
+    """Returns an engine for the first len(lanes) lanes of engine, without expanding any keys again."""
+
+    if isinstance(engine, BitslicedAES) and 16 * len(lanes) < BITSLICE_MIN_BYTES:
+        return _ScalarLanes(lanes)
+    return engine.narrow(len(lanes))
+
+
+def encrypt_cbc_batch(jobs, padding=PADDING_DEFAULT):
+    """Encrypts many independent messages in CBC mode at once.
+
+       jobs is an iterable of (key, iv, plaintext) tuples. CBC chains cannot
+       be parallelized within a message, so instead step i of every chain
+       is run together, one block per message, on a vectorized engine with
+       a separate key for each message.
+
+       Returns the ciphertexts in job order, each identical to
+       Encrypter(AESModeOfOperationCBC(key, iv), padding) output."""
+
+    lanes = []
+    for index, (key, iv, plaintext) in enumerate(jobs):
+        if len(iv) != 16:
+            raise ValueError('initialization vector must be 16 bytes')
+
+        plaintext = to_bufferable(bytes(plaintext))
+        if padding == PADDING_DEFAULT:
+            plaintext = append_pkcs7_padding(plaintext)
+        elif padding == PADDING_NONE:
+            if len(plaintext) % 16 != 0:
+                raise ValueError('plaintext must be a multiple of 16 bytes')
+        else:
+            raise Exception('invalid padding option')
+
+        lanes.append((len(plaintext) // 16, index, AES(key), bytes(iv), plaintext))
+
+    results = [None] * len(lanes)
+
+    # A native backend runs each chain faster than the lanes can share a step
+    native = [lane for lane in lanes if lane[2]._native is not None]
+    for _, index, aes, iv, plaintext in native:
+        results[index] = bytes(aes._native.cbc_encrypt_blocks(iv, plaintext))
+    lanes = [lane for lane in lanes if lane[2]._native is None]
+
+    # Longest chains first, so the lanes still running are always a prefix.
+    # Key sizes have different round counts, so each size is its own batch.
+    lanes.sort(key=lambda lane: lane[0], reverse=True)
+    for rounds in set(len(lane[2]._Ke) for lane in lanes):
+        _encrypt_cbc_lanes([lane for lane in lanes if len(lane[2]._Ke) == rounds], results)
+
+    return results
+
+
+def _encrypt_cbc_lanes(lanes, results):
+    active = width = len(lanes)
+    engine = _lane_engine([lane[2] for lane in lanes])
+    previous = b''.join(lane[3] for lane in lanes)
+    output = [bytearray(16 * lane[0]) for lane in lanes]
+
+    for step in range(lanes[0][0]):
+        offset = 16 * step
+
+        while lanes[active - 1][0] <= step:
+            active -= 1
+
+        # Finished lanes are fed dummy blocks until enough of them have
+        # finished to make rebuilding a narrower engine worthwhile
+        if active <= width // 2:
+            width = active
+            engine = _narrow_lane_engine(engine, [lane[2] for lane in lanes[:width]])
+            previous = previous[:16 * width]
+
+        blocks = b''.join(lane[4][offset:offset + 16] for lane in lanes[:active]) + bytes(16 * (width - active))
+        previous = bytes(engine.encrypt_blocks(xor_bytes(blocks, previous)))
+
+        for i in range(active):
+            output[i][offset:offset + 16] = previous[16 * i:16 * i + 16]
+
+    for lane, ciphertext in zip(lanes, output):
+        results[lane[1]] = bytes(ciphertext)
@@ -33,9 +33,11 @@ class FinCryptMessage(univ.Sequence):
 
 
 FinCryptMessage.componentType = namedtype.NamedTypes(
+    namedtype.DefaultedNamedType('version', univ.Integer(1)),
     namedtype.NamedType('key', IntSequence()),
     namedtype.NamedType('message', univ.OctetString()),
-    namedtype.NamedType('signature', IntSequence())
+    namedtype.NamedType('signature', IntSequence()),
+    namedtype.DefaultedNamedType('signatureHash', univ.Integer(1))
 )
 
 
@@ -50,3 +52,15 @@ FinCryptMnemonicKey.componentType = namedtype.NamedTypes(
     namedtype.NamedType('y', univ.Integer()),
     namedtype.NamedType('uuid', univ.Integer())
 )
+
+
+class FinCryptSectorImage(univ.Sequence):
+    pass
+
+
+FinCryptSectorImage.componentType = namedtype.NamedTypes(
+    namedtype.NamedType('key', IntSequence()),
+    namedtype.NamedType('check', univ.OctetString()),
+    namedtype.NamedType('sectorSize', univ.Integer()),
+    namedtype.NamedType('length', univ.Integer())
+)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import aes
+
+# Message sizes benchmarked by default, 16 bytes to 64 megabytes
+SIZES = [16 << (2 * i) for i in range(12)]
+
+KEY_SIZES = (16, 24, 32)
+
+
+def measure(func, min_time):
+    """
+    Calls func repeatedly for at least min_time seconds
+
+    :param func: Function taking no arguments
+    :param min_time: Minimum total run time in seconds
+    :return: Tuple (iterations, total seconds)
+    """
+
+    iterations = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+
+    while elapsed < min_time or iterations == 0:
+        func()
+        iterations += 1
+        elapsed = time.perf_counter() - start
+
+    return iterations, elapsed
+
+
+def make_mode(name, key):
+    """
+    Makes a fresh mode of operation with a fixed IV or counter
+
+    :param name: Key of aes.AESModesOfOperation
+    :param key: AES key (bytes)
+    :return: Mode of operation
+    """
+
+    if name == 'ecb':
+        return aes.AESModeOfOperationECB(key)
+    if name == 'ctr':
+        return aes.AESModeOfOperationCTR(key, aes.Counter(1))
+    if name == 'cfb':
+        return aes.AESModeOfOperationCFB(key, bytes(16), segment_size=16)
+    if name == 'gcm':
+        return aes.AESModeOfOperationGCM(key, bytes(12))
+    return aes.AESModesOfOperation[name](key, bytes(16))
+
+
+def bench_key_expansion(min_time):
+    results = []
+
+    for key_size in KEY_SIZES:
+        key = os.urandom(key_size)
+
+        iterations, elapsed = measure(lambda: aes._expand_key.__wrapped__(key), min_time)
+        results.append(dict(benchmark='key_expansion', key_size=key_size * 8, iterations=iterations,
+                            seconds=elapsed, per_second=iterations / elapsed))
+
+        iterations, elapsed = measure(lambda: aes._invert_key_schedule.__wrapped__(key), min_time)
+        results.append(dict(benchmark='key_inversion', key_size=key_size * 8, iterations=iterations,
+                            seconds=elapsed, per_second=iterations / elapsed))
+
+    return results
+
+
+def bench_single_block(min_time):
+    results = []
+    block = os.urandom(16)
+
+    for key_size in KEY_SIZES:
+        cipher = aes.AES(os.urandom(key_size))
+
+        for direction, func in (('encrypt', cipher.encrypt), ('decrypt', cipher.decrypt)):
+            iterations, elapsed = measure(lambda: func(block), min_time)
+            results.append(dict(benchmark='single_block', direction=direction, key_size=key_size * 8,
+                                iterations=iterations, seconds=elapsed, per_second=iterations / elapsed))
+
+    return results
+
+
+def bench_bulk(backend, modes, sizes, min_time):
+    results = []
+    key = os.urandom(32)
+    data = memoryview(os.urandom(max(sizes)))
+
+    aes.set_backend(backend)
+    try:
+        for name in modes:
+            for size in sizes:
+                message = data[:size]
+                out = bytearray(size)
+
+                for direction in ('encrypt', 'decrypt'):
+                    mode = make_mode(name, key)
+                    func = mode.encrypt_blocks if direction == 'encrypt' else mode.decrypt_blocks
+
+                    iterations, elapsed = measure(lambda: func(message, out), min_time)
+                    results.append(dict(benchmark='bulk', backend=backend, mode=name, direction=direction,
+                                        size=size, iterations=iterations, seconds=elapsed,
+                                        mb_per_second=size * iterations / elapsed / 1e6))
+
+                    print('%-8s %-4s %-8s %9d B %10.2f MB/s' % (backend, name, direction, size,
+                                                                 results[-1]['mb_per_second']), file=sys.stderr)
+    finally:
+        aes.set_backend(None)
+
+    return results
+
+
+def main():
+    """
+    Parses command line arguments and runs the benchmarks.
+    Try bench_aes.py -h for help with arguments.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Benchmark aes.py and write the results as JSON.')
+
+    parser.add_argument('--backend', action='append', choices=sorted(aes.BACKENDS),
+                        help='AES backend to benchmark. May be repeated. Defaults to every available backend.')
+    parser.add_argument('--mode', action='append', choices=sorted(aes.AESModesOfOperation),
+                        help='Mode of operation to benchmark. May be repeated. Defaults to every mode.')
+    parser.add_argument('--max-size', type=int, default=SIZES[-1],
+                        help='Largest message size in bytes. Defaults to 64 MB; the pure Python backend '
+                             'takes several minutes per mode at that size.')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Minimum seconds spent on each measurement.')
+    parser.add_argument('--output', '-o', type=argparse.FileType('w'), default=sys.stdout,
+                        help='File to write JSON results to. Defaults to stdout.')
+
+    args = parser.parse_args()
+
+    backends = args.backend or aes.available_backends()
+    modes = args.mode or sorted(aes.AESModesOfOperation)
+    sizes = [size for size in SIZES if size <= args.max_size]
+
+    results = bench_key_expansion(args.min_time)
+    results += bench_single_block(args.min_time)
+    for backend in backends:
+        results += bench_bulk(backend, modes, sizes, args.min_time)
+
+    report = dict(
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+        machine=platform.machine(),
+        numpy=aes.numpy is not None,
+        backends=backends,
+        results=results,
+    )
+
+    json.dump(report, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import sha
+
+# Message sizes benchmarked by default, 16 bytes to 64 megabytes
+SIZES = [16 << (2 * i) for i in range(12)]
+
+# The pure Python backend manages well under a megabyte a second, so it stops here by default
+PYTHON_MAX_SIZE = (1 << 16)
+
+PRESETS = ('SHA3_224', 'SHA3_256', 'SHA3_384', 'SHA3_512', 'SHAKE128', 'SHAKE256',
+           'Keccak224', 'Keccak256', 'Keccak384', 'Keccak512')
+
+# Output length for the SHAKE presets
+SHAKE_DIGEST_SIZE = 64
+
+# Number of states permuted together by the batch benchmark
+BATCH_SIZES = (1, 16, 256, 4096)
+
+
+def measure(func, min_time):
+    """
+    Calls func repeatedly for at least min_time seconds
+
+    :param func: Function taking no arguments
+    :param min_time: Minimum total run time in seconds
+    :return: Tuple (iterations, total seconds)
+    """
+
+    iterations = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+
+    while elapsed < min_time or iterations == 0:
+        func()
+        iterations += 1
+        elapsed = time.perf_counter() - start
+
+    return iterations, elapsed
+
+
+def hash_once(name, message):
+    h = getattr(sha, name)(message)
+    return h.digest(SHAKE_DIGEST_SIZE) if name.startswith('SHAKE') else h.digest()
+
+
+def bench_permutations(min_time):
+    results = []
+    lanes = [int.from_bytes(os.urandom(8), 'little') for _ in range(25)]
+
+    state = sha.KeccakState(1088, 1600)
+    state.s = list(lanes)
+
+    for name, func in (('keccak_f', lambda: sha.keccak_f(state)),
+                       ('keccak_f1600', lambda: sha.keccak_f1600(state)),
+                       ('keccak_f1600_lanes', lambda: sha.keccak_f1600_lanes(lanes))):
+        iterations, elapsed = measure(func, min_time)
+        results.append(dict(benchmark='permutation', function=name, states=1, iterations=iterations,
+                            seconds=elapsed, per_second=iterations / elapsed))
+
+    if sha.numpy is not None:
+        for count in BATCH_SIZES:
+            states = sha.numpy.array([lanes] * count, dtype=sha.numpy.uint64)
+
+            iterations, elapsed = measure(lambda: sha.keccak_f1600_batch(states), min_time)
+            results.append(dict(benchmark='permutation', function='keccak_f1600_batch', states=count,
+                                iterations=iterations, seconds=elapsed, per_second=count * iterations / elapsed))
+
+    for result in results:
+        print('%-20s %5d states %12.0f permutations/s' % (result['function'], result['states'],
+                                                          result['per_second']), file=sys.stderr)
+
+    return results
+
+
+def bench_hash(backend, presets, sizes, min_time):
+    results = []
+    data = memoryview(os.urandom(max(sizes)))
+
+    sha.set_backend(backend)
+    try:
+        for name in presets:
+            # The Keccak presets are pure Python whatever the backend, so only measure them once
+            if name.startswith('Keccak') and backend != 'python':
+                continue
+
+            for size in sizes:
+                message = data[:size]
+
+                iterations, elapsed = measure(lambda: hash_once(name, message), min_time)
+                results.append(dict(benchmark='hash', backend=backend, preset=name, size=size,
+                                    iterations=iterations, seconds=elapsed,
+                                    mb_per_second=size * iterations / elapsed / 1e6))
+
+                print('%-8s %-10s %9d B %10.2f MB/s' % (backend, name, size, results[-1]['mb_per_second']),
+                      file=sys.stderr)
+    finally:
+        sha.set_backend(None)
+
+    return results
+
+
+def bench_batch(min_time):
+    results = []
+
+    for count in BATCH_SIZES:
+        messages = [os.urandom(64) for _ in range(count)]
+
+        iterations, elapsed = measure(lambda: sha.hash_batch(messages, sha.Keccak256), min_time)
+        results.append(dict(benchmark='hash_batch', preset='Keccak256', messages=count, size=64,
+                            iterations=iterations, seconds=elapsed, per_second=count * iterations / elapsed))
+
+        print('hash_batch %5d messages %10.0f hashes/s' % (count, results[-1]['per_second']), file=sys.stderr)
+
+    return results
+
+
+def main():
+    """
+    Parses command line arguments and runs the benchmarks.
+    Try bench_sha.py -h for help with arguments.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description='Benchmark sha.py and write the results as JSON.')
+
+    parser.add_argument('--backend', action='append', choices=sha.SHA_BACKENDS,
+                        help='SHA-3 backend to benchmark. May be repeated. Defaults to every available backend.')
+    parser.add_argument('--preset', action='append', choices=PRESETS,
+                        help='Hash preset to benchmark. May be repeated. Defaults to every preset.')
+    parser.add_argument('--max-size', type=int, default=None,
+                        help='Largest message size in bytes. Defaults to 64 MB for hashlib and 64 KB for the '
+                             'pure Python backend.')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Minimum seconds spent on each measurement.')
+    parser.add_argument('--output', '-o', type=argparse.FileType('w'), default=sys.stdout,
+                        help='File to write JSON results to. Defaults to stdout.')
+
+    args = parser.parse_args()
+
+    backends = args.backend or [backend for backend in sha.SHA_BACKENDS
+                                if backend == 'python' or sha.hashlib_available()]
+    presets = args.preset or PRESETS
+
+    results = bench_permutations(args.min_time)
+    for backend in backends:
+        max_size = args.max_size or (PYTHON_MAX_SIZE if backend == 'python' else SIZES[-1])
+        sizes = [size for size in SIZES if size <= max_size]
+        results += bench_hash(backend, presets, sizes, args.min_time)
+    if sha.numpy is not None:
+        results += bench_batch(args.min_time)
+
+    report = dict(
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+        machine=platform.machine(),
+        numpy=sha.numpy is not None,
+        backends=backends,
+        results=results,
+    )
+
+    json.dump(report, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
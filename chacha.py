@@ -0,0 +1,289 @@
+"""ChaCha20, Poly1305 and the ChaCha20-Poly1305 AEAD construction (RFC 8439).
+
+ChaCha20 only needs 32-bit additions, rotations and xors, so unlike AES it
+has no table lookups. Many blocks are computed at once by packing the same
+state word of every block into one Python integer, 64 bits per block: the
+spare 32 bits of each lane absorb carries and rotated-out bits, and one
+mask clears them again, so each big integer operation runs every block.
+"""
+
+import functools
+import hmac
+import struct
+
+from aes import xor_bytes
+
+# "expand 32-byte k"
+CONSTANTS = (0x61707865, 0x3320646e, 0x79622d32, 0x6b206574)
+
+# Number of keystream blocks computed together
+CHACHA_BATCH_BLOCKS = (1 << 10)
+
+KEY_SIZE = 32
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+_P1305 = (1 << 130) - 5
+_R_CLAMP = 0x0ffffffc0ffffffc0ffffffc0fffffff
+
+
+@functools.lru_cache(maxsize=None)
+def _lanes(count):
+    """Returns (ones, ramp, mask) for count blocks packed 64 bits apart:
+       1 in every lane, i in lane i, and 0xffffffff in every lane."""
+
+    ones = ramp = 0
+    for i in reversed(range(count)):
+        ones = (ones << 64) | 1
+        ramp = (ramp << 64) | i
+    return ones, ramp, ones * 0xffffffff
+
+
+def _chacha20_core(state, mask):
+    """Runs the 20 rounds of ChaCha over the 16 state words and adds the
+       input back in. Words are either 32-bit ints (mask 0xffffffff) or
+       packed lanes of blocks (mask from _lanes)."""
+
+    x0, x1, x2, x3, x4, x5, x6, x7, x8, x9, x10, x11, x12, x13, x14, x15 = state
+
+    for _ in range(10):
+        # Column round
+        x0 = (x0 + x4) & mask
+        x12 ^= x0
+        x12 = ((x12 << 16) | (x12 >> 16)) & mask
+        x8 = (x8 + x12) & mask
+        x4 ^= x8
+        x4 = ((x4 << 12) | (x4 >> 20)) & mask
+        x0 = (x0 + x4) & mask
+        x12 ^= x0
+        x12 = ((x12 << 8) | (x12 >> 24)) & mask
+        x8 = (x8 + x12) & mask
+        x4 ^= x8
+        x4 = ((x4 << 7) | (x4 >> 25)) & mask
+        x1 = (x1 + x5) & mask
+        x13 ^= x1
+        x13 = ((x13 << 16) | (x13 >> 16)) & mask
+        x9 = (x9 + x13) & mask
+        x5 ^= x9
+        x5 = ((x5 << 12) | (x5 >> 20)) & mask
+        x1 = (x1 + x5) & mask
+        x13 ^= x1
+        x13 = ((x13 << 8) | (x13 >> 24)) & mask
+        x9 = (x9 + x13) & mask
+        x5 ^= x9
+        x5 = ((x5 << 7) | (x5 >> 25)) & mask
+        x2 = (x2 + x6) & mask
+        x14 ^= x2
+        x14 = ((x14 << 16) | (x14 >> 16)) & mask
+        x10 = (x10 + x14) & mask
+        x6 ^= x10
+        x6 = ((x6 << 12) | (x6 >> 20)) & mask
+        x2 = (x2 + x6) & mask
+        x14 ^= x2
+        x14 = ((x14 << 8) | (x14 >> 24)) & mask
+        x10 = (x10 + x14) & mask
+        x6 ^= x10
+        x6 = ((x6 << 7) | (x6 >> 25)) & mask
+        x3 = (x3 + x7) & mask
+        x15 ^= x3
+        x15 = ((x15 << 16) | (x15 >> 16)) & mask
+        x11 = (x11 + x15) & mask
+        x7 ^= x11
+        x7 = ((x7 << 12) | (x7 >> 20)) & mask
+        x3 = (x3 + x7) & mask
+        x15 ^= x3
+        x15 = ((x15 << 8) | (x15 >> 24)) & mask
+        x11 = (x11 + x15) & mask
+        x7 ^= x11
+        x7 = ((x7 << 7) | (x7 >> 25)) & mask
+
+        # Diagonal round
+        x0 = (x0 + x5) & mask
+        x15 ^= x0
+        x15 = ((x15 << 16) | (x15 >> 16)) & mask
+        x10 = (x10 + x15) & mask
+        x5 ^= x10
+        x5 = ((x5 << 12) | (x5 >> 20)) & mask
+        x0 = (x0 + x5) & mask
+        x15 ^= x0
+        x15 = ((x15 << 8) | (x15 >> 24)) & mask
+        x10 = (x10 + x15) & mask
+        x5 ^= x10
+        x5 = ((x5 << 7) | (x5 >> 25)) & mask
+        x1 = (x1 + x6) & mask
+        x12 ^= x1
+        x12 = ((x12 << 16) | (x12 >> 16)) & mask
+        x11 = (x11 + x12) & mask
+        x6 ^= x11
+        x6 = ((x6 << 12) | (x6 >> 20)) & mask
+        x1 = (x1 + x6) & mask
+        x12 ^= x1
+        x12 = ((x12 << 8) | (x12 >> 24)) & mask
+        x11 = (x11 + x12) & mask
+        x6 ^= x11
+        x6 = ((x6 << 7) | (x6 >> 25)) & mask
+        x2 = (x2 + x7) & mask
+        x13 ^= x2
+        x13 = ((x13 << 16) | (x13 >> 16)) & mask
+        x8 = (x8 + x13) & mask
+        x7 ^= x8
+        x7 = ((x7 << 12) | (x7 >> 20)) & mask
+        x2 = (x2 + x7) & mask
+        x13 ^= x2
+        x13 = ((x13 << 8) | (x13 >> 24)) & mask
+        x8 = (x8 + x13) & mask
+        x7 ^= x8
+        x7 = ((x7 << 7) | (x7 >> 25)) & mask
+        x3 = (x3 + x4) & mask
+        x14 ^= x3
+        x14 = ((x14 << 16) | (x14 >> 16)) & mask
+        x9 = (x9 + x14) & mask
+        x4 ^= x9
+        x4 = ((x4 << 12) | (x4 >> 20)) & mask
+        x3 = (x3 + x4) & mask
+        x14 ^= x3
+        x14 = ((x14 << 8) | (x14 >> 24)) & mask
+        x9 = (x9 + x14) & mask
+        x4 ^= x9
+        x4 = ((x4 << 7) | (x4 >> 25)) & mask
+
+    return [(x + s) & mask for x, s in zip((x0, x1, x2, x3, x4, x5, x6, x7, x8, x9, x10, x11, x12, x13, x14, x15),
+                                           state)]
+
+
+def chacha20_keystream(key, nonce, counter, blocks):
+    """Returns blocks * 64 bytes of ChaCha20 keystream starting at block counter."""
+
+    if len(key) != KEY_SIZE:
+        raise ValueError('key must be 32 bytes')
+    if len(nonce) != NONCE_SIZE:
+        raise ValueError('nonce must be 12 bytes')
+    if counter < 0 or counter + blocks > (1 << 32):
+        raise ValueError('block counter out of range')
+
+    key_words = struct.unpack('<8I', key)
+    nonce_words = struct.unpack('<3I', nonce)
+
+    if blocks == 1:
+        words = _chacha20_core(CONSTANTS + key_words + (counter,) + nonce_words, 0xffffffff)
+        return struct.pack('<16I', *words)
+
+    out = bytearray(64 * blocks)
+
+    for start in range(0, blocks, CHACHA_BATCH_BLOCKS):
+        count = min(CHACHA_BATCH_BLOCKS, blocks - start)
+        ones, ramp, mask = _lanes(count)
+
+        state = [w * ones for w in CONSTANTS + key_words]
+        state.append((counter + start) * ones + ramp)
+        state.extend(w * ones for w in nonce_words)
+
+        # Lane i of word j is bytes 4j to 4j + 4 of block start + i
+        base = 64 * start
+        end = base + 64 * count
+        for j, word in enumerate(_chacha20_core(state, mask)):
+            packed = word.to_bytes(8 * count, 'little')
+            for k in range(4):
+                out[base + 4 * j + k:end:64] = packed[k::8]
+
+    return bytes(out)
+
+
+def chacha20_encrypt(key, nonce, data, counter=1):
+    """Encrypts (or decrypts) data with ChaCha20, starting at block counter."""
+
+    keystream = chacha20_keystream(key, nonce, counter, (len(data) + 63) // 64)
+    return xor_bytes(bytes(data), keystream[:len(data)])
+
+
+def _poly1305_blocks(accumulator, r, data):
+    """Absorbs data into a Poly1305 accumulator, zero padding it to 16 bytes."""
+
+    if len(data) % 16:
+        data = bytes(data) + bytes(16 - len(data) % 16)
+
+    # Four blocks per reduction: a' = (a + m0) r^4 + m1 r^3 + m2 r^2 + m3 r
+    r2 = (r * r) % _P1305
+    r3 = (r2 * r) % _P1305
+    r4 = (r3 * r) % _P1305
+
+    words = struct.unpack('<%dQ' % (len(data) // 8), data)
+    top = 1 << 128
+    full = len(words) - len(words) % 8
+
+    for i in range(0, full, 8):
+        accumulator = ((accumulator + (words[i] | (words[i + 1] << 64) | top)) * r4 +
+                       (words[i + 2] | (words[i + 3] << 64) | top) * r3 +
+                       (words[i + 4] | (words[i + 5] << 64) | top) * r2 +
+                       (words[i + 6] | (words[i + 7] << 64) | top) * r) % _P1305
+
+    for i in range(full, len(words), 2):
+        accumulator = ((accumulator + (words[i] | (words[i + 1] << 64) | top)) * r) % _P1305
+
+    return accumulator
+
+
+def poly1305(key, message):
+    """Returns the 16 byte Poly1305 tag of message under the one-time key."""
+
+    if len(key) != 32:
+        raise ValueError('key must be 32 bytes')
+
+    r = int.from_bytes(key[:16], 'little') & _R_CLAMP
+    s = int.from_bytes(key[16:], 'little')
+
+    full = len(message) - len(message) % 16
+    accumulator = _poly1305_blocks(0, r, message[:full])
+
+    # A short last block gets a 1 byte after it instead of the 2^128 bit
+    if full < len(message):
+        last = int.from_bytes(bytes(message[full:]) + b'\x01', 'little')
+        accumulator = ((accumulator + last) * r) % _P1305
+
+    return ((accumulator + s) & ((1 << 128) - 1)).to_bytes(16, 'little')
+
+
+class ChaCha20Poly1305(object):
+    """ChaCha20-Poly1305 authenticated encryption with associated data.
+
+       o The nonce must never be repeated under the same key
+       o encrypt returns the ciphertext followed by the 16 byte tag
+       o decrypt checks the tag before decrypting anything, and raises
+         ValueError if it does not match
+
+    Also see:
+       o https://tools.ietf.org/html/rfc8439#section-2.8"""
+
+    name = "ChaCha20-Poly1305"
+
+    def __init__(self, key):
+        if len(key) != KEY_SIZE:
+            raise ValueError('key must be 32 bytes')
+
+        self._key = bytes(key)
+
+    def _tag(self, nonce, associated_data, ciphertext):
+        one_time_key = chacha20_keystream(self._key, nonce, 0, 1)[:32]
+        r = int.from_bytes(one_time_key[:16], 'little') & _R_CLAMP
+        s = int.from_bytes(one_time_key[16:], 'little')
+
+        accumulator = _poly1305_blocks(0, r, associated_data)
+        accumulator = _poly1305_blocks(accumulator, r, ciphertext)
+        accumulator = _poly1305_blocks(accumulator, r, struct.pack('<QQ', len(associated_data), len(ciphertext)))
+
+        return ((accumulator + s) & ((1 << 128) - 1)).to_bytes(16, 'little')
+
+    def encrypt(self, nonce, plaintext, associated_data=b''):
+        ciphertext = chacha20_encrypt(self._key, nonce, plaintext)
+        return ciphertext + self._tag(nonce, bytes(associated_data), ciphertext)
+
+    def decrypt(self, nonce, ciphertext, associated_data=b''):
+        if len(ciphertext) < TAG_SIZE:
+            raise ValueError('ciphertext is too short')
+
+        ciphertext, tag = bytes(ciphertext[:-TAG_SIZE]), bytes(ciphertext[-TAG_SIZE:])
+
+        if not hmac.compare_digest(self._tag(nonce, bytes(associated_data), ciphertext), tag):
+            raise ValueError('authentication tag does not match')
+
+        return chacha20_encrypt(self._key, nonce, ciphertext)
@@ -0,0 +1,220 @@
+import os
+import random
+import threading
+import weakref
+
+import sha
+
+# Bytes of os.urandom entropy in every seed and reseed
+SEED_SIZE = 64
+
+# Output generated per SHAKE256 call; each call also derives the next key
+BUFFER_SIZE = (1 << 12)
+
+# Generators seeded from os.urandom mix in fresh entropy after this many bytes of output
+RESEED_INTERVAL = (1 << 20)
+
+# Prefix of the key derived from an explicit seed, so it can never equal a random key
+DETERMINISTIC_PREFIX = b'FinCrypt deterministic DRBG'
+
+_generators = weakref.WeakSet()
+
+
+class ShakeRandom(random.Random):
+    """
+    A buffered deterministic random bit generator built on SHAKE256, with
+    the interface of random.Random (randint, getrandbits, choice, ...).
+
+    Each refill hashes the current key to produce both the next key and
+    BUFFER_SIZE bytes of output, and buffered output is zeroed as it is
+    handed out, so earlier output cannot be recovered from the state. Seeded from os.urandom, it reseeds every RESEED_INTERVAL bytes
+    and in the child after a fork.
+
+    Given an explicit seed it is deterministic and never reseeds. That mode
+    is only for reproducible tests and benchmarks; it must not be used for keys.
+
+    getstate and setstate raise TypeError (so generators cannot be pickled
+    or copied either): restoring a saved state would replay output that has
+    already been used. Seed a new generator to reproduce a sequence.
+    """
+
+    def __init__(self, seed=None):
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._position = 0
+        random.Random.__init__(self, seed)
+        _generators.add(self)
+
+    def seed(self, a=None, version=2):
+        """
+        Seeds the generator from os.urandom, or deterministically from a.
+
+        :param a: None, or a seed (bytes, str or int) for deterministic output
+        :return: None
+        """
+
+        with self._lock:
+            if a is None:
+                self.deterministic = False
+                self._key = os.urandom(SEED_SIZE)
+            else:
+                if isinstance(a, str):
+                    a = a.encode('utf-8')
+                elif isinstance(a, int):
+                    a = a.to_bytes((a.bit_length() + 8) // 8, 'big', signed=True)
+
+                self.deterministic = True
+                self._key = sha.SHAKE256(DETERMINISTIC_PREFIX + bytes(a)).digest(SEED_SIZE)
+
+            self._since_reseed = 0
+            self._discard()
+
+        # Cached second value of random.Random.gauss
+        self.gauss_next = None
+
+    def reseed(self):
+        """
+        Mixes fresh os.urandom entropy into the key and discards buffered output.
+        Does nothing in deterministic mode.
+
+        :return: None
+        """
+
+        with self._lock:
+            self._reseed()
+
+    def _reseed(self):
+        if self.deterministic:
+            return
+
+        self._key = sha.SHAKE256(self._key + os.urandom(SEED_SIZE)).digest(SEED_SIZE)
+        self._since_reseed = 0
+        self._discard()
+
+    def _discard(self):
+        # Wipe output that was generated but never handed out
+        self._buffer[:] = bytes(len(self._buffer))
+        self._buffer = bytearray()
+        self._position = 0
+
+    def _read(self, n):
+        """
+        Returns the next n bytes of output, refilling the buffer as needed.
+        The caller must hold the lock.
+        """
+
+        chunks = []
+
+        while n > 0:
+            if self._position == len(self._buffer):
+                if self._since_reseed >= RESEED_INTERVAL:
+                    self._reseed()
+
+                output = bytearray(sha.SHAKE256(self._key).digest(SEED_SIZE + BUFFER_SIZE))
+                self._key = bytes(output[:SEED_SIZE])
+                output[:SEED_SIZE] = bytes(SEED_SIZE)
+                self._buffer = output
+                self._position = SEED_SIZE
+                self._since_reseed += BUFFER_SIZE
+
+            position = self._position
+            count = min(n, len(self._buffer) - position)
+            chunks.append(bytes(self._buffer[position:position + count]))
+            self._buffer[position:position + count] = bytes(count)
+            self._position = position + count
+            n -= count
+
+        return b''.join(chunks)
+
+    def randbytes(self, n):
+        """
+        Returns n random bytes.
+
+        :param n: Number of bytes (int)
+        :return: Random bytes (bytes)
+        """
+
+        if n < 0:
+            raise ValueError('number of bytes must be non-negative')
+
+        with self._lock:
+            # Most draws are served straight from the buffer
+            buffer = self._buffer
+            position = self._position
+            if position + n <= len(buffer):
+                self._position = position + n
+                data = bytes(buffer[position:position + n])
+                buffer[position:position + n] = bytes(n)
+                return data
+
+            return self._read(n)
+
+    def getrandbits(self, k):
+        """
+        Returns a non-negative int with k random bits.
+
+        :param k: Number of bits (int)
+        :return: Random number (int)
+        """
+
+        if k < 0:
+            raise ValueError('number of bits must be non-negative')
+
+        size = (k + 7) // 8
+
+        # The same as randbytes, inlined as randint and randrange call this in a loop
+        with self._lock:
+            buffer = self._buffer
+            position = self._position
+            if position + size <= len(buffer):
+                self._position = position + size
+                data = buffer[position:position + size]
+                buffer[position:position + size] = bytes(size)
+            else:
+                data = self._read(size)
+
+        return int.from_bytes(data, 'little') >> (size * 8 - k)
+
+    def random(self):
+        """
+        Returns a random float in [0.0, 1.0).
+        """
+
+        return self.getrandbits(53) * (2 ** -53)
+
+    def getstate(self):
+        raise TypeError('ShakeRandom state cannot be saved, as restoring it would repeat output')
+
+    def setstate(self, state):
+        raise TypeError('ShakeRandom state cannot be restored, as that would repeat output')
+
+
+def _reseed_after_fork():
+    """
+    Gives every generator seeded from os.urandom a fresh key in a forked
+    child process, so parent and child never produce the same output.
+    """
+
+    for generator in list(_generators):
+        generator._lock = threading.Lock()
+        generator.reseed()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reseed_after_fork)
+
+# The generator every nonce, ephemeral key and padding draw comes from
+default = ShakeRandom()
+
+
+def set_seed(seed=None):
+    """
+    Reseeds the default generator. With a seed, every draw that follows is
+    reproducible, for tests and benchmarks only; with None it is seeded from
+    os.urandom again.
+
+    :param seed: None, or a seed (bytes, str or int)
+    :return: None
+    """
+
+    default.seed(seed)
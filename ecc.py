@@ -1,6 +1,5 @@
 import collections
-from random import SystemRandom
-random = SystemRandom()
+from csprng import default as random
 
 
 def egcd(a, b):
@@ -11,17 +11,56 @@ import re
 import ecc
 import reedsolomon
 import oaep
-from asn1spec import FinCryptPublicKey, FinCryptPrivateKey, FinCryptMessage
+from chacha import ChaCha20Poly1305
+from asn1spec import FinCryptPublicKey, FinCryptPrivateKey, FinCryptMessage, FinCryptSectorImage
 from pyasn1.codec.ber.decoder import decode as decode_ber
 from pyasn1.codec.native.encoder import encode as encode_native
 from pyasn1.codec.der.encoder import encode as encode_der
-from aes import Decrypter, Encrypter, AESModeOfOperationCBC
+from aes import Decrypter, Encrypter, AESModeOfOperationCBC, AESParallelModeOfOperationCBC, AESModeOfOperationGCM
+from aes import AESParallelModeOfOperationXTS
 
 
 BASE_PATH = os.path.dirname(__file__)
 PUBLIC_PATH = os.path.join(BASE_PATH, 'public_keys')
 PRIVATE_KEY = os.path.join(BASE_PATH, 'private_key', 'private.asc')
 
+# Messages at least this large (in bytes) are decrypted on a process pool
+PARALLEL_DECRYPT_THRESHOLD = (1 << 20)
+
+# Message format versions
+# 1: AES-256-CBC over OAEP padded plaintext
+# 2: AES-256-GCM, the tag is appended to the ciphertext and checked while decrypting
+# 3: ChaCha20-Poly1305, the tag is appended to the ciphertext and checked before decrypting
+MESSAGE_VERSION_CBC = 1
+MESSAGE_VERSION_GCM = 2
+MESSAGE_VERSION_CHACHA = 3
+
+MESSAGE_VERSIONS = (MESSAGE_VERSION_CBC, MESSAGE_VERSION_GCM, MESSAGE_VERSION_CHACHA)
+
+GCM_TAG_SIZE = 16
+
+# Hash functions a message signature can be computed over
+# 1: SHA3-512
+# 2: ParallelHash256 (NIST SP 800-185), hashing large messages on every core
+SIGNATURE_HASH_SHA3 = 1
+SIGNATURE_HASH_PARALLEL = 2
+
+SIGNATURE_HASHES = (SIGNATURE_HASH_SHA3, SIGNATURE_HASH_PARALLEL)
+
+# Customization string of the ParallelHash256 signature hash
+SIGNATURE_CUSTOMIZATION = b'FinCrypt signature'
+
+# The ParallelHash256 signature hash with its customization prefix already absorbed;
+# every signature hash forks from it instead of absorbing the prefix again
+_PARALLEL_SIGNATURE_HASH = sha.ParallelHash256(customization=SIGNATURE_CUSTOMIZATION)
+
+# Sector sizes for encrypted disk images; the first sector of an image holds its header
+IMAGE_SECTOR_SIZE = 4096
+MIN_IMAGE_SECTOR_SIZE = 512
+
+# Images are encrypted this many bytes at a time
+IMAGE_CHUNK_SIZE = (1 << 20)
+
 
 def _flatten(l):
     return [item for sublist in l for item in sublist]
@@ -115,13 +154,17 @@ def validate_number(kx, ky, r, s, num):
     return dsa.validate(r, s, num, ecc.ECPublicKey(ecc.AffineCurvePoint(kx, ky, ecc.CURVE)))
 
 
-def encrypt_message(kx, ky, message):
+def encrypt_message(kx, ky, message, version=MESSAGE_VERSION_CBC):
     """
     Encrypts a message using ECC and AES-256
     First generates a random AES key and IV with os.urandom()
     Then encrypts the original message with that key
     Then encrypts the AES key with the ECC key
 
+    Version 1 messages are OAEP padded and encrypted with AES-CBC.
+    Version 2 messages are encrypted with AES-GCM and carry their tag.
+    Version 3 messages are encrypted with ChaCha20-Poly1305 and carry their tag.
+
     NOTE:
     This means that plaintext will not have the same ciphertext
     when encrypted twice. Keep this in mind if you require reproducibility behavior
@@ -129,10 +172,14 @@ def encrypt_message(kx, ky, message):
     :param kx: Public key kx (int)
     :param ky: Public key ky (int)
     :param message: Message (bytes)
+    :param version: Message format version (int)
     :return: Tuple (encrypted key (list of ints), encrypted IV (list of ints),
     and encrypted message (bytes))
     """
 
+    if version not in MESSAGE_VERSIONS:
+        raise ValueError('Unknown message version.')
+
     ecies = ecc.ECEIS(ecc.CURVE)
 
     r, s = ecies.exchange(ecc.ECPublicKey(ecc.AffineCurvePoint(kx, ky, ecc.CURVE)))
@@ -141,29 +188,41 @@ def encrypt_message(kx, ky, message):
 
     key = sha.SHA3_512(s).digest()
 
-    message_encryptor = Encrypter(mode=AESModeOfOperationCBC(key[:32], iv=key[32:48]))
+    if version == MESSAGE_VERSION_GCM:
+        mode = AESModeOfOperationGCM(key[:32], iv=key[32:44])
+        encrypted_blocks = mode.encrypt(message) + mode.digest()
+    elif version == MESSAGE_VERSION_CHACHA:
+        encrypted_blocks = ChaCha20Poly1305(key[:32]).encrypt(key[32:44], message)
+    else:
+        message_encryptor = Encrypter(mode=AESModeOfOperationCBC(key[:32], iv=key[32:48]))
 
-    encrypted_blocks = message_encryptor.feed(oaep.oaep_pad(message))
+        encrypted_blocks = message_encryptor.feed(oaep.oaep_pad(message))
 
-    encrypted_blocks += message_encryptor.feed()
+        encrypted_blocks += message_encryptor.feed()
 
     encrypted_key = r.x, r.y
 
     return encrypted_key, encrypted_blocks
 
 
-def decrypt_message(k, encrypted_key, encrypted_message):
+def decrypt_message(k, encrypted_key, encrypted_message, version=MESSAGE_VERSION_CBC):
     """
     Decrypts a message encrypted by the encrypt_message function
     First decrypts the AES key and IV using ECC
     Then decrypts the data using the AES key and IV
+    Messages larger than PARALLEL_DECRYPT_THRESHOLD are decrypted in parallel
+    Raises ValueError if a version 2 or 3 message fails authentication
 
     :param k: Private key k
     :param encrypted_key: ECC encrypted key (list of of ints)
     :param encrypted_message: AES encrypted data (bytes
+    :param version: Message format version (int)
     :return: Decrypted data (bytes)
     """
 
+    if version not in MESSAGE_VERSIONS:
+        raise ValueError('Unknown message version.')
+
     ecies = ecc.ECEIS(ecc.CURVE)
 
     r = ecc.AffineCurvePoint(encrypted_key[0], encrypted_key[1], ecc.CURVE)
@@ -174,7 +233,25 @@ def decrypt_message(k, encrypted_key, encrypted_message):
 
     key = sha.SHA3_512(s).digest()
 
-    message_decryptor = Decrypter(mode=AESModeOfOperationCBC(key[:32], iv=key[32:48]))
+    if version == MESSAGE_VERSION_GCM:
+        if len(encrypted_message) < GCM_TAG_SIZE:
+            raise ValueError('Message is too short.')
+
+        mode = AESModeOfOperationGCM(key[:32], iv=key[32:44])
+        decrypted_message = mode.decrypt(encrypted_message[:-GCM_TAG_SIZE])
+        mode.verify(encrypted_message[-GCM_TAG_SIZE:])
+
+        return decrypted_message
+
+    if version == MESSAGE_VERSION_CHACHA:
+        return ChaCha20Poly1305(key[:32]).decrypt(key[32:44], encrypted_message)
+
+    if len(encrypted_message) >= PARALLEL_DECRYPT_THRESHOLD:
+        mode = AESParallelModeOfOperationCBC(key[:32], iv=key[32:48])
+    else:
+        mode = AESModeOfOperationCBC(key[:32], iv=key[32:48])
+
+    message_decryptor = Decrypter(mode=mode)
 
     decrypted_message = message_decryptor.feed(encrypted_message)
     decrypted_message += message_decryptor.feed()
@@ -182,25 +259,94 @@ def decrypt_message(k, encrypted_key, encrypted_message):
     return oaep.oaep_unpad(decrypted_message)
 
 
-def sign_message(k, message):
+def _signature_hasher(signature_hash):
+    """
+    Returns a factory for the hash function a signature is computed over
+
+    :param signature_hash: Signature hash function (int)
+    :return: Function taking optional initial input and returning a hash object
     """
-    Signs a message using an ECDSA signature private key and a message,
 
-    Computes SHA512 hash of plaintext and then performs ECDSA signature upon it
+    if signature_hash == SIGNATURE_HASH_SHA3:
+        return sha.SHA3_512
+
+    if signature_hash == SIGNATURE_HASH_PARALLEL:
+        return _PARALLEL_SIGNATURE_HASH.fork
+
+    raise ValueError('Unknown signature hash.')
+
+
+def message_digest(message, signature_hash=SIGNATURE_HASH_SHA3):
+    """
+    Hashes a message for signing
+
+    :param message: Message to hash (bytes)
+    :param signature_hash: Signature hash function (int)
+    :return: 64 byte digest (bytes)
+    """
+
+    return _signature_hasher(signature_hash)(message).digest()
+
+
+def file_digest(path, signature_hash=SIGNATURE_HASH_SHA3):
+    """
+    Hashes the file at path for signing without reading it into memory
+
+    :param path: Path of the file to hash
+    :param signature_hash: Signature hash function (int)
+    :return: 64 byte digest (bytes)
+    """
+
+    return sha.hash_file(path, _signature_hasher(signature_hash)).digest()
+
+
+def sign_digest(k, message_hash):
+    """
+    Signs a precomputed message hash using an ECDSA signature private key,
+    for messages hashed separately, e.g. with message_digest or file_digest
 
     :param k: ECC key k
-    :param message: Message to sign (bytes)
+    :param message_hash: 64 byte digest of the message to sign (bytes)
     :return: Signature (list of ints)
     """
 
-    message_hash = sha.SHA3_512(message).digest()
-
     block = get_blocks(message_hash, 1024)
 
     return sign_number(k, block[0])
 
 
-def authenticate_message(kx, ky, plaintext, signature):
+def authenticate_digest(kx, ky, message_hash, signature):
+    """
+    Authenticates a precomputed message hash when given a signature
+
+    :param kx: ECC Public key kx
+    :param ky: ECC Public key ky
+    :param message_hash: 64 byte digest of the message to verify (bytes)
+    :param signature: The signature (list of ints)
+    :return: Whether the message signature is valid (boolean)
+    """
+
+    block = get_blocks(message_hash, 1024)
+
+    return validate_number(kx, ky, signature[0], signature[1], block[0])
+
+
+def sign_message(k, message, signature_hash=SIGNATURE_HASH_SHA3):
+    """
+    Signs a message using an ECDSA signature private key and a message,
+
+    Computes SHA3-512 (or ParallelHash256) hash of plaintext and then performs ECDSA signature upon it
+
+    :param k: ECC key k
+    :param message: Message to sign (bytes)
+    :param signature_hash: Signature hash function (int)
+    :return: Signature (list of ints)
+    """
+
+    return sign_digest(k, message_digest(message, signature_hash))
+
+
+def authenticate_message(kx, ky, plaintext, signature, signature_hash=SIGNATURE_HASH_SHA3):
     """
     Authenticates a message when given a plaintext and signature
 
@@ -210,14 +356,39 @@ def authenticate_message(kx, ky, plaintext, signature):
     :param ky: ECC Public key ky
     :param plaintext: Decrypted plaintext to verify (bytes)
     :param signature: The signature (list of ints)
+    :param signature_hash: Signature hash function (int)
     :return: Whether the message signature is valid (boolean)
     """
 
-    message_hash = sha.SHA3_512(plaintext).digest()
+    return authenticate_digest(kx, ky, message_digest(plaintext, signature_hash), signature)
 
-    block = get_blocks(message_hash, 1024)
 
-    return validate_number(kx, ky, signature[0], signature[1], block[0])
+def sign_file(k, path, signature_hash=SIGNATURE_HASH_SHA3):
+    """
+    Signs the file at path without reading it into memory
+
+    :param k: ECC key k
+    :param path: Path of the file to sign
+    :param signature_hash: Signature hash function (int)
+    :return: Signature (list of ints)
+    """
+
+    return sign_digest(k, file_digest(path, signature_hash))
+
+
+def authenticate_file(kx, ky, path, signature, signature_hash=SIGNATURE_HASH_SHA3):
+    """
+    Authenticates the file at path without reading it into memory
+
+    :param kx: ECC Public key kx
+    :param ky: ECC Public key ky
+    :param path: Path of the file to verify
+    :param signature: The signature (list of ints)
+    :param signature_hash: Signature hash function (int)
+    :return: Whether the file signature is valid (boolean)
+    """
+
+    return authenticate_digest(kx, ky, file_digest(path, signature_hash), signature)
 
 
 def strip_headers(pem_text):
@@ -302,7 +473,8 @@ def read_private_key(key_text):
     return {'k': key['k'], 'name': key['name'], 'email': key['email']}
 
 
-def encrypt_and_sign(message, recipient_key, signer_key):
+def encrypt_and_sign(message, recipient_key, signer_key, version=MESSAGE_VERSION_CBC,
+                     signature_hash=SIGNATURE_HASH_SHA3):
     """
     Encrypts and signs a message using a recipient's public key name
     Looks for the recipient's public key in the public_keys/ directory.
@@ -315,6 +487,8 @@ def encrypt_and_sign(message, recipient_key, signer_key):
     :param message: Message to encrypt (bytes)
     :param recipient_key: Recipient's public key (file like object)
     :param signer_key: Signer's private key (file like object)
+    :param version: Message format version (int)
+    :param signature_hash: Signature hash function (int)
     :return: Bytes of encrypted and encoded message and signature.
     """
 
@@ -330,17 +504,19 @@ def encrypt_and_sign(message, recipient_key, signer_key):
 
     try:
         encrypted_key, encrypted_blocks = encrypt_message(recipient_key['kx'], recipient_key['ky'],
-                                                          message)
+                                                          message, version)
     except Exception:
         raise FinCryptDecodingError('Unknown error encountered when encrypting message.')
 
-    signature = sign_message(signer_key['k'], message)
+    signature = sign_message(signer_key['k'], message, signature_hash)
 
     encrypted_message = FinCryptMessage()
 
+    encrypted_message['version'] = version
     encrypted_message['message'] = encrypted_blocks
     encrypted_message['key'].extend(encrypted_key)
     encrypted_message['signature'].extend(signature)
+    encrypted_message['signatureHash'] = signature_hash
 
     encoded_message = encode_der(encrypted_message)
 
@@ -388,19 +564,246 @@ def decrypt_and_verify(message, sender_key, private_key):
         return None, False
 
     try:
-        decrypted_message = decrypt_message(decryption_key['k'], decoded['key'], decoded['message'])
+        decrypted_message = decrypt_message(decryption_key['k'], decoded['key'], decoded['message'],
+                                            decoded['version'])
     except Exception:
         decrypted_message = None
 
     try:
         authenticated = authenticate_message(sender_key['kx'], sender_key['ky'], decrypted_message,
-                                             decoded['signature'])
+                                             decoded['signature'], decoded['signatureHash'])
     except Exception:
         authenticated = False
 
     return decrypted_message, authenticated
 
 
+def _image_key(s):
+    """
+    Derives the AES-256-XTS key of a sector image and a value to check it against
+
+    :param s: ECIES shared secret
+    :return: Tuple (XTS key (bytes), key check value (bytes))
+    """
+
+    key = sha.SHA3_512(str(s).encode('utf-8')).digest()
+
+    return key, sha.SHA3_256(key).digest()[:16]
+
+
+def _readinto_full(stream, view):
+    """
+    Reads from stream into view until view is full or the stream ends
+
+    :return: Number of bytes read (int)
+    """
+
+    count = 0
+
+    while count < len(view):
+        read = stream.readinto(view[count:])
+        if not read:
+            break
+        count += read
+
+    return count
+
+
+def _write_image_header(image, header, sector_size):
+    encoded = encode_der(header)
+
+    if len(encoded) > sector_size:
+        raise ValueError('Sector size is too small for the image header.')
+
+    image.seek(0)
+    image.write(encoded + bytes(sector_size - len(encoded)))
+
+
+def open_image(k, image):
+    """
+    Reads the header of an encrypted sector image and recovers its key
+
+    :param k: Private key k
+    :param image: Encrypted image (seekable binary file like object)
+    :return: Tuple (XTS mode of operation, header as a dict)
+    """
+
+    image.seek(0)
+    header, _ = decode_ber(image.read(MIN_IMAGE_SECTOR_SIZE), asn1Spec=FinCryptSectorImage())
+    header = encode_native(header)
+
+    ecies = ecc.ECEIS(ecc.CURVE)
+
+    r = ecc.AffineCurvePoint(header['key'][0], header['key'][1], ecc.CURVE)
+
+    s = ecies.recover(r, ecc.ECPrivateKey(k, ecc.CURVE))
+
+    key, check = _image_key(s)
+
+    if check != header['check']:
+        raise ValueError('Image was not encrypted for this key.')
+
+    return AESParallelModeOfOperationXTS(key, header['sectorSize']), header
+
+
+def encrypt_image(kx, ky, infile, image, sector_size=IMAGE_SECTOR_SIZE):
+    """
+    Encrypts a disk image (or any file) sector by sector using ECC and AES-256-XTS
+    The first sector of the output holds the header, the rest hold the encrypted sectors in order
+    The last sector is padded with zeros; the header records the real length
+
+    Every sector is encrypted independently, so read_image and write_image can later read or
+    rewrite any part of the image without touching the rest. Images are not signed.
+
+    :param kx: Public key kx (int)
+    :param ky: Public key ky (int)
+    :param infile: File to encrypt (binary file like object)
+    :param image: Output file (seekable binary file like object)
+    :param sector_size: Sector size in bytes, a multiple of 16 and at least MIN_IMAGE_SECTOR_SIZE
+    :return: Length of the plaintext in bytes (int)
+    """
+
+    if sector_size < MIN_IMAGE_SECTOR_SIZE or sector_size % 16 != 0:
+        raise ValueError('Invalid sector size.')
+
+    ecies = ecc.ECEIS(ecc.CURVE)
+
+    r, s = ecies.exchange(ecc.ECPublicKey(ecc.AffineCurvePoint(kx, ky, ecc.CURVE)))
+
+    key, check = _image_key(s)
+
+    mode = AESParallelModeOfOperationXTS(key, sector_size)
+
+    header = FinCryptSectorImage()
+
+    header['key'].extend((r.x, r.y))
+    header['check'] = check
+    header['sectorSize'] = sector_size
+    header['length'] = 0
+
+    # The length is filled in once the whole input has been read
+    _write_image_header(image, header, sector_size)
+
+    chunk_size = max(1, IMAGE_CHUNK_SIZE // sector_size) * sector_size
+    buffer = bytearray(chunk_size)
+    output = bytearray(chunk_size)
+    view = memoryview(buffer)
+
+    length = 0
+
+    while True:
+        count = _readinto_full(infile, view)
+        if not count:
+            break
+
+        # Only a short read at the end of the input leaves a partial sector
+        padded = count + (-count % sector_size)
+        view[count:padded] = bytes(padded - count)
+
+        mode.encrypt_sectors(length // sector_size, view[:padded], output)
+        image.write(memoryview(output)[:padded])
+        length += count
+
+        if count < chunk_size:
+            break
+
+    header['length'] = length
+    _write_image_header(image, header, sector_size)
+
+    return length
+
+
+def decrypt_image(k, image, outfile):
+    """
+    Decrypts a whole encrypted sector image, IMAGE_CHUNK_SIZE bytes at a time
+
+    :param k: Private key k
+    :param image: Encrypted image (seekable binary file like object)
+    :param outfile: Output file (binary file like object)
+    :return: Length of the plaintext in bytes (int)
+    """
+
+    mode, header = open_image(k, image)
+
+    sector_size = header['sectorSize']
+    chunk_size = max(1, IMAGE_CHUNK_SIZE // sector_size) * sector_size
+    output = bytearray(chunk_size)
+
+    image.seek(sector_size)
+
+    for offset in range(0, header['length'], chunk_size):
+        ciphertext = image.read(chunk_size)
+        if len(ciphertext) % sector_size or len(ciphertext) < min(chunk_size, header['length'] - offset):
+            raise ValueError('Image is truncated.')
+
+        mode.decrypt_sectors(offset // sector_size, ciphertext, output)
+        outfile.write(memoryview(output)[:min(len(ciphertext), header['length'] - offset)])
+
+    return header['length']
+
+
+def read_image(k, image, offset=0, size=None):
+    """
+    Decrypts part of an encrypted sector image, only reading the sectors it covers
+
+    :param k: Private key k
+    :param image: Encrypted image (seekable binary file like object)
+    :param offset: Offset in the plaintext to start at (int)
+    :param size: Number of bytes to read, defaults to the rest of the image (int)
+    :return: Decrypted bytes
+    """
+
+    mode, header = open_image(k, image)
+
+    sector_size = header['sectorSize']
+    end = header['length'] if size is None else min(offset + size, header['length'])
+
+    if offset < 0 or offset >= end:
+        return b''
+
+    first = offset // sector_size
+    last = (end + sector_size - 1) // sector_size
+
+    image.seek((first + 1) * sector_size)
+    plaintext = mode.decrypt_sectors(first, image.read((last - first) * sector_size))
+
+    return bytes(plaintext[offset - first * sector_size:end - first * sector_size])
+
+
+def write_image(k, image, offset, data):
+    """
+    Overwrites part of an encrypted sector image in place
+    Only the sectors data falls in are re-encrypted; partially covered sectors are decrypted and merged first
+
+    :param k: Private key k
+    :param image: Encrypted image (seekable binary file like object, opened for reading and writing)
+    :param offset: Offset in the plaintext to write at (int)
+    :param data: Bytes to write, which must lie within the image
+    :return: None
+    """
+
+    mode, header = open_image(k, image)
+
+    sector_size = header['sectorSize']
+    end = offset + len(data)
+
+    if offset < 0 or end > header['length']:
+        raise ValueError('Write is outside of the image.')
+
+    if not data:
+        return
+
+    first = offset // sector_size
+    last = (end + sector_size - 1) // sector_size
+
+    image.seek((first + 1) * sector_size)
+    plaintext = mode.decrypt_sectors(first, image.read((last - first) * sector_size))
+    plaintext[offset - first * sector_size:end - first * sector_size] = data
+
+    image.seek((first + 1) * sector_size)
+    image.write(mode.encrypt_sectors(first, plaintext))
+
+
 def encrypt_text(arguments):
     """
     Encrypts a file object when given a argparser arguments object. Not intended for use as an import.
@@ -419,7 +822,8 @@ def encrypt_text(arguments):
         raise FileNotFoundError('Private keyfile does not exist.')
 
     with open(recipient_keyfile) as recipient_key, open(PRIVATE_KEY) as private_key:
-        message = encrypt_and_sign(zlib.compress(arguments.infile.read(), level=9), recipient_key, private_key)
+        message = encrypt_and_sign(zlib.compress(arguments.infile.read(), level=9), recipient_key, private_key,
+                                   arguments.message_version, arguments.signature_hash)
 
     message = base64.urlsafe_b64encode(message).decode('utf-8')
 
@@ -493,7 +897,8 @@ def encrypt_binary(arguments):
         raise FileNotFoundError('Private keyfile does not exist.')
 
     with open(recipient_keyfile) as recipient_key, open(PRIVATE_KEY) as private_key:
-        message = encrypt_and_sign(zlib.compress(arguments.infile.read(), level=9), recipient_key, private_key)
+        message = encrypt_and_sign(zlib.compress(arguments.infile.read(), level=9), recipient_key, private_key,
+                                   arguments.message_version, arguments.signature_hash)
 
     sys.stdout.buffer.write(message)
 
@@ -537,6 +942,77 @@ def decrypt_binary(arguments):
         sys.stderr.write('Verification failed. Message is not intact.\n')
 
 
+def encrypt_disk_image(arguments):
+    """
+    Encrypts a disk image sector by sector when given a argparser arguments object. Not intended for use as an import.
+    Writes the encrypted image to the output file, which must be seekable.
+
+    :param arguments: Argparser arguments object.
+    :return: None
+    """
+    recipient_keyfile = os.path.join(PUBLIC_PATH, arguments.recipient)
+
+    if not os.path.exists(recipient_keyfile):
+        raise FileNotFoundError('Recipient keyfile does not exist.')
+
+    with open(recipient_keyfile) as recipient_key:
+        try:
+            recipient_key = read_public_key(recipient_key.read())
+        except Exception:
+            raise FinCryptDecodingError('Recipient keyfile was malformed.')
+
+    encrypt_image(recipient_key['kx'], recipient_key['ky'], arguments.infile, arguments.outfile,
+                  arguments.sector_size)
+
+
+def decrypt_disk_image(arguments):
+    """
+    Decrypts an encrypted disk image when given a argparser arguments object. Not intended for use as an import.
+    Writes the decrypted image to stdout.
+
+    :param arguments: Argparser arguments object.
+    :return: None
+    """
+
+    if not os.path.exists(PRIVATE_KEY):
+        raise FileNotFoundError('Private keyfile does not exist.')
+
+    with open(PRIVATE_KEY) as private_key:
+        try:
+            private_key = read_private_key(private_key.read())
+        except Exception:
+            raise FinCryptDecodingError('Private key file is malformed.')
+
+    try:
+        decrypt_image(private_key['k'], arguments.image, sys.stdout.buffer)
+    except Exception as e:
+        sys.stderr.write(str(e) + '\n')
+
+
+def patch_disk_image(arguments):
+    """
+    Overwrites part of an encrypted disk image in place when given a argparser arguments object.
+    Not intended for use as an import. Only the sectors that change are re-encrypted.
+
+    :param arguments: Argparser arguments object.
+    :return: None
+    """
+
+    if not os.path.exists(PRIVATE_KEY):
+        raise FileNotFoundError('Private keyfile does not exist.')
+
+    with open(PRIVATE_KEY) as private_key:
+        try:
+            private_key = read_private_key(private_key.read())
+        except Exception:
+            raise FinCryptDecodingError('Private key file is malformed.')
+
+    try:
+        write_image(private_key['k'], arguments.image, arguments.offset, arguments.infile.read())
+    except Exception as e:
+        sys.stderr.write(str(e) + '\n')
+
+
 def enum_keys(arguments):
     """
     Enumerates all keys residing in the public_keys directory.
@@ -552,13 +1028,21 @@ def enum_keys(arguments):
     """
 
     key_enum = ''
-    for key_file in os.listdir(PUBLIC_PATH):
+
+    key_files = os.listdir(PUBLIC_PATH)
+    key_texts = []
+
+    for key_file in key_files:
         with open(os.path.join(PUBLIC_PATH, key_file)) as f:
-            key_text = f.read()
+            key_texts.append(f.read())
+
+    # Fingerprint the whole keyring in one batch
+    key_hashes = sha.hash_batch([key_text.encode('utf-8') for key_text in key_texts])
 
+    for key_file, key_text, key_hash in zip(key_files, key_texts, key_hashes):
         key = read_public_key(key_text)
 
-        key_hash = sha.SHA3_512(key_text.encode('utf-8')).hexdigest()
+        key_hash = key_hash.hex()
 
         key_hash_formatted = ':'.join([key_hash[:64][i:i + 2] for i in range(0, len(key_hash[:64]), 2)]).upper()
 
@@ -595,6 +1079,12 @@ def main():
                                      'Always defaults to the /public_keys directory.')
     parser_encrypt.add_argument('infile', nargs='?', type=argparse.FileType('rb'), default=sys.stdin.buffer,
                                 help='File to encrypt. Defaults to stdin.')
+    parser_encrypt.add_argument('--message-version', type=int, choices=MESSAGE_VERSIONS, default=MESSAGE_VERSION_CBC,
+                                help='Message format version. 1 is AES-CBC, 2 is authenticated AES-GCM, '
+                                     '3 is ChaCha20-Poly1305.')
+    parser_encrypt.add_argument('--signature-hash', type=int, choices=SIGNATURE_HASHES, default=SIGNATURE_HASH_SHA3,
+                                help='Hash the signature is computed over. 1 is SHA3-512, 2 is ParallelHash256, '
+                                     'which hashes large messages on every core.')
     parser_encrypt.set_defaults(func=encrypt_text)
 
     parser_decrypt = subparsers.add_parser('decrypt', aliases=['d'], help='Decrypt a message.')
@@ -613,6 +1103,14 @@ def main():
                                             'Always defaults to the /public_keys directory.')
     parser_encrypt_binary.add_argument('infile', nargs='?', type=argparse.FileType('rb'), default=sys.stdin.buffer,
                                        help='File to encrypt. Defaults to stdin.')
+    parser_encrypt_binary.add_argument('--message-version', type=int, choices=MESSAGE_VERSIONS,
+                                       default=MESSAGE_VERSION_CBC,
+                                       help='Message format version. 1 is AES-CBC, 2 is authenticated AES-GCM, '
+                                            '3 is ChaCha20-Poly1305.')
+    parser_encrypt_binary.add_argument('--signature-hash', type=int, choices=SIGNATURE_HASHES,
+                                       default=SIGNATURE_HASH_SHA3,
+                                       help='Hash the signature is computed over. 1 is SHA3-512, '
+                                            '2 is ParallelHash256, which hashes large messages on every core.')
     parser_encrypt_binary.set_defaults(func=encrypt_binary)
 
     parser_decrypt_binary = subparsers.add_parser('decryptbin', aliases=['db'],
@@ -624,6 +1122,30 @@ def main():
                                        help='The filename or path of the encrypted file. Defaults to stdin.')
     parser_decrypt_binary.set_defaults(func=decrypt_binary)
 
+    parser_encrypt_image = subparsers.add_parser('encryptimage', aliases=['ei'],
+                                                 help='Encrypt a disk image sector by sector, so parts of it can '
+                                                      'later be changed without re-encrypting the rest.')
+    parser_encrypt_image.add_argument('recipient', type=str, default=None,
+                                      help='The filename of the recipient\'s public key. '
+                                           'Always defaults to the /public_keys directory.')
+    parser_encrypt_image.add_argument('infile', type=argparse.FileType('rb'), help='Image to encrypt.')
+    parser_encrypt_image.add_argument('outfile', type=argparse.FileType('wb'), help='Encrypted image to write.')
+    parser_encrypt_image.add_argument('--sector-size', type=int, default=IMAGE_SECTOR_SIZE,
+                                      help='Sector size in bytes. Defaults to %s.' % IMAGE_SECTOR_SIZE)
+    parser_encrypt_image.set_defaults(func=encrypt_disk_image)
+
+    parser_decrypt_image = subparsers.add_parser('decryptimage', aliases=['di'], help='Decrypt a disk image.')
+    parser_decrypt_image.add_argument('image', type=argparse.FileType('rb'), help='Encrypted image to decrypt.')
+    parser_decrypt_image.set_defaults(func=decrypt_disk_image)
+
+    parser_patch_image = subparsers.add_parser('patchimage', aliases=['pi'],
+                                               help='Overwrite part of an encrypted disk image in place.')
+    parser_patch_image.add_argument('image', type=argparse.FileType('r+b'), help='Encrypted image to change.')
+    parser_patch_image.add_argument('offset', type=int, help='Byte offset in the decrypted image to write at.')
+    parser_patch_image.add_argument('infile', nargs='?', type=argparse.FileType('rb'), default=sys.stdin.buffer,
+                                    help='Bytes to write. Defaults to stdin.')
+    parser_patch_image.set_defaults(func=patch_disk_image)
+
     args = parser.parse_args()
 
     if args.func is None:
@@ -1,6 +1,8 @@
-from sha import SHAKE256
-from random import SystemRandom
-random = SystemRandom()
+from sha import SHAKE256, xof_reader
+from csprng import default as random
+
+# Mask bytes applied at a time; with the pure Python SHA-3 backend, also squeezed at a time
+MASK_CHUNK_SIZE = (1 << 16)
 
 
 def pkcs7_pad(data, padding):
@@ -17,25 +19,41 @@ def pkcs7_unpad(data, padding):
     return data[:-pad]
 
 
+def mask(seed: bytes, data: bytes):
+    """
+    XORs data with the SHAKE256 output for seed, a chunk at a time
+
+    With the pure Python backend the mask is squeezed a chunk at a time too,
+    so it never holds more than MASK_CHUNK_SIZE bytes of it. hashlib SHAKE
+    objects cannot squeeze incrementally, so with the hashlib backend the
+    whole mask is produced in one call, as long as data, before it is applied.
+    """
+    reader = xof_reader(SHAKE256(seed), len(data))
+    out = bytearray(len(data))
+
+    for i in range(0, len(data), MASK_CHUNK_SIZE):
+        chunk = data[i:i + MASK_CHUNK_SIZE]
+        masked = int.from_bytes(chunk, 'little') ^ int.from_bytes(reader.read(len(chunk)), 'little')
+        out[i:i + len(chunk)] = masked.to_bytes(len(chunk), 'little')
+
+    return bytes(out)
+
+
 def oaep_pad(message: bytes, append_length=32):
     message = pkcs7_pad(message, 32)
 
-    r = random.getrandbits(append_length)
-    length = len(message)
-    message = int.from_bytes(message, 'little')
+    r = random.getrandbits(append_length).to_bytes(append_length, 'little')
 
-    x = int.from_bytes(SHAKE256(r.to_bytes(append_length, 'little')).digest(length), 'little') ^ message
-    y = int.from_bytes(SHAKE256(x.to_bytes(length, 'little')).digest(append_length), 'little') ^ r
+    x = mask(r, message)
+    y = mask(x, r)
 
-    return x.to_bytes(length, 'little') + y.to_bytes(append_length, 'little')
+    return x + y
 
 
 def oaep_unpad(data: bytes, append_length=32):
-    length = len(data) - append_length
-    x, y = int.from_bytes(data[:-append_length], 'little'), int.from_bytes(data[-append_length:], 'little')
+    x, y = data[:-append_length], data[-append_length:]
 
-    r = (y ^ int.from_bytes(SHAKE256(x.to_bytes(
-        length, 'little')).digest(append_length), 'little')).to_bytes(append_length, 'little')
-    message = x ^ int.from_bytes(SHAKE256(r).digest(length), 'little')
+    r = mask(x, y)
+    message = mask(r, x)
 
-    return pkcs7_unpad(message.to_bytes(length, 'little'), 32)
+    return pkcs7_unpad(message, 32)
@@ -0,0 +1,39 @@
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+
+# One pool of worker processes per worker count, shared by aes.py and sha.py
+_pools = {}
+
+
+def parallel_map(func, jobs, workers):
+    """
+    Runs func(*job) for every job on a shared process pool, returning results in order.
+
+    :param func: Module level function, so it can be pickled
+    :param jobs: List of argument tuples
+    :param workers: Number of worker processes
+    :return: Iterator of results
+    """
+
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+
+    return _pools[workers].map(func, *zip(*jobs))
+
+
+def shutdown_pools():
+    """
+    Shuts down every shared pool, waiting for its workers to exit.
+    Pools are created again on the next parallel_map call.
+
+    :return: None
+    """
+
+    pools = list(_pools.values())
+    _pools.clear()
+
+    for pool in pools:
+        pool.shutdown()
+
+
+atexit.register(shutdown_pools)
@@ -1,7 +1,16 @@
+import hashlib
+import mmap
+import os
+import warnings
 from math import log
 from operator import xor
-from copy import deepcopy
 from functools import reduce
+from parallel import parallel_map
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # The Keccak-f round constants.
 RoundConstants = [
@@ -88,6 +97,52 @@ def shake_padding(used_bytes, align_bytes):
         return [0x1f] + ([0x00] * (padlen - 2)) + [0x80]
 
 
+def cshake_padding(used_bytes, align_bytes):
+    """
+        The cSHAKE padding function
+    """
+    padlen = align_bytes - (used_bytes % align_bytes)
+    if padlen == 1:
+        return [0x84]
+    elif padlen == 2:
+        return [0x04, 0x80]
+    else:
+        return [0x04] + ([0x00] * (padlen - 2)) + [0x80]
+
+
+def left_encode(x):
+    """
+    Encodes the non-negative integer x as in NIST SP 800-185,
+    its byte length first.
+    """
+    n = max(1, bits2bytes(x.bit_length()))
+    return bytes([n]) + x.to_bytes(n, 'big')
+
+
+def right_encode(x):
+    """
+    Encodes the non-negative integer x as in NIST SP 800-185,
+    its byte length last.
+    """
+    n = max(1, bits2bytes(x.bit_length()))
+    return x.to_bytes(n, 'big') + bytes([n])
+
+
+def encode_string(s):
+    """
+    Encodes the byte string s with its bit length prepended, as in NIST SP 800-185.
+    """
+    return left_encode(8 * len(s)) + bytes(s)
+
+
+def bytepad(x, w):
+    """
+    Prepends left_encode(w) to x and pads it with zeros to a multiple of w bytes.
+    """
+    z = left_encode(w) + x
+    return z + bytes(-len(z) % w)
+
+
 def keccak_f(state):
     """
     This is Keccak-f permutation.  It operates on and
@@ -101,26 +156,26 @@ def keccak_f(state):
         zero = state.zero
 
         # theta
-        c = [reduce(xor, a[x]) for x in rangew]
+        c = [reduce(xor, a[x::w]) for x in rangew]
         d = [0] * w
         for x in rangew:
             d[x] = c[(x - 1) % w] ^ rol(c[(x + 1) % w], 1, lanew)
             for y in rangeh:
-                a[x][y] ^= d[x]
+                a[x + w * y] ^= d[x]
 
         # rho and pi
         b = zero()
         for x in rangew:
             for y in rangeh:
-                b[y % w][(2 * x + 3 * y) % h] = rol(a[x][y], RotationConstants[y][x], lanew)
+                b[y % w + w * ((2 * x + 3 * y) % h)] = rol(a[x + w * y], RotationConstants[y][x], lanew)
 
         # chi
         for x in rangew:
             for y in rangeh:
-                a[x][y] = b[x][y] ^ ((~ b[(x + 1) % w][y]) & b[(x + 2) % w][y])
+                a[x + w * y] = b[x + w * y] ^ ((~ b[(x + 1) % w + w * y]) & b[(x + 2) % w + w * y])
 
         # iota
-        a[0][0] ^= rc
+        a[0] ^= rc
 
     nr = 12 + 2 * int(log(state.lanew, 2))
 
@@ -128,11 +183,191 @@ def keccak_f(state):
         keccak_round(state.s, RoundConstants[ir])
 
 
+def keccak_f1600_lanes(lanes):
+    """
+    The Keccak-f[1600] permutation, unrolled over local variables.
+    Takes the 25 64-bit lanes of a state in flat order (lane x + 5 * y)
+    and returns the permuted lanes as a new list.
+    """
+
+    mask = 0xFFFFFFFFFFFFFFFF
+
+    (a0, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12,
+     a13, a14, a15, a16, a17, a18, a19, a20, a21, a22, a23, a24) = lanes
+
+    for rc in RoundConstants:
+        # theta
+        c0 = a0 ^ a5 ^ a10 ^ a15 ^ a20
+        c1 = a1 ^ a6 ^ a11 ^ a16 ^ a21
+        c2 = a2 ^ a7 ^ a12 ^ a17 ^ a22
+        c3 = a3 ^ a8 ^ a13 ^ a18 ^ a23
+        c4 = a4 ^ a9 ^ a14 ^ a19 ^ a24
+        d0 = c4 ^ (((c1 << 1) | (c1 >> 63)) & mask)
+        d1 = c0 ^ (((c2 << 1) | (c2 >> 63)) & mask)
+        d2 = c1 ^ (((c3 << 1) | (c3 >> 63)) & mask)
+        d3 = c2 ^ (((c4 << 1) | (c4 >> 63)) & mask)
+        d4 = c3 ^ (((c0 << 1) | (c0 >> 63)) & mask)
+
+        # rho and pi
+        b0 = a0 ^ d0
+        t = a6 ^ d1
+        b1 = ((t << 44) | (t >> 20)) & mask
+        t = a12 ^ d2
+        b2 = ((t << 43) | (t >> 21)) & mask
+        t = a18 ^ d3
+        b3 = ((t << 21) | (t >> 43)) & mask
+        t = a24 ^ d4
+        b4 = ((t << 14) | (t >> 50)) & mask
+        t = a3 ^ d3
+        b5 = ((t << 28) | (t >> 36)) & mask
+        t = a9 ^ d4
+        b6 = ((t << 20) | (t >> 44)) & mask
+        t = a10 ^ d0
+        b7 = ((t << 3) | (t >> 61)) & mask
+        t = a16 ^ d1
+        b8 = ((t << 45) | (t >> 19)) & mask
+        t = a22 ^ d2
+        b9 = ((t << 61) | (t >> 3)) & mask
+        t = a1 ^ d1
+        b10 = ((t << 1) | (t >> 63)) & mask
+        t = a7 ^ d2
+        b11 = ((t << 6) | (t >> 58)) & mask
+        t = a13 ^ d3
+        b12 = ((t << 25) | (t >> 39)) & mask
+        t = a19 ^ d4
+        b13 = ((t << 8) | (t >> 56)) & mask
+        t = a20 ^ d0
+        b14 = ((t << 18) | (t >> 46)) & mask
+        t = a4 ^ d4
+        b15 = ((t << 27) | (t >> 37)) & mask
+        t = a5 ^ d0
+        b16 = ((t << 36) | (t >> 28)) & mask
+        t = a11 ^ d1
+        b17 = ((t << 10) | (t >> 54)) & mask
+        t = a17 ^ d2
+        b18 = ((t << 15) | (t >> 49)) & mask
+        t = a23 ^ d3
+        b19 = ((t << 56) | (t >> 8)) & mask
+        t = a2 ^ d2
+        b20 = ((t << 62) | (t >> 2)) & mask
+        t = a8 ^ d3
+        b21 = ((t << 55) | (t >> 9)) & mask
+        t = a14 ^ d4
+        b22 = ((t << 39) | (t >> 25)) & mask
+        t = a15 ^ d0
+        b23 = ((t << 41) | (t >> 23)) & mask
+        t = a21 ^ d1
+        b24 = ((t << 2) | (t >> 62)) & mask
+
+        # chi
+        a0 = b0 ^ (~b1 & b2)
+        a1 = b1 ^ (~b2 & b3)
+        a2 = b2 ^ (~b3 & b4)
+        a3 = b3 ^ (~b4 & b0)
+        a4 = b4 ^ (~b0 & b1)
+        a5 = b5 ^ (~b6 & b7)
+        a6 = b6 ^ (~b7 & b8)
+        a7 = b7 ^ (~b8 & b9)
+        a8 = b8 ^ (~b9 & b5)
+        a9 = b9 ^ (~b5 & b6)
+        a10 = b10 ^ (~b11 & b12)
+        a11 = b11 ^ (~b12 & b13)
+        a12 = b12 ^ (~b13 & b14)
+        a13 = b13 ^ (~b14 & b10)
+        a14 = b14 ^ (~b10 & b11)
+        a15 = b15 ^ (~b16 & b17)
+        a16 = b16 ^ (~b17 & b18)
+        a17 = b17 ^ (~b18 & b19)
+        a18 = b18 ^ (~b19 & b15)
+        a19 = b19 ^ (~b15 & b16)
+        a20 = b20 ^ (~b21 & b22)
+        a21 = b21 ^ (~b22 & b23)
+        a22 = b22 ^ (~b23 & b24)
+        a23 = b23 ^ (~b24 & b20)
+        a24 = b24 ^ (~b20 & b21)
+
+        # iota
+        a0 ^= rc
+
+    return [a0, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12,
+            a13, a14, a15, a16, a17, a18, a19, a20, a21, a22, a23, a24]
+
+
+def keccak_f1600(state):
+    """
+    The Keccak-f[1600] permutation. Like keccak_f, it mutates the
+    passed-in KeccakState and returns nothing, but only handles 1600-bit
+    states and is much faster.
+    """
+
+    state.s = keccak_f1600_lanes(state.s)
+
+
+# Source lane and rotation of every lane after the rho and pi steps, in flat order
+_PI_SOURCES = [0] * 25
+_RHO_ROTATIONS = [0] * 25
+
+for _x in range(5):
+    for _y in range(5):
+        _PI_SOURCES[_y + 5 * ((2 * _x + 3 * _y) % 5)] = _x + 5 * _y
+        _RHO_ROTATIONS[_y + 5 * ((2 * _x + 3 * _y) % 5)] = RotationConstants[_y][_x]
+
+
+def keccak_f1600_batch(lanes):
+    """
+    The Keccak-f[1600] permutation applied to many states at once.
+    Takes a uint64 NumPy array of shape (N, 25), state i in row i with
+    lanes in flat order, and returns the permuted states in a new array
+    of the same shape. Requires NumPy.
+    """
+
+    if numpy is None:
+        raise RuntimeError('NumPy is not available')
+
+    a = numpy.ascontiguousarray(numpy.asarray(lanes, dtype=numpy.uint64).T)
+    return _keccak_f1600_columns(a).T.copy()
+
+
+def _keccak_f1600_columns(a):
+    """
+    Keccak-f[1600] over a (25, N) uint64 array holding one state per
+    column, so every step works on contiguous rows of N lanes.
+    Returns the permuted states as a new (25, N) array.
+    """
+
+    u64 = numpy.uint64
+    sources = numpy.array(_PI_SOURCES)
+    theta = sources % 5
+    left = numpy.array(_RHO_ROTATIONS, dtype=u64).reshape(25, 1)
+    right = (u64(64) - left) % u64(64)
+    one, sixty_three = u64(1), u64(63)
+    chi1, chi2 = [1, 2, 3, 4, 0], [2, 3, 4, 0, 1]
+
+    for rc in RoundConstants:
+        # theta
+        c = a[0:5] ^ a[5:10] ^ a[10:15] ^ a[15:20] ^ a[20:25]
+        shifted = c[chi1]
+        d = c[[4, 0, 1, 2, 3]] ^ ((shifted << one) | (shifted >> sixty_three))
+
+        # rho and pi; a rotation by 0 ORs the lane with itself
+        t = a[sources] ^ d[theta]
+        b = ((t << left) | (t >> right)).reshape(5, 5, -1)
+
+        # chi
+        a = (b ^ (~b[:, chi1] & b[:, chi2])).reshape(25, -1)
+
+        # iota
+        a[0] ^= u64(rc)
+
+    return a
+
+
 class KeccakState:
     """
     A keccak state container.
 
-    The state is stored as a 5x5 table of integers.
+    The state is stored as a flat list of 25 integer lanes,
+    lane (x, y) at index x + 5 * y.
     """
     W = 5
     H = 5
@@ -145,7 +380,7 @@ class KeccakState:
         """
         Returns an zero state table.
         """
-        return [[0] * KeccakState.W for _ in KeccakState.rangeH]
+        return [0] * (KeccakState.W * KeccakState.H)
 
     @staticmethod
     def format(st):
@@ -160,7 +395,7 @@ class KeccakState:
         for y in KeccakState.rangeH:
             row = []
             for x in KeccakState.rangeW:
-                row.append(fmt(st[x][y]))
+                row.append(fmt(st[x + KeccakState.W * y]))
             rows.append(' '.join(row))
         return '\n'.join(rows)
 
@@ -170,20 +405,14 @@ class KeccakState:
         Converts the lane s to a sequence of byte values,
         assuming a lane is w bits.
         """
-        o = []
-        for b in range(0, w, 8):
-            o.append((s >> b) & 0xff)
-        return o
+        return list(s.to_bytes(bits2bytes(w), 'little'))
 
     @staticmethod
     def bytes2lane(bb):
         """
         Converts a sequence of byte values to a lane.
         """
-        r = 0
-        for b in reversed(bb):
-            r = r << 8 | b
-        return r
+        return int.from_bytes(bytes(bb), 'little')
 
     @staticmethod
     def bytes2str(bb):
@@ -209,66 +438,90 @@ class KeccakState:
 
         assert self.b % 25 == 0
         self.lanew = self.b // 25
+        self.lane_bytes = bits2bytes(self.lanew)
+
+        # Lanes covered by the bitrate, in absorption order; the last may be partial
+        self.rate_lanes = -(-self.bitrate_bytes // self.lane_bytes)
 
         self.s = KeccakState.zero()
 
     def __str__(self):
         return KeccakState.format(self.s)
 
+    def copy(self):
+        """
+        Returns a copy of the state. Only the lane list is duplicated;
+        the parameters are immutable and shared.
+        """
+        clone = object.__new__(KeccakState)
+        clone.__dict__.update(self.__dict__)
+        clone.s = self.s[:]
+        return clone
+
     def absorb(self, bb):
         """
-        Mixes in the given bitrate-length string to the state.
+        Mixes in the given bitrate-length bytes-like object to the state.
+        Only the lanes covered by the bitrate are touched.
         """
         assert len(bb) == self.bitrate_bytes
 
-        bb += [0] * bits2bytes(self.b - self.bitrate)
-        i = 0
+        s = self.s
+        n = self.lane_bytes
+        from_bytes = int.from_bytes
 
-        for y in self.rangeH:
-            for x in self.rangeW:
-                self.s[x][y] ^= KeccakState.bytes2lane(bb[i:i + 8])
-                i += 8
+        for i in range(self.rate_lanes):
+            s[i] ^= from_bytes(bb[i * n:(i + 1) * n], 'little')
 
     def squeeze(self):
         """
         Returns the bitrate-length prefix of the state to be output.
         """
-        return self.get_bytes()[:self.bitrate_bytes]
+        n = self.lane_bytes
+        out = b''.join([lane.to_bytes(n, 'little') for lane in self.s[:self.rate_lanes]])
+        return out[:self.bitrate_bytes]
 
     def get_bytes(self):
         """
         Convert whole state to a byte string.
         """
-        out = [0] * bits2bytes(self.b)
-        i = 0
-        for y in self.rangeH:
-            for x in self.rangeW:
-                v = KeccakState.lane2bytes(self.s[x][y], self.lanew)
-                out[i:i + 8] = v
-                i += 8
-        return out
+        n = self.lane_bytes
+        return b''.join([lane.to_bytes(n, 'little') for lane in self.s])
 
     def set_bytes(self, bb):
         """
         Set whole state from byte string, which is assumed
         to be the correct length.
         """
-        i = 0
-        for y in self.rangeH:
-            for x in self.rangeW:
-                self.s[x][y] = KeccakState.bytes2lane(bb[i:i + 8])
-                i += 8
+        n = self.lane_bytes
+        self.s = [int.from_bytes(bb[i:i + n], 'little') for i in range(0, len(self.s) * n, n)]
 
 
 class KeccakSponge:
     def __init__(self, bitrate, width, padfn, permfn):
         self.state = KeccakState(bitrate, width)
         self.padfn = padfn
+
+        # Every 1600-bit instance uses the unrolled permutation
+        if permfn is keccak_f and width == 1600:
+            permfn = keccak_f1600
+
         self.permfn = permfn
-        self.buffer = []
+
+        # Holds less than one block of input between absorb calls
+        self.buffer = bytearray()
 
     def copy(self):
-        return deepcopy(self)
+        """
+        Returns a copy of the sponge, duplicating only the lanes and
+        the partial block buffer. The padding and permutation functions
+        are shared.
+        """
+        clone = object.__new__(KeccakSponge)
+        clone.padfn = self.padfn
+        clone.permfn = self.permfn
+        clone.state = self.state.copy()
+        clone.buffer = bytearray(self.buffer)
+        return clone
 
     def absorb_block(self, bb):
         assert len(bb) == self.state.bitrate_bytes
@@ -276,16 +529,38 @@ class KeccakSponge:
         self.permfn(self.state)
 
     def absorb(self, s):
-        self.buffer += s
+        """
+        Absorbs a bytes-like object. Whole blocks are read straight from
+        the caller's buffer; only a trailing partial block is copied.
+        """
+        if isinstance(s, (list, tuple)):
+            s = bytes(s)
+
+        data = memoryview(s).cast('B')
+        rate = self.state.bitrate_bytes
+        buffer = self.buffer
+        i = 0
 
-        while len(self.buffer) >= self.state.bitrate_bytes:
-            self.absorb_block(self.buffer[:self.state.bitrate_bytes])
-            self.buffer = self.buffer[self.state.bitrate_bytes:]
+        # Top up a partial block left over from the previous call
+        if buffer:
+            i = min(rate - len(buffer), len(data))
+            buffer += data[:i]
+            if len(buffer) < rate:
+                return
+            self.absorb_block(buffer)
+            del buffer[:]
+
+        end = len(data) - rate
+        while i <= end:
+            self.absorb_block(data[i:i + rate])
+            i += rate
+
+        buffer += data[i:]
 
     def absorb_final(self):
-        padded = self.buffer + self.padfn(len(self.buffer), self.state.bitrate_bytes)
+        padded = self.buffer + bytes(self.padfn(len(self.buffer), self.state.bitrate_bytes))
         self.absorb_block(padded)
-        self.buffer = []
+        self.buffer = bytearray()
 
     def squeeze_once(self):
         rc = self.state.squeeze()
@@ -293,10 +568,18 @@ class KeccakSponge:
         return rc
 
     def squeeze(self, l):
-        z = self.squeeze_once()
-        while len(z) < l:
-            z += self.squeeze_once()
-        return z[:l]
+        """
+        Returns the first l bytes of output from a finalised sponge.
+        The state is only permuted between output blocks, so outputs
+        no longer than the bitrate cost no permutation at all.
+        """
+        z = [self.state.squeeze()]
+        got = len(z[0])
+        while got < l:
+            self.permfn(self.state)
+            z.append(self.state.squeeze())
+            got += len(z[-1])
+        return b''.join(z)[:l]
 
 
 class KeccakHash:
@@ -323,7 +606,16 @@ class KeccakHash:
         return '<KeccakHash with r=%d, c=%d, image=%d>' % inf
 
     def copy(self):
-        return deepcopy(self)
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.sponge = self.sponge.copy()
+        return clone
+
+    def fork(self, s=None):
+        """
+        Returns a copy of this hash with s absorbed, leaving this one unchanged.
+        """
+        return fork(self, s)
 
     def update(self, s):
         self.sponge.absorb(s)
@@ -377,7 +669,16 @@ class SHA3Hash:
         return '<SHA3Hash with r=%d, c=%d, image=%d>' % inf
 
     def copy(self):
-        return deepcopy(self)
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.sponge = self.sponge.copy()
+        return clone
+
+    def fork(self, s=None):
+        """
+        Returns a copy of this hash with s absorbed, leaving this one unchanged.
+        """
+        return fork(self, s)
 
     def update(self, s):
         self.sponge.absorb(s)
@@ -427,7 +728,16 @@ class SHAKEHash:
         return '<SHAKEHash with r=%d, c=%d>' % inf
 
     def copy(self):
-        return deepcopy(self)
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.sponge = self.sponge.copy()
+        return clone
+
+    def fork(self, s=None):
+        """
+        Returns a copy of this hash with s absorbed, leaving this one unchanged.
+        """
+        return fork(self, s)
 
     def update(self, s):
         self.sponge.absorb(s)
@@ -441,6 +751,15 @@ class SHAKEHash:
     def hexdigest(self, digest_size):
         return self.digest(digest_size).hex()
 
+    def reader(self):
+        """
+        Returns a SHAKEReader over the output of the input absorbed so far.
+        Later updates to this hash do not affect the reader.
+        """
+        finalised = self.sponge.copy()
+        finalised.absorb_final()
+        return SHAKEReader(finalised)
+
     @staticmethod
     def preset(bitrate_bits, capacity_bits):
         """
@@ -457,18 +776,596 @@ class SHAKEHash:
         return create
 
 
+class CSHAKEHash(SHAKEHash):
+    """
+    The customizable SHAKE function of NIST SP 800-185, with a hashlib-compatible
+    interface. With an empty function name and customization string it is SHAKE.
+    """
+
+    def __init__(self, bitrate_bits, capacity_bits, function_name=b'', customization=b''):
+        SHAKEHash.__init__(self, bitrate_bits, capacity_bits)
+
+        if function_name or customization:
+            self.sponge.padfn = cshake_padding
+            self.sponge.absorb(bytepad(encode_string(function_name) + encode_string(customization),
+                                       self.block_size))
+
+    def __repr__(self):
+        inf = (self.sponge.state.bitrate,
+               self.sponge.state.b - self.sponge.state.bitrate)
+        return '<CSHAKEHash with r=%d, c=%d>' % inf
+
+    @staticmethod
+    def preset(bitrate_bits, capacity_bits):
+        """
+        Returns a factory function for the given bitrate and sponge capacity.
+        The function accepts an optional initial input, ala hashlib, and
+        the function name and customization strings.
+        """
+
+        def create(initial_input=None, function_name=b'', customization=b''):
+            h = CSHAKEHash(bitrate_bits, capacity_bits, function_name, customization)
+            if initial_input is not None:
+                h.update(initial_input)
+            return h
+
+        return create
+
+
+class SHAKEReader:
+    """
+    Reads the output of a finalised SHAKE sponge incrementally. Each block
+    is squeezed once, when the first byte of it is read, so reading costs
+    the same as one digest of the total length without ever holding it.
+    """
+
+    def __init__(self, sponge):
+        self.sponge = sponge
+        self._block = sponge.state.squeeze()
+        self._pos = 0
+
+    def readinto(self, buf):
+        """
+        Fills the writable bytes-like object buf with the next len(buf)
+        output bytes. Returns the number of bytes written.
+        """
+        view = memoryview(buf).cast('B')
+        size = len(view)
+        block = self._block
+        pos = self._pos
+        i = 0
+
+        while i < size:
+            if pos == len(block):
+                self.sponge.permfn(self.sponge.state)
+                block = self._block = self.sponge.state.squeeze()
+                pos = 0
+
+            count = min(len(block) - pos, size - i)
+            view[i:i + count] = block[pos:pos + count]
+            pos += count
+            i += count
+
+        self._pos = pos
+        return size
+
+    def read(self, n):
+        """
+        Returns the next n output bytes.
+        """
+        out = bytearray(n)
+        self.readinto(out)
+        return bytes(out)
+
+
+class _DigestReader:
+    """
+    Reads the output of a hashlib SHAKE object, which can only produce
+    its output from the start. Output is regenerated at (at least) double
+    the length each time more is needed, so reading stays linear overall,
+    and output already read is dropped whenever it is regenerated.
+    """
+
+    def __init__(self, h, length=0):
+        self.h = h
+        self._length = length
+        self._produced = 0
+        self._output = b''
+        self._pos = 0
+
+    def readinto(self, buf):
+        view = memoryview(buf).cast('B')
+        size = len(view)
+
+        if self._pos + size > len(self._output):
+            # Bytes of output before self._output starts
+            start = self._produced - len(self._output)
+            length = max(start + self._pos + size, 2 * self._produced, self._length)
+            self._output = self.h.digest(length)[start + self._pos:]
+            self._produced = length
+            self._pos = 0
+
+        view[:] = self._output[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def read(self, n):
+        out = bytearray(n)
+        self.readinto(out)
+        return bytes(out)
+
+
+def xof_reader(h, length=0):
+    """
+    Returns an object with read(n) and readinto(buf) methods producing
+    the output of the SHAKE hash object h, from either backend, a chunk
+    at a time. Later updates to h do not affect the reader.
+
+    length is the total the caller expects to read, if known. hashlib
+    objects then produce it in one go instead of regenerating their output
+    as it grows; pure Python readers always squeeze on demand.
+    """
+
+    if isinstance(h, SHAKEHash):
+        return h.reader()
+    return _DigestReader(h.copy(), length)
+
+
+def fork(h, s=None):
+    """
+    Returns a copy of the hash object h with s absorbed, leaving h unchanged.
+    Works on both pure Python and hashlib objects, so a shared prefix can be
+    hashed once and branched for every message that follows it.
+    """
+
+    clone = h.copy()
+    if s is not None:
+        clone.update(s)
+    return clone
+
+
 # Keccak parameter presets
 Keccak224 = KeccakHash.preset(1152, 448, 224)
 Keccak256 = KeccakHash.preset(1088, 512, 256)
 Keccak384 = KeccakHash.preset(832, 768, 384)
 Keccak512 = KeccakHash.preset(576, 1024, 512)
 
+# Pure Python SHA3 parameter presets; always available, and the reference
+# the hashlib backend is checked against
+PySHA3_224 = SHA3Hash.preset(1152, 448, 224)
+PySHA3_256 = SHA3Hash.preset(1088, 512, 256)
+PySHA3_384 = SHA3Hash.preset(832, 768, 384)
+PySHA3_512 = SHA3Hash.preset(576, 1024, 512)
+
+# Pure Python SHAKE XOF parameter presets
+PySHAKE128 = SHAKEHash.preset(1344, 256)
+PySHAKE256 = SHAKEHash.preset(1088, 512)
+
+# cSHAKE parameter presets; always pure Python, as hashlib has no cSHAKE
+CSHAKE128 = CSHAKEHash.preset(1344, 256)
+CSHAKE256 = CSHAKEHash.preset(1088, 512)
+
+# Environment variable naming the SHA-3 backend to use, overriding automatic selection
+SHA_BACKEND_ENV = 'FINCRYPT_SHA_BACKEND'
+
+SHA_BACKENDS = ('hashlib', 'python')
+
+# Preset name: (pure Python factory, hashlib constructor name)
+_PRESETS = {
+    'SHA3_224': (PySHA3_224, 'sha3_224'),
+    'SHA3_256': (PySHA3_256, 'sha3_256'),
+    'SHA3_384': (PySHA3_384, 'sha3_384'),
+    'SHA3_512': (PySHA3_512, 'sha3_512'),
+    'SHAKE128': (PySHAKE128, 'shake_128'),
+    'SHAKE256': (PySHAKE256, 'shake_256'),
+}
+
+# Self-test inputs: empty, short, and longer than every rate, with a partial last block
+_SELF_TEST_INPUTS = (b'', b'abc', bytes(range(256)) + bytes(range(200)))
+
+_factories = {}
+_backend = None
+
+
+def _hashlib_preset(constructor):
+    """
+    Returns a factory for a hashlib constructor with the same
+    optional initial input as the pure Python presets.
+    """
+
+    def create(initial_input=None):
+        if initial_input is None:
+            return constructor()
+        return constructor(initial_input)
+
+    return create
+
+
+def _dispatch(name):
+    """
+    Returns the module level factory for the preset name, which
+    creates its hash object from whichever backend is selected.
+    """
+
+    def create(initial_input=None):
+        return _factories[name](initial_input)
+
+    create.__name__ = create.__qualname__ = name
+    return create
+
+
+def hashlib_available():
+    """
+    Returns whether hashlib provides every SHA3 and SHAKE preset.
+    """
+
+    return all(hasattr(hashlib, hashlib_name) for _, hashlib_name in _PRESETS.values())
+
+
+def self_test():
+    """
+    Hashes a few inputs with both the hashlib and pure Python backends,
+    returning True if every preset agrees.
+    """
+
+    if not hashlib_available():
+        return False
+
+    for python, hashlib_name in _PRESETS.values():
+        for data in _SELF_TEST_INPUTS:
+            reference = python(data)
+            accelerated = getattr(hashlib, hashlib_name)(data)
+
+            if hashlib_name.startswith('shake'):
+                if reference.digest(200) != accelerated.digest(200):
+                    return False
+            elif reference.digest() != accelerated.digest():
+                return False
+
+    return True
+
+
+def get_backend():
+    """
+    Returns the name of the backend SHA3_* and SHAKE* hash objects come from.
+    """
+
+    return _backend
+
+
+def set_backend(name=None):
+    """
+    Makes SHA3_* and SHAKE* return hashlib objects ('hashlib') or pure
+    Python ones ('python'). None picks hashlib when it is available and
+    passes self_test, unless the FINCRYPT_SHA_BACKEND environment
+    variable names a backend. Returns the name of the selected backend.
+
+    The Keccak* presets have no hashlib equivalent and are always pure Python.
+    """
+
+    global _backend
+
+    if name is None:
+        name = os.environ.get(SHA_BACKEND_ENV)
+
+        if name is None:
+            name = 'hashlib' if hashlib_available() else 'python'
+
+    if name not in SHA_BACKENDS:
+        raise ValueError('Unknown SHA-3 backend: %s' % name)
+
+    if name == 'hashlib' and not self_test():
+        warnings.warn('hashlib SHA-3 disagrees with the pure Python implementation, using pure Python')
+        name = 'python'
+
+    for preset, (python, hashlib_name) in _PRESETS.items():
+        if name == 'hashlib':
+            _factories[preset] = _hashlib_preset(getattr(hashlib, hashlib_name))
+        else:
+            _factories[preset] = python
+
+    _backend = name
+    return name
+
+
 # SHA3 parameter presets
-SHA3_224 = SHA3Hash.preset(1152, 448, 224)
-SHA3_256 = SHA3Hash.preset(1088, 512, 256)
-SHA3_384 = SHA3Hash.preset(832, 768, 384)
-SHA3_512 = SHA3Hash.preset(576, 1024, 512)
+SHA3_224 = _dispatch('SHA3_224')
+SHA3_256 = _dispatch('SHA3_256')
+SHA3_384 = _dispatch('SHA3_384')
+SHA3_512 = _dispatch('SHA3_512')
 
 # SHAKE XOF parameter presets
-SHAKE128 = SHAKEHash.preset(1344, 256)
-SHAKE256 = SHAKEHash.preset(1088, 512)
+SHAKE128 = _dispatch('SHAKE128')
+SHAKE256 = _dispatch('SHAKE256')
+
+set_backend()
+
+# Bytes read from a stream per update when hashing files and streams
+HASH_CHUNK_SIZE = (1 << 20)
+
+
+def hash_stream(stream, factory=SHA3_512, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Hashes everything left in a binary stream, reading it with readinto
+    (when the stream has it) into one buffer that is reused for every chunk,
+    so memory use does not depend on the length of the stream.
+
+    :param stream: Binary file-like object to read until EOF
+    :param factory: Hash preset to use, e.g. SHA3_512 or SHAKE256
+    :param chunk_size: Bytes read per chunk (int)
+    :return: Hash object with the stream absorbed
+    """
+
+    if chunk_size <= 0:
+        raise ValueError('chunk_size must be positive')
+
+    h = factory()
+    readinto = getattr(stream, 'readinto', None)
+
+    if readinto is None:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            h.update(chunk)
+        return h
+
+    view = memoryview(bytearray(chunk_size))
+
+    while True:
+        count = readinto(view)
+        if not count:
+            break
+        h.update(view[:count])
+
+    return h
+
+
+def hash_file(path, factory=SHA3_512, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Hashes the file at path. Regular files are memory mapped and absorbed
+    straight from the mapping a chunk at a time; anything that cannot be
+    mapped (empty files, pipes) is read with hash_stream instead.
+
+    :param path: Path of the file to hash
+    :param factory: Hash preset to use, e.g. SHA3_512 or SHAKE256
+    :param chunk_size: Bytes absorbed per update (int)
+    :return: Hash object with the file absorbed
+    """
+
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            return hash_stream(f, factory, chunk_size)
+
+        with mapped:
+            h = factory()
+            with memoryview(mapped) as view:
+                for i in range(0, len(view), chunk_size):
+                    h.update(view[i:i + chunk_size])
+            return h
+
+
+# Messages hashed together per batch of Keccak-f[1600] states
+HASH_BATCH_SIZE = (1 << 12)
+
+# The pure Python factory behind every backend-dispatching preset
+_PYTHON_FACTORIES = {globals()[preset]: python for preset, (python, _) in _PRESETS.items()}
+
+
+def hash_batch(messages, factory=SHA3_512, digest_size=None):
+    """
+    Hashes many independent messages, returning their digests in order.
+
+    With NumPy, the sponges of up to HASH_BATCH_SIZE messages are run
+    side by side as one (25, N) array, so each permutation costs a few
+    dozen array operations for the whole batch instead of a pass of the
+    interpreter per message. SHA3 and SHAKE presets use hashlib instead
+    when it is the selected backend, since it is faster still.
+
+    :param messages: Iterable of bytes-like objects
+    :param factory: Hash preset to use, e.g. SHA3_512, Keccak256 or SHAKE256
+    :param digest_size: Output length in bytes, required for SHAKE presets
+    :return: List of digests (bytes)
+    """
+
+    messages = list(messages)
+
+    if (_backend == 'hashlib' and factory in _PYTHON_FACTORIES) or numpy is None:
+        if digest_size is None:
+            return [factory(m).digest() for m in messages]
+        return [factory(m).digest(digest_size) for m in messages]
+
+    prototype = _PYTHON_FACTORIES.get(factory, factory)()
+    sponge = prototype.sponge
+
+    if sponge.state.b != 1600:
+        raise ValueError('Batch hashing needs a Keccak-f[1600] preset')
+
+    if digest_size is None:
+        digest_size = prototype.digest_size
+
+    digests = []
+    for i in range(0, len(messages), HASH_BATCH_SIZE):
+        digests += _hash_columns(messages[i:i + HASH_BATCH_SIZE], sponge.state.bitrate_bytes,
+                                 sponge.padfn, digest_size)
+    return digests
+
+
+def _hash_columns(messages, rate, padfn, digest_size):
+    """
+    Absorbs and squeezes one batch of messages, one sponge per column.
+    Messages are sorted longest first, so the sponges still absorbing
+    after k blocks are always the first columns and can be permuted as
+    a single slice.
+    """
+
+    rate_lanes = rate // 8
+    padded = [bytes(m) + bytes(padfn(len(m) % rate, rate)) for m in messages]
+    order = sorted(range(len(padded)), key=lambda i: -len(padded[i]))
+    padded = [padded[i] for i in order]
+
+    a = numpy.zeros((25, len(padded)), dtype=numpy.uint64)
+    active = len(padded)
+
+    for k in range(0, len(padded[0]) if padded else 0, rate):
+        while len(padded[active - 1]) <= k:
+            active -= 1
+
+        block = b''.join([p[k:k + rate] for p in padded[:active]])
+        a[:rate_lanes, :active] ^= numpy.frombuffer(block, dtype='<u8').reshape(active, rate_lanes).T
+        a[:, :active] = _keccak_f1600_columns(a[:, :active])
+
+    # Every sponge is finalised; squeeze them together
+    out = []
+    while True:
+        out.append(a[:rate_lanes].T.astype('<u8').tobytes())
+        if len(out) * rate >= digest_size:
+            break
+        a = _keccak_f1600_columns(a)
+
+    blocks = [memoryview(o).cast('B') for o in out]
+    digests = [None] * len(padded)
+    for j, i in enumerate(order):
+        digests[i] = b''.join([bytes(b[j * rate:(j + 1) * rate]) for b in blocks])[:digest_size]
+    return digests
+
+
+# ParallelHash splits its input into leaves of this many bytes by default.
+# Large leaves keep the final pure Python cSHAKE over the leaf hashes short.
+PARALLEL_HASH_LEAF_SIZE = (1 << 20)
+
+# ParallelHash buffers this many leaves per worker before hashing them
+PARALLEL_HASH_BATCH_LEAVES = 4
+
+# ...but never more than this many bytes, however many workers there are
+PARALLEL_HASH_MAX_BUFFER = (1 << 25)
+
+
+def _hash_leaves(preset, leaf_size, leaf_bytes, data):
+    """
+    Worker for ParallelHash; returns the concatenated SHAKE hashes of
+    every leaf_size slice of data.
+    """
+
+    view = memoryview(data)
+    return b''.join([_factories[preset](view[i:i + leaf_size]).digest(leaf_bytes)
+                     for i in range(0, len(view), leaf_size)])
+
+
+class ParallelHash:
+    """
+    The ParallelHash function of NIST SP 800-185, with a hashlib-compatible interface.
+
+    The input is split into leaves of leaf_size bytes which are hashed
+    independently with SHAKE, on a pool of worker processes once enough
+    input is buffered, and the leaf hashes are combined with cSHAKE.
+    The result does not depend on the number of workers.
+    """
+
+    def __init__(self, bitrate_bits, capacity_bits, output_bits, customization=b'',
+                 leaf_size=PARALLEL_HASH_LEAF_SIZE, workers=None):
+        if leaf_size <= 0:
+            raise ValueError('leaf_size must be positive')
+
+        self._outer = CSHAKEHash(bitrate_bits, capacity_bits, b'ParallelHash', customization)
+        self._outer.update(left_encode(leaf_size))
+
+        # Leaves are hashed with the SHAKE of the same security strength
+        self._leaf_preset = 'SHAKE128' if capacity_bits == 256 else 'SHAKE256'
+        self._leaf_bytes = bits2bytes(capacity_bits)
+
+        self._leaf_size = leaf_size
+        self._workers = workers or os.cpu_count() or 1
+        self._pending = bytearray()
+        self._leaves = 0
+
+        # hashlib interface members
+        assert output_bits % 8 == 0
+        self.digest_size = bits2bytes(output_bits)
+        self.block_size = bits2bytes(bitrate_bits)
+
+    def __repr__(self):
+        inf = (self._outer.sponge.state.bitrate,
+               self._outer.sponge.state.b - self._outer.sponge.state.bitrate,
+               self.digest_size * 8, self._leaf_size)
+        return '<ParallelHash with r=%d, c=%d, image=%d, leaves=%d>' % inf
+
+    def copy(self):
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._outer = self._outer.copy()
+        clone._pending = bytearray(self._pending)
+        return clone
+
+    def fork(self, s=None):
+        """
+        Returns a copy of this hash with s absorbed, leaving this one unchanged.
+        """
+        return fork(self, s)
+
+    def _leaf_hashes(self, data):
+        """
+        Returns the concatenated hashes of the leaves of data, spread over
+        the worker pool when there are enough of them.
+        """
+
+        leaves = -(-len(data) // self._leaf_size)
+
+        if self._workers < 2 or leaves < 2:
+            return _hash_leaves(self._leaf_preset, self._leaf_size, self._leaf_bytes, data)
+
+        # One job per worker, each a whole number of leaves
+        per_job = -(-leaves // self._workers) * self._leaf_size
+        view = memoryview(data)
+        jobs = [(self._leaf_preset, self._leaf_size, self._leaf_bytes, bytes(view[i:i + per_job]))
+                for i in range(0, len(view), per_job)]
+
+        return b''.join(parallel_map(_hash_leaves, jobs, self._workers))
+
+    def update(self, s):
+        # Whole leaves are hashed a batch at a time, so at most one batch is ever buffered
+        leaves = max(1, min(self._workers * PARALLEL_HASH_BATCH_LEAVES, PARALLEL_HASH_MAX_BUFFER // self._leaf_size))
+        batch = leaves * self._leaf_size
+
+        view = memoryview(s).cast('B')
+        while len(view) > 0:
+            take = batch - len(self._pending)
+            self._pending += view[:take]
+            view = view[take:]
+
+            if len(self._pending) == batch:
+                self._outer.update(self._leaf_hashes(self._pending))
+                self._leaves += leaves
+                del self._pending[:]
+
+    def digest(self):
+        finalised = self._outer.copy()
+        finalised.update(self._leaf_hashes(self._pending))
+
+        leaves = self._leaves + -(-len(self._pending) // self._leaf_size)
+        finalised.update(right_encode(leaves) + right_encode(8 * self.digest_size))
+
+        return finalised.digest(self.digest_size)
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+    @staticmethod
+    def preset(bitrate_bits, capacity_bits, output_bits):
+        """
+        Returns a factory function for the given bitrate, sponge capacity and output length.
+        The function accepts an optional initial input, ala hashlib, the customization
+        string, the leaf size and the number of worker processes.
+        """
+
+        def create(initial_input=None, customization=b'', leaf_size=PARALLEL_HASH_LEAF_SIZE, workers=None):
+            h = ParallelHash(bitrate_bits, capacity_bits, output_bits, customization, leaf_size, workers)
+            if initial_input is not None:
+                h.update(initial_input)
+            return h
+
+        return create
+
+
+# ParallelHash parameter presets
+ParallelHash128 = ParallelHash.preset(1344, 256, 256)
+ParallelHash256 = ParallelHash.preset(1088, 512, 512)
@@ -5,7 +5,7 @@ https://creativecommons.org/publicdomain/zero/1.0/
 http://www.openwebfoundation.org/legal/the-owf-1-0-agreements/owfa-1-0
 """
 
-import random
+import csprng
 import functools
 import time
 import math
@@ -23,7 +23,7 @@ from pyasn1.codec.ber.decoder import decode as decode_asn1
 _PRIME = 2**1279 - 1
 # Make it this big so the secret can be up to 1279 bits
 
-_RINT = functools.partial(random.SystemRandom().randint, 0)
+_RINT = functools.partial(csprng.default.randint, 0)
 
 
 def _eval_at(poly, x, prime):
@@ -2,6 +2,7 @@ import fincrypt
 import io
 import os
 import keygen
+import tempfile
 from random import SystemRandom
 
 random = SystemRandom()
@@ -21,7 +22,61 @@ def test_decrypt(message: bytes, public_key, private_key):
     return decrypted, verified
 
 
+def check_image(public_key, private_key, size, sector_size):
+    kx, ky = public_key['kx'], public_key['ky']
+    k = private_key['k']
+    plaintext = bytearray(os.urandom(size))
+
+    image = io.BytesIO()
+    assert fincrypt.encrypt_image(kx, ky, io.BytesIO(plaintext), image, sector_size) == size
+
+    decrypted = io.BytesIO()
+    assert fincrypt.decrypt_image(k, image, decrypted) == size
+    assert decrypted.getvalue() == plaintext
+
+    # Patches that start and end part way through sectors, and span several
+    for _ in range(8):
+        offset = random.randint(0, size - 1)
+        patch = os.urandom(random.randint(1, min(3 * sector_size, size - offset)))
+        fincrypt.write_image(k, image, offset, patch)
+        plaintext[offset:offset + len(patch)] = patch
+
+        start = random.randint(0, size - 1)
+        length = random.randint(1, size - start)
+        assert fincrypt.read_image(k, image, start, length) == plaintext[start:start + length]
+
+    assert fincrypt.read_image(k, image) == plaintext
+
+
+def check_sign_file(public_key, private_key, size):
+    message = os.urandom(size)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'message')
+        with open(path, 'wb') as f:
+            f.write(message)
+
+        for signature_hash in fincrypt.SIGNATURE_HASHES:
+            signature = fincrypt.sign_file(private_key['k'], path, signature_hash)
+            assert fincrypt.authenticate_file(public_key['kx'], public_key['ky'], path, signature, signature_hash)
+            assert fincrypt.authenticate_message(public_key['kx'], public_key['ky'], message, signature,
+                                                 signature_hash)
+
+        with open(path, 'ab') as f:
+            f.write(b'\0')
+        assert not fincrypt.authenticate_file(public_key['kx'], public_key['ky'], path, signature, signature_hash)
+
+
 if __name__ == '__main__':
+    public_key, private_key = keygen.gen_key_files(key_name='Fin', key_email='example@example.com')
+    public_key, private_key = fincrypt.read_public_key(public_key), fincrypt.read_private_key(private_key)
+    for sector_size, size in ((512, 1), (512, 5000), (4096, 100000)):
+        print('Image test, sector size %s, %s bytes' % (sector_size, size))
+        check_image(public_key, private_key, size, sector_size)
+    for size in (0, 1, 100000):
+        print('Sign file test, %s bytes' % size)
+        check_sign_file(public_key, private_key, size)
+
     for i in range(32):
         public_key, private_key = keygen.gen_key_files(key_name='Fin', key_email='example@example.com')
         public_key = io.StringIO(public_key)
@@ -0,0 +1,432 @@
+import aes
+import io
+import os
+from random import SystemRandom
+
+random = SystemRandom()
+
+# FIPS-197 appendix C: (key, plaintext, ciphertext)
+BLOCK_VECTORS = [
+    ('000102030405060708090a0b0c0d0e0f',
+     '00112233445566778899aabbccddeeff', '69c4e0d86a7b0430d8cdb78070b4c55a'),
+    ('000102030405060708090a0b0c0d0e0f1011121314151617',
+     '00112233445566778899aabbccddeeff', 'dda97ca4864cdfe06eaf70a0ec0d7191'),
+    ('000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f',
+     '00112233445566778899aabbccddeeff', '8ea2b7ca516745bfeafc49904b496089'),
+]
+
+# NIST SP 800-38A appendix F
+SP800_38A_PLAINTEXT = ('6bc1bee22e409f96e93d7e117393172aae2d8a571e03ac9c9eb76fac45af8e51'
+                       '30c81c46a35ce411e5fbc1191a0a52eff69f2445df4f9b17ad2b417be66c3710')
+SP800_38A_KEY_128 = '2b7e151628aed2a6abf7158809cf4f3c'
+SP800_38A_KEY_192 = '8e73b0f7da0e6452c810f32b809079e562f8ead2522c6b7b'
+SP800_38A_KEY_256 = '603deb1015ca71be2b73aef0857d77811f352c073b6108d72d9810a30914dff4'
+SP800_38A_IV = '000102030405060708090a0b0c0d0e0f'
+SP800_38A_COUNTER = 'f0f1f2f3f4f5f6f7f8f9fafbfcfdfeff'
+
+# (mode, CFB segment size, key, iv or initial counter, plaintext length, ciphertext)
+SP800_38A_VECTORS = [
+    ('ecb', None, SP800_38A_KEY_128, None, 64,
+     '3ad77bb40d7a3660a89ecaf32466ef97f5d3d58503b9699de785895a96fdbaaf'
+     '43b1cd7f598ece23881b00e3ed0306887b0c785e27e8ad3f8223207104725dd4'),
+    ('ecb', None, SP800_38A_KEY_192, None, 64,
+     'bd334f1d6e45f25ff712a214571fa5cc974104846d0ad3ad7734ecb3ecee4eef'
+     'ef7afd2270e2e60adce0ba2face6444e9a4b41ba738d6c72fb16691603c18e0e'),
+    ('ecb', None, SP800_38A_KEY_256, None, 64,
+     'f3eed1bdb5d2a03c064b5a7e3db181f8591ccb10d410ed26dc5ba74a31362870'
+     'b6ed21b99ca6f4f9f153e7b1beafed1d23304b7a39f9f3ff067d8d8f9e24ecc7'),
+    ('cbc', None, SP800_38A_KEY_128, SP800_38A_IV, 64,
+     '7649abac8119b246cee98e9b12e9197d5086cb9b507219ee95db113a917678b2'
+     '73bed6b8e3c1743b7116e69e222295163ff1caa1681fac09120eca307586e1a7'),
+    ('cbc', None, SP800_38A_KEY_256, SP800_38A_IV, 64,
+     'f58c4c04d6e5f1ba779eabfb5f7bfbd69cfc4e967edb808d679f777bc6702c7d'
+     '39f23369a9d9bacfa530e26304231461b2eb05e2c39be9fcda6c19078c6a9d1b'),
+    ('cfb', 1, SP800_38A_KEY_128, SP800_38A_IV, 18,
+     '3b79424c9c0dd436bace9e0ed4586a4f32b9'),
+    ('cfb', 16, SP800_38A_KEY_128, SP800_38A_IV, 64,
+     '3b3fd92eb72dad20333449f8e83cfb4ac8a64537a0b3a93fcde3cdad9f1ce58b'
+     '26751f67a3cbb140b1808cf187a4f4dfc04b05357c5d1c0eeac4c66f9ff7f2e6'),
+    ('ofb', None, SP800_38A_KEY_128, SP800_38A_IV, 64,
+     '3b3fd92eb72dad20333449f8e83cfb4a7789508d16918f03f53c52dac54ed825'
+     '9740051e9c5fecf64344f7a82260edcc304c6528f659c77866a510d9c1d6ae5e'),
+    ('ctr', None, SP800_38A_KEY_128, SP800_38A_COUNTER, 64,
+     '874d6191b620e3261bef6864990db6ce9806f66b7970fdff8617187bb9fffdff'
+     '5ae4df3edbd5d35e5b4f09020db03eab1e031dda2fbe03d1792170a0f3009cee'),
+    ('ctr', None, SP800_38A_KEY_256, SP800_38A_COUNTER, 64,
+     '601ec313775789a5b7a7f504bbf3d228f443e3ca4d62b59aca84e990cacaf5c5'
+     '2b0930daa23de94ce87017ba2d84988ddfc9c58db67aada613c2dd08457941a6'),
+]
+
+# The GCM specification, test cases 2 and 3: (key, iv, plaintext, ciphertext, tag)
+GCM_VECTORS = [
+    ('00000000000000000000000000000000', '000000000000000000000000',
+     '00000000000000000000000000000000', '0388dace60b6a392f328c2b971b2fe78', 'ab6e47d42cec13bdf53a67b21257bddf'),
+    ('feffe9928665731c6d6a8f9467308308', 'cafebabefacedbaddecaf888',
+     'd9313225f88406e5a55909c5aff5269a86a7a9531534f7da2e4c303d8a318a72'
+     '1c3c0c95956809532fcf0e2449a6b525b16aedf5aa0de657ba637b391aafd255',
+     '42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e'
+     '21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091473f5985',
+     '4d5c2af327cd64a62cf35abd2ba6fab4'),
+]
+
+# IEEE 1619 appendix B, vectors 1 to 4 and 15 to 18 (ciphertext stealing):
+# (key, data unit sequence number, plaintext, ciphertext)
+XTS_VECTORS = [
+    ('00' * 32, 0, '00' * 32, '917cf69ebd68b2ec9b9fe9a3eadda692cd43d2f59598ed858c02c2652fbf922e'),
+    ('11' * 16 + '22' * 16, 0x3333333333, '44' * 32,
+     'c454185e6a16936e39334038acef838bfb186fff7480adc4289382ecd6d394f0'),
+    ('fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0' + '22' * 16, 0x3333333333, '44' * 32,
+     'af85336b597afc1a900b2eb21ec949d292df4c047e0b21532186a5971a227a89'),
+    ('2718281828459045235360287471352631415926535897932384626433832795', 0, bytes(range(256)).hex() * 2,
+     '27a7479befa1d476489f308cd4cfa6e2a96e4bbe3208ff25287dd3819616e89c'
+     'c78cf7f5e543445f8333d8fa7f56000005279fa5d8b5e4ad40e736ddb4d35412'
+     '328063fd2aab53e5ea1e0a9f332500a5df9487d07a5c92cc512c8866c7e860ce'
+     '93fdf166a24912b422976146ae20ce846bb7dc9ba94a767aaef20c0d61ad0265'
+     '5ea92dc4c4e41a8952c651d33174be51a10c421110e6d81588ede82103a252d8'
+     'a750e8768defffed9122810aaeb99f9172af82b604dc4b8e51bcb08235a6f434'
+     '1332e4ca60482a4ba1a03b3e65008fc5da76b70bf1690db4eae29c5f1badd03c'
+     '5ccf2a55d705ddcd86d449511ceb7ec30bf12b1fa35b913f9f747a8afd1b130e'
+     '94bff94effd01a91735ca1726acd0b197c4e5b03393697e126826fb6bbde8ecc'
+     '1e08298516e2c9ed03ff3c1b7860f6de76d4cecd94c8119855ef5297ca67e9f3'
+     'e7ff72b1e99785ca0a7e7720c5b36dc6d72cac9574c8cbbc2f801e23e56fd344'
+     'b07f22154beba0f08ce8891e643ed995c94d9a69c9f1b5f499027a78572aeebd'
+     '74d20cc39881c213ee770b1010e4bea718846977ae119f7a023ab58cca0ad752'
+     'afe656bb3c17256a9f6e9bf19fdd5a38fc82bbe872c5539edb609ef4f79c203e'
+     'bb140f2e583cb2ad15b4aa5b655016a8449277dbd477ef2c8d6c017db738b18d'
+     'eb4a427d1923ce3ff262735779a418f20a282df920147beabe421ee5319d0568'),
+    ('fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0bfbebdbcbbbab9b8b7b6b5b4b3b2b1b0', 0x123456789a,
+     '000102030405060708090a0b0c0d0e0f10', '6c1625db4671522d3d7599601de7ca09ed'),
+    ('fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0bfbebdbcbbbab9b8b7b6b5b4b3b2b1b0', 0x123456789a,
+     '000102030405060708090a0b0c0d0e0f1011', 'd069444b7a7e0cab09e24447d24deb1fedbf'),
+    ('fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0bfbebdbcbbbab9b8b7b6b5b4b3b2b1b0', 0x123456789a,
+     '000102030405060708090a0b0c0d0e0f101112', 'e5df1351c0544ba1350b3363cd8ef4beedbf9d'),
+    ('fffefdfcfbfaf9f8f7f6f5f4f3f2f1f0bfbebdbcbbbab9b8b7b6b5b4b3b2b1b0', 0x123456789a,
+     '000102030405060708090a0b0c0d0e0f10111213', '9d84c813f719aa2c7be3f66171c7c5c2edbf9dac'),
+]
+
+
+def make_mode(name, key, iv, segment_size=8):
+    if name == 'ctr':
+        return aes.AESModeOfOperationCTR(key, aes.Counter(int.from_bytes(iv, 'big')))
+    if name == 'cfb':
+        return aes.AESModeOfOperationCFB(key, iv, segment_size=segment_size)
+    if name == 'ecb':
+        return aes.AESModeOfOperationECB(key)
+    if name == 'gcm':
+        return aes.AESModeOfOperationGCM(key, iv[:12])
+    return aes.AESModesOfOperation[name](key, iv)
+
+
+def encrypt(name, key, iv, plaintext):
+    out = io.BytesIO()
+    aes.encrypt_stream(make_mode(name, key, iv), io.BytesIO(plaintext), out, block_size=random.randint(1, 4096))
+    return out.getvalue()
+
+
+def decrypt(name, key, iv, ciphertext):
+    out = io.BytesIO()
+    aes.decrypt_stream(make_mode(name, key, iv), io.BytesIO(ciphertext), out, block_size=random.randint(1, 4096))
+    return out.getvalue()
+
+
+def check_block_vectors(backend):
+    for key, plaintext, ciphertext in BLOCK_VECTORS:
+        cipher = aes.AES(bytes.fromhex(key), backend=backend)
+        assert bytes(cipher.encrypt(bytes.fromhex(plaintext))) == bytes.fromhex(ciphertext)
+        assert bytes(cipher.decrypt(bytes.fromhex(ciphertext))) == bytes.fromhex(plaintext)
+        assert bytes(cipher.encrypt_blocks(bytes.fromhex(plaintext) * 300)) == bytes.fromhex(ciphertext) * 300
+        assert bytes(cipher.decrypt_blocks(bytes.fromhex(ciphertext) * 300)) == bytes.fromhex(plaintext) * 300
+
+
+def test_sp800_38a_vectors():
+    for name, segment_size, key, iv, length, ciphertext in SP800_38A_VECTORS:
+        key = bytes.fromhex(key)
+        iv = bytes.fromhex(iv) if iv is not None else None
+        plaintext = bytes.fromhex(SP800_38A_PLAINTEXT)[:length]
+        ciphertext = bytes.fromhex(ciphertext)
+
+        # The vectors are unpadded; segment modes never pad
+        padding = aes.PADDING_NONE if name in ('ecb', 'cbc') else aes.PADDING_DEFAULT
+
+        encrypter = aes.Encrypter(make_mode(name, key, iv, segment_size), padding=padding)
+        assert encrypter.feed(plaintext) + encrypter.feed() == ciphertext, name
+
+        decrypter = aes.Decrypter(make_mode(name, key, iv, segment_size), padding=padding)
+        assert decrypter.feed(ciphertext) + decrypter.feed() == plaintext, name
+
+        # One block at a time through the single block API
+        mode = make_mode(name, key, iv, segment_size)
+        step = segment_size or 16
+        assert b''.join(bytes(mode.encrypt(plaintext[i:i + step]))
+                        for i in range(0, length, step)) == ciphertext, name
+
+
+def test_gcm_vectors():
+    for key, iv, plaintext, ciphertext, tag in GCM_VECTORS:
+        mode = aes.AESModeOfOperationGCM(bytes.fromhex(key), bytes.fromhex(iv))
+        assert mode.encrypt(bytes.fromhex(plaintext)) == bytes.fromhex(ciphertext)
+        assert mode.digest() == bytes.fromhex(tag)
+
+
+class IncrementCounter(object):
+    """A counter with only value and increment, as pyaes counters have."""
+
+    def __init__(self, initial_value):
+        self._value = initial_value
+
+    @property
+    def value(self):
+        return list(self._value.to_bytes(16, 'big'))
+
+    def increment(self):
+        self._value += 1
+
+
+def test_xts_vectors():
+    for key, sector, plaintext, ciphertext in XTS_VECTORS:
+        key, plaintext, ciphertext = bytes.fromhex(key), bytes.fromhex(plaintext), bytes.fromhex(ciphertext)
+
+        mode = aes.AESModeOfOperationXTS(key, len(plaintext))
+        assert mode.encrypt_sector(sector, plaintext) == ciphertext
+        assert mode.decrypt_sector(sector, ciphertext) == plaintext
+
+    # Several stolen sectors at once, serially and on the pool, agree with one at a time
+    for sector_size in (17, 100, 520):
+        key = os.urandom(random.choice([32, 64]))
+        plaintext = os.urandom(sector_size * 40)
+        single = aes.AESModeOfOperationXTS(key, sector_size)
+        expected = b''.join(single.encrypt_sector(7 + i, plaintext[i * sector_size:(i + 1) * sector_size])
+                            for i in range(40))
+
+        for mode in (single, aes.AESParallelModeOfOperationXTS(key, sector_size, workers=2, chunk_size=1024)):
+            assert bytes(mode.encrypt_sectors(7, plaintext)) == expected
+            assert bytes(mode.decrypt_sectors(7, expected)) == plaintext
+
+
+def split(data, pieces):
+    # Cuts data at random points, so pieces start and end part way through blocks
+    cuts = sorted(random.randint(0, len(data)) for _ in range(pieces - 1))
+    return [data[i:j] for i, j in zip([0] + cuts, cuts + [len(data)])]
+
+
+def test_parallel_ctr():
+    # Native backends are faster serially, so the pool is only used with the Python backend
+    aes.set_backend('python')
+    try:
+        for initial in (1, (1 << 128) - 70):
+            key = os.urandom(random.choice([16, 24, 32]))
+            plaintext = os.urandom(random.randint(8000, 12000))
+            expected = aes.AESModeOfOperationCTR(key, aes.Counter(initial)).encrypt(plaintext)
+
+            mode = aes.AESParallelModeOfOperationCTR(key, aes.Counter(initial), workers=2, chunk_size=1024)
+            assert mode.encrypt(plaintext) == expected
+
+            # Split across calls, with a partial final block
+            mode = aes.AESParallelModeOfOperationCTR(key, aes.Counter(initial), workers=2, chunk_size=1024)
+            assert b''.join(mode.encrypt(piece) for piece in split(plaintext[:-5], 4)) == expected[:-5]
+            assert mode.encrypt(plaintext[-5:]) == expected[-5:]
+
+            mode = aes.AESParallelModeOfOperationCTR(key, aes.Counter(initial), workers=2, chunk_size=1024)
+            assert mode.decrypt(expected) == plaintext
+    finally:
+        aes.set_backend(None)
+
+
+def test_parallel_cbc():
+    aes.set_backend('python')
+    try:
+        key = os.urandom(random.choice([16, 24, 32]))
+        iv = os.urandom(16)
+        plaintext = os.urandom(16 * random.randint(500, 700))
+        ciphertext = bytes(aes.AESModeOfOperationCBC(key, iv).encrypt_blocks(plaintext))
+
+        mode = aes.AESParallelModeOfOperationCBC(key, iv, workers=2, chunk_size=1024)
+        assert bytes(mode.decrypt_blocks(ciphertext)) == plaintext
+
+        # Chained calls carry the last ciphertext block over, whether or not they use the pool
+        mode = aes.AESParallelModeOfOperationCBC(key, iv, workers=2, chunk_size=1024)
+        cuts = [0, 16 * 3, 16 * 200, 16 * 201, len(ciphertext)]
+        assert b''.join(bytes(mode.decrypt_blocks(ciphertext[i:j])) for i, j in zip(cuts, cuts[1:])) == plaintext
+
+        # Through the streaming decrypter, with padding
+        encrypter = aes.Encrypter(aes.AESModeOfOperationCBC(key, iv))
+        padded = encrypter.feed(plaintext[:-7]) + encrypter.feed()
+        decrypter = aes.Decrypter(aes.AESParallelModeOfOperationCBC(key, iv, workers=2, chunk_size=1024))
+        assert decrypter.feed(padded) + decrypter.feed() == plaintext[:-7]
+    finally:
+        aes.set_backend(None)
+
+
+def test_ctr_seek():
+    for initial in (random.getrandbits(64), (1 << 128) - 20):
+        key = os.urandom(random.choice([16, 24, 32]))
+        plaintext = os.urandom(16 * 50 + 5)
+        expected = aes.AESModeOfOperationCTR(key, aes.Counter(initial)).encrypt(plaintext)
+
+        for n in (0, 1, 17, 50):
+            mode = aes.AESModeOfOperationCTR(key, aes.Counter(initial), block_index=n)
+            assert mode.encrypt(plaintext[16 * n:]) == expected[16 * n:], n
+
+        # Seeking drops any keystream left over from a partial block
+        mode = aes.AESModeOfOperationCTR(key, aes.Counter(initial))
+        mode.encrypt(plaintext[:37])
+        mode.seek(5)
+        assert mode.encrypt(plaintext[80:]) == expected[80:]
+        mode.seek(0)
+        assert mode.encrypt(plaintext) == expected
+
+        counter = aes.Counter(initial)
+        counter.advance(30)
+        counter.seek(25)
+        assert counter.value_bytes == ((initial + 25) % (1 << 128)).to_bytes(16, 'big')
+
+
+def test_prefetch():
+    key = os.urandom(random.choice([16, 24, 32]))
+    iv = os.urandom(16)
+    plaintext = os.urandom(3 * aes.PREFETCH_CHUNK_SIZE + 100)
+
+    for name in ('ctr', 'ofb'):
+        expected = encrypt(name, key, iv, plaintext)
+
+        def make(prefetch):
+            if name == 'ctr':
+                return aes.AESModeOfOperationCTR(key, aes.Counter(int.from_bytes(iv, 'big')), prefetch=prefetch)
+            return aes.AESModeOfOperationOFB(key, iv, prefetch=prefetch)
+
+        mode = make(True)
+        pieces = split(plaintext, 6)
+        assert b''.join(mode.encrypt(piece) for piece in pieces) == expected, name
+        mode.close()
+
+        # Closing part way through keeps the stream position
+        mode = make(True)
+        head = mode.encrypt(plaintext[:1000])
+        mode.close()
+        assert head + mode.encrypt(plaintext[1000:]) == expected, name
+
+    # Seeking restarts the prefetcher at the new position
+    mode = aes.AESModeOfOperationCTR(key, aes.Counter(int.from_bytes(iv, 'big')), prefetch=True)
+    expected = encrypt('ctr', key, iv, plaintext)
+    mode.encrypt(plaintext[:5000])
+    mode.seek(100)
+    assert mode.encrypt(plaintext[1600:]) == expected[1600:]
+    mode.close()
+    mode.seek(3)
+    assert mode.encrypt(plaintext[48:100]) == expected[48:100]
+
+
+def test_ctr_custom_counter():
+    key = os.urandom(16)
+    plaintext = os.urandom(1000)
+
+    ciphertext = aes.AESModeOfOperationCTR(key, IncrementCounter(7)).encrypt(plaintext)
+    assert ciphertext == aes.AESModeOfOperationCTR(key, aes.Counter(7)).encrypt(plaintext)
+
+    try:
+        aes.AESModeOfOperationCTR(key, IncrementCounter(7), block_index=3)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('seek on a counter without seek must fail')
+
+
+def test_bitsliced_engine():
+    # Only chosen when NumPy is missing, so it is checked directly: one
+    # full batch followed by a partial one
+    blocks = aes.BITSLICE_BATCH_BLOCKS + 3
+
+    for key, plaintext, ciphertext in BLOCK_VECTORS:
+        cipher = aes.AES(bytes.fromhex(key), backend='python')
+        engine = aes.BitslicedAES(cipher)
+        plaintext, ciphertext = bytes.fromhex(plaintext), bytes.fromhex(ciphertext)
+
+        assert bytes(engine.encrypt_blocks(plaintext * blocks)) == ciphertext * blocks
+        assert bytes(engine.decrypt_blocks(ciphertext * blocks)) == plaintext * blocks
+
+        data = os.urandom(16 * blocks)
+        scalar = b''.join(bytes(cipher.encrypt(data[i:i + 16])) for i in range(0, len(data), 16))
+        assert bytes(engine.encrypt_blocks(data)) == scalar
+        assert bytes(engine.decrypt_blocks(scalar)) == data
+
+        # A tail on its own, which must not be cached
+        assert bytes(engine.encrypt_blocks(data[:80])) == scalar[:80]
+        assert list(engine._key_planes) == [aes.BITSLICE_BATCH_BLOCKS]
+
+
+def test_lazy_decryption_keys():
+    # Bulk encryption must not expand the decryption round keys
+    cipher = aes.AES(os.urandom(32), backend='python')
+    plaintext = os.urandom(1 << 16)
+
+    ciphertext = bytes(cipher.encrypt_blocks(plaintext))
+    assert cipher._kd is None
+    assert bytes(cipher.decrypt_blocks(ciphertext)) == plaintext
+
+
+def test_cbc_batch():
+    jobs = [(os.urandom(random.choice([16, 24, 32])), os.urandom(16), os.urandom(random.randint(0, 3000)))
+            for _ in range(300)]
+
+    for backend in aes.available_backends():
+        aes.set_backend(backend)
+        for (key, iv, plaintext), ciphertext in zip(jobs, aes.encrypt_cbc_batch(jobs)):
+            assert ciphertext == encrypt('cbc', key, iv, plaintext)
+    aes.set_backend(None)
+
+    # The lanes only ever encrypt, and narrowing them must not expand keys again
+    ciphers = [aes.AES(os.urandom(16), backend='python') for _ in range(64)]
+    engine = aes._lane_engine(ciphers)
+    narrowed = aes._narrow_lane_engine(engine, ciphers[:5])
+    blocks = os.urandom(16 * 64)
+    assert bytes(narrowed.encrypt_blocks(blocks[:80])) == bytes(engine.encrypt_blocks(blocks))[:80]
+    assert all(cipher._kd is None for cipher in ciphers)
+
+
+def check_modes_agree(backends, size):
+    key = os.urandom(random.choice([16, 24, 32]))
+    iv = os.urandom(16)
+    plaintext = os.urandom(size)
+
+    for name in sorted(aes.AESModesOfOperation):
+        results = set()
+        for backend in backends:
+            aes.set_backend(backend)
+            ciphertext = encrypt(name, key, iv, plaintext)
+            assert decrypt(name, key, iv, ciphertext) == plaintext
+            results.add(ciphertext)
+        assert len(results) == 1, name
+
+    aes.set_backend(None)
+
+
+if __name__ == '__main__':
+    # Every mode must have known answers
+    assert set(aes.AESModesOfOperation) == set(vector[0] for vector in SP800_38A_VECTORS) | {'gcm'}
+
+    backends = aes.available_backends()
+    print('Backends: %s (default %s)' % (', '.join(backends), aes.get_backend().name))
+
+    for backend in backends:
+        print('Known answer tests, backend %s' % backend)
+        aes.set_backend(backend)
+        check_block_vectors(backend)
+        test_sp800_38a_vectors()
+        test_gcm_vectors()
+        test_xts_vectors()
+        test_ctr_custom_counter()
+        test_ctr_seek()
+        test_prefetch()
+    aes.set_backend(None)
+
+    test_bitsliced_engine()
+    test_lazy_decryption_keys()
+    test_parallel_ctr()
+    test_parallel_cbc()
+    test_cbc_batch()
+
+    for i in range(16):
+        size = random.randint(0, 1 << random.randint(4, 16))
+        print('Cross-backend test %s, %s bytes' % (i + 1, size))
+        check_modes_agree(backends, size)
+    print('Done')
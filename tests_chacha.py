@@ -0,0 +1,141 @@
+import chacha
+import fincrypt
+import keygen
+import os
+from random import SystemRandom
+
+random = SystemRandom()
+
+SUNSCREEN = (b"Ladies and Gentlemen of the class of '99: If I could offer you only one tip for the future, "
+             b"sunscreen would be it.")
+
+# RFC 8439 section 2.3.2: (key, nonce, counter, keystream block)
+BLOCK_VECTORS = [
+    ('000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f', '000000090000004a00000000', 1,
+     '10f1e7e4d13b5915500fdd1fa32071c4c7d1f4c733c068030422aa9ac3d46c4e'
+     'd2826446079faa0914c2d705d98b02a2b5129cd1de164eb9cbd083e8a2503c4e'),
+]
+
+# RFC 8439 section 2.4.2: (key, nonce, counter, plaintext, ciphertext)
+ENCRYPTION_VECTORS = [
+    ('000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f', '000000000000004a00000000', 1,
+     SUNSCREEN,
+     '6e2e359a2568f98041ba0728dd0d6981e97e7aec1d4360c20a27afccfd9fae0b'
+     'f91b65c5524733ab8f593dabcd62b3571639d624e65152ab8f530c359f0861d8'
+     '07ca0dbf500d6a6156a38e088a22b65e52bc514d16ccf806818ce91ab7793736'
+     '5af90bbf74a35be6b40b8eedf2785e42874d'),
+]
+
+# RFC 8439 section 2.5.2: (key, message, tag)
+POLY1305_VECTORS = [
+    ('85d6be7857556d337f4452fe42d506a80103808afb0db2fd4abff6af4149f51b', b'Cryptographic Forum Research Group',
+     'a8061dc1305136c6c22b8baf0c0127a9'),
+]
+
+# RFC 8439 section 2.8.2: (key, nonce, associated data, plaintext, ciphertext, tag)
+AEAD_VECTORS = [
+    ('808182838485868788898a8b8c8d8e8f909192939495969798999a9b9c9d9e9f', '070000004041424344454647',
+     '50515253c0c1c2c3c4c5c6c7', SUNSCREEN,
+     'd31a8d34648e60db7b86afbc53ef7ec2a4aded51296e08fea9e2b5a736ee62d6'
+     '3dbea45e8ca9671282fafb69da92728b1a71de0a9e060b2905d6a5b67ecd3b36'
+     '92ddbd7f2d778b8c9803aee328091b58fab324e4fad675945585808b4831d7bc'
+     '3ff4def08e4b7a9de576d26586cec64b6116',
+     '1ae10b594f09e26a7e902ecbd0600691'),
+]
+
+
+def test_block_vectors():
+    for key, nonce, counter, block in BLOCK_VECTORS:
+        assert chacha.chacha20_keystream(bytes.fromhex(key), bytes.fromhex(nonce), counter, 1) == bytes.fromhex(block)
+
+
+def test_encryption_vectors():
+    for key, nonce, counter, plaintext, ciphertext in ENCRYPTION_VECTORS:
+        key, nonce, ciphertext = bytes.fromhex(key), bytes.fromhex(nonce), bytes.fromhex(ciphertext)
+        assert chacha.chacha20_encrypt(key, nonce, plaintext, counter) == ciphertext
+        assert chacha.chacha20_encrypt(key, nonce, ciphertext, counter) == plaintext
+
+
+def test_poly1305_vectors():
+    for key, message, tag in POLY1305_VECTORS:
+        assert chacha.poly1305(bytes.fromhex(key), message) == bytes.fromhex(tag)
+
+
+def test_aead_vectors():
+    for key, nonce, associated_data, plaintext, ciphertext, tag in AEAD_VECTORS:
+        aead = chacha.ChaCha20Poly1305(bytes.fromhex(key))
+        nonce, associated_data = bytes.fromhex(nonce), bytes.fromhex(associated_data)
+        sealed = bytes.fromhex(ciphertext + tag)
+
+        assert aead.encrypt(nonce, plaintext, associated_data) == sealed
+        assert aead.decrypt(nonce, sealed, associated_data) == plaintext
+
+
+def test_tag_failure():
+    aead = chacha.ChaCha20Poly1305(os.urandom(chacha.KEY_SIZE))
+    nonce = os.urandom(chacha.NONCE_SIZE)
+    sealed = aead.encrypt(nonce, os.urandom(100), b'header')
+
+    for tampered, associated_data in ((sealed[:10] + bytes([sealed[10] ^ 1]) + sealed[11:], b'header'),
+                                      (sealed[:-1] + bytes([sealed[-1] ^ 1]), b'header'),
+                                      (sealed, b'Header'),
+                                      (sealed[:chacha.TAG_SIZE - 1], b'header')):
+        try:
+            aead.decrypt(nonce, tampered, associated_data)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('tampered message was accepted')
+
+
+def check_batch_lanes(blocks):
+    # The packed lanes must give the same keystream as one block at a time
+    key = os.urandom(chacha.KEY_SIZE)
+    nonce = os.urandom(chacha.NONCE_SIZE)
+    counter = random.randint(0, (1 << 32) - blocks)
+
+    single = b''.join(chacha.chacha20_keystream(key, nonce, counter + i, 1) for i in range(blocks))
+    assert chacha.chacha20_keystream(key, nonce, counter, blocks) == single
+
+
+def check_message_round_trip(public_key, private_key, size):
+    message = os.urandom(size)
+
+    encrypted_key, encrypted_message = fincrypt.encrypt_message(public_key['kx'], public_key['ky'], message,
+                                                                fincrypt.MESSAGE_VERSION_CHACHA)
+    # The message format stores the key point as plain ints
+    encrypted_key = [int(coordinate) for coordinate in encrypted_key]
+
+    assert fincrypt.decrypt_message(private_key['k'], encrypted_key, encrypted_message,
+                                    fincrypt.MESSAGE_VERSION_CHACHA) == message
+
+    tampered = bytearray(encrypted_message)
+    tampered[random.randrange(len(tampered))] ^= 1
+    try:
+        fincrypt.decrypt_message(private_key['k'], encrypted_key, bytes(tampered), fincrypt.MESSAGE_VERSION_CHACHA)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('tampered message was accepted')
+
+
+if __name__ == '__main__':
+    print('Known answer tests')
+    test_block_vectors()
+    test_encryption_vectors()
+    test_poly1305_vectors()
+    test_aead_vectors()
+    test_tag_failure()
+
+    for blocks in (2, 3, 17, chacha.CHACHA_BATCH_BLOCKS + 5):
+        print('Batch lane test, %s blocks' % blocks)
+        check_batch_lanes(blocks)
+
+    public_key, private_key = keygen.gen_key_files(key_name='Fin', key_email='example@example.com')
+    public_key = fincrypt.read_public_key(public_key)
+    private_key = fincrypt.read_private_key(private_key)
+    for i in range(4):
+        size = random.randint(0, 1 << random.randint(4, 16))
+        print('Message version 3 test %s, %s bytes' % (i + 1, size))
+        check_message_round_trip(public_key, private_key, size)
+    print('Done')
@@ -0,0 +1,139 @@
+import csprng
+import os
+import sha
+
+
+def next_block(generator, n):
+    # The first n bytes the generator's next refill would produce, if it does not reseed
+    return sha.SHAKE256(generator._key).digest(csprng.SEED_SIZE + n)[csprng.SEED_SIZE:]
+
+
+def draws(generator):
+    return (generator.randint(0, 10 ** 30), generator.randbytes(100), generator.getrandbits(777),
+            generator.random(), generator.randbytes(2 * csprng.BUFFER_SIZE))
+
+
+def test_seeded_output():
+    for seed in (0, 1, -1, 2 ** 100, 'seed', b'seed'):
+        assert draws(csprng.ShakeRandom(seed)) == draws(csprng.ShakeRandom(seed)), seed
+
+    assert draws(csprng.ShakeRandom(1)) != draws(csprng.ShakeRandom(2))
+    assert draws(csprng.ShakeRandom(b'1')) != draws(csprng.ShakeRandom(1))
+
+    generator = csprng.ShakeRandom(1)
+    first = draws(generator)
+    generator.seed(1)
+    assert draws(generator) == first
+
+
+def test_unseeded_output():
+    assert draws(csprng.ShakeRandom()) != draws(csprng.ShakeRandom())
+
+    generator = csprng.ShakeRandom(1)
+    generator.seed()
+    assert not generator.deterministic
+    assert draws(generator) != draws(csprng.ShakeRandom(1))
+
+
+def test_reseed_interval():
+    # After exactly RESEED_INTERVAL bytes the buffer is empty and the next refill reseeds first
+    for seed, reseeds in ((None, True), (1, False)):
+        generator = csprng.ShakeRandom(seed)
+        generator.randbytes(csprng.RESEED_INTERVAL)
+
+        expected = next_block(generator, 32)
+        assert (generator.randbytes(32) != expected) == reseeds, seed
+
+
+def test_consumed_output_is_wiped():
+    generator = csprng.ShakeRandom()
+    for n in (16, 32, 100):
+        assert generator._buffer.find(generator.randbytes(n)) == -1
+        assert generator._buffer.find(generator.getrandbits(8 * n).to_bytes(n, 'little')) == -1
+    assert not any(generator._buffer[:generator._position])
+
+
+def test_getrandbits_range():
+    generator = csprng.ShakeRandom()
+    for k in range(0, 300):
+        for _ in range(20):
+            assert 0 <= generator.getrandbits(k) < 2 ** k
+    assert generator.getrandbits(0) == 0
+
+
+def test_negative_arguments():
+    generator = csprng.ShakeRandom()
+    for func in (generator.randbytes, generator.getrandbits):
+        try:
+            func(-1)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('negative argument was accepted')
+
+
+def test_random_methods():
+    generator = csprng.ShakeRandom(1)
+    values = [generator.gauss(0, 1) for _ in range(10)]
+    generator.seed(1)
+    assert [generator.gauss(0, 1) for _ in range(10)] == values
+
+    items = list(range(100))
+    generator.shuffle(items)
+    assert sorted(items) == list(range(100))
+    assert generator.choice(items) in items
+    assert 0 <= generator.uniform(0, 1) <= 1
+
+    for func, args in ((generator.getstate, ()), (generator.setstate, (None,))):
+        try:
+            func(*args)
+        except TypeError:
+            pass
+        else:
+            raise AssertionError('generator state was exposed')
+
+
+def test_fork():
+    if not hasattr(os, 'fork'):
+        return
+
+    generator = csprng.ShakeRandom()
+    generator.randbytes(10)
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        os.write(write, generator.randbytes(32) + csprng.default.randbytes(32))
+        os._exit(0)
+
+    os.close(write)
+    child = b''
+    while len(child) < 64:
+        chunk = os.read(read, 64 - len(child))
+        if not chunk:
+            break
+        child += chunk
+    os.close(read)
+    os.waitpid(pid, 0)
+
+    assert len(child) == 64
+    assert child[:32] != generator.randbytes(32)
+    assert child[32:] != csprng.default.randbytes(32)
+
+
+if __name__ == '__main__':
+    print('Seeded generator tests')
+    test_seeded_output()
+    print('Unseeded generator tests')
+    test_unseeded_output()
+    print('Reseed tests')
+    test_reseed_interval()
+    test_consumed_output_is_wiped()
+    print('Range tests')
+    test_getrandbits_range()
+    test_negative_arguments()
+    test_random_methods()
+    print('Fork tests')
+    test_fork()
+    print('Done')
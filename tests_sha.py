@@ -0,0 +1,326 @@
+import hashlib
+import io
+import os
+import parallel
+import sha
+import tempfile
+from random import SystemRandom
+
+random = SystemRandom()
+
+# NIST example values for the empty string, 'abc' and 200 bytes of 0xa3: (preset, message, digest)
+SHA3_VECTORS = [
+    ('SHA3_224', b'', '6b4e03423667dbb73b6e15454f0eb1abd4597f9a1b078e3f5b5a6bc7'),
+    ('SHA3_256', b'', 'a7ffc6f8bf1ed76651c14756a061d662f580ff4de43b49fa82d80a4b80f8434a'),
+    ('SHA3_384', b'', '0c63a75b845e4f7d01107d852e4c2485c51a50aaaa94fc61995e71bbee983a2a'
+                      'c3713831264adb47fb6bd1e058d5f004'),
+    ('SHA3_512', b'', 'a69f73cca23a9ac5c8b567dc185a756e97c982164fe25859e0d1dcc1475c80a6'
+                      '15b2123af1f5f94c11e3e9402c3ac558f500199d95b6d3e301758586281dcd26'),
+    ('SHA3_224', b'abc', 'e642824c3f8cf24ad09234ee7d3c766fc9a3a5168d0c94ad73b46fdf'),
+    ('SHA3_256', b'abc', '3a985da74fe225b2045c172d6bd390bd855f086e3e9d525b46bfe24511431532'),
+    ('SHA3_384', b'abc', 'ec01498288516fc926459f58e2c6ad8df9b473cb0fc08c2596da7cf0e49be4b2'
+                         '98d88cea927ac7f539f1edf228376d25'),
+    ('SHA3_512', b'abc', 'b751850b1a57168a5693cd924b6b096e08f621827444f70d884f5d0240d2712e'
+                         '10e116e9192af3c91a7ec57647e3934057340b4cf408d5a56592f8274eec53f0'),
+    ('SHA3_224', b'\xa3' * 200, '9376816aba503f72f96ce7eb65ac095deee3be4bf9bbc2a1cb7e11e0'),
+    ('SHA3_256', b'\xa3' * 200, '79f38adec5c20307a98ef76e8324afbfd46cfd81b22e3973c65fa1bd9de31787'),
+    ('SHA3_384', b'\xa3' * 200, '1881de2ca7e41ef95dc4732b8f5f002b189cc1e42b74168ed1732649ce1dbcdd'
+                                '76197a31fd55ee989f2d7050dd473e8f'),
+    ('SHA3_512', b'\xa3' * 200, 'e76dfad22084a8b1467fcf2ffa58361bec7628edf5f3fdc0e4805dc48caeeca8'
+                                '1b7c13c30adf52a3659584739a2df46be589c51ca1a4a8416df6545a1ce8ba00'),
+]
+
+# (preset, message, digest); the digest length is the output length
+SHAKE_VECTORS = [
+    ('SHAKE128', b'', '7f9c2ba4e88f827d616045507605853ed73b8093f6efbc88eb1a6eacfa66ef26'),
+    ('SHAKE256', b'', '46b9dd2b0ba88d13233b3feb743eeb243fcd52ea62b81b82b50c27646ed5762f'
+                      'd75dc4ddd8c0f200cb05019d67b592f6fc821c49479ab48640292eacb3b7c4be'),
+    ('SHAKE128', b'\xa3' * 200, '131ab8d2b594946b9c81333f9bb6e0ce75c3b93104fa3469d3917457385da037'),
+    ('SHAKE256', b'\xa3' * 200, 'cd8a920ed141aa0407a22d59288652e9d9f1a7ee0c1e7c1ca699424da84a904d'),
+]
+
+# Original Keccak submission values, before the SHA3 domain separation bits
+KECCAK_VECTORS = [
+    ('Keccak224', b'', 'f71837502ba8e10837bdd8d365adb85591895602fc552b48b7390abd'),
+    ('Keccak256', b'', 'c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470'),
+    ('Keccak384', b'', '2c23146a63a29acf99e73b88f8c24eaa7dc60aa771780ccc006afbfa8fe2479b'
+                       '2dd2b21362337441ac12b515911957ff'),
+    ('Keccak512', b'', '0eab42de4c3ceb9235fc91acffe746b29c29a8c366b7c60e4e67c466f36a4304'
+                       'c00fa9caf9d87976ba469bcbe06713b435f091ef2769fb160cdab33d3670680e'),
+    ('Keccak256', b'abc', '4e03657aea45a94fc7d47ba826c8d667c0d1e6e33a64a036ec44f58fa12d6c45'),
+]
+
+# NIST SP 800-185 samples: (preset, message, customization, leaf size, digest)
+SP800_185_X = bytes.fromhex('000102030405060710111213141516172021222324252627')
+PARALLEL_HASH_VECTORS = [
+    ('ParallelHash128', SP800_185_X, b'', 8,
+     'ba8dc1d1d979331d3f813603c67f72609ab5e44b94a0b8f9af46514454a2b4f5'),
+    ('ParallelHash256', SP800_185_X, b'', 8,
+     'bc1ef124da34495e948ead207dd9842235da432d2bbc54b4c110e64c45110553'
+     '1b7f2a3e0ce055c02805e7c2de1fb746af97a1dd01f43b824e31b87612410429'),
+    ('ParallelHash256', SP800_185_X, b'Parallel Data', 8,
+     'cdf15289b54f6212b4bc270528b49526006dd9b54e2b6add1ef6900dda3963bb'
+     '33a72491f236969ca8afaea29c682d47a393c065b38e29fae651a2091c833110'),
+]
+
+CSHAKE_VECTORS = [
+    ('CSHAKE128', bytes.fromhex('00010203'), b'Email Signature',
+     'c1c36925b6409a04f1b504fcbca9d82b4017277cb5ed2b2065fc1d3814d5aaf5'),
+]
+
+# Preset: (rate in bytes, output length in bytes, domain separation suffix, hashlib name)
+PRESETS = {
+    'Keccak224': (144, 28, 0x01, None),
+    'Keccak256': (136, 32, 0x01, None),
+    'Keccak384': (104, 48, 0x01, None),
+    'Keccak512': (72, 64, 0x01, None),
+    'SHA3_224': (144, 28, 0x06, 'sha3_224'),
+    'SHA3_256': (136, 32, 0x06, 'sha3_256'),
+    'SHA3_384': (104, 48, 0x06, 'sha3_384'),
+    'SHA3_512': (72, 64, 0x06, 'sha3_512'),
+    'SHAKE128': (168, 200, 0x1f, 'shake_128'),
+    'SHAKE256': (136, 200, 0x1f, 'shake_256'),
+}
+
+
+def reference_keccak(rate, suffix, message, length):
+    """
+    A straightforward Keccak sponge written from the FIPS 202 description,
+    sharing no code with sha.py, to check the padding of every preset.
+    """
+
+    def rotate(lane, n):
+        return ((lane << n) | (lane >> (64 - n))) & ((1 << 64) - 1)
+
+    def permute(a):
+        rc = 1
+        for _ in range(24):
+            c = [a[x][0] ^ a[x][1] ^ a[x][2] ^ a[x][3] ^ a[x][4] for x in range(5)]
+            d = [c[(x - 1) % 5] ^ rotate(c[(x + 1) % 5], 1) for x in range(5)]
+            a = [[a[x][y] ^ d[x] for y in range(5)] for x in range(5)]
+
+            # rho and pi, walking the 24 lanes other than (0, 0)
+            b = [[0] * 5 for _ in range(5)]
+            b[0][0] = a[0][0]
+            x, y = 1, 0
+            for t in range(24):
+                b[y][(2 * x + 3 * y) % 5] = rotate(a[x][y], ((t + 1) * (t + 2) // 2) % 64)
+                x, y = y, (2 * x + 3 * y) % 5
+
+            a = [[b[x][y] ^ (~b[(x + 1) % 5][y] & b[(x + 2) % 5][y]) for y in range(5)] for x in range(5)]
+
+            # iota, with the round constants from the LFSR
+            for j in range(7):
+                if rc & 1:
+                    a[0][0] ^= 1 << ((1 << j) - 1)
+                rc = (rc << 1) ^ (0x171 if rc & 0x80 else 0)
+        return a
+
+    padded = bytearray(message) + bytes([suffix])
+    padded += bytes(-len(padded) % rate)
+    padded[-1] |= 0x80
+
+    a = [[0] * 5 for _ in range(5)]
+    for i in range(0, len(padded), rate):
+        for j in range(rate // 8):
+            a[j % 5][j // 5] ^= int.from_bytes(padded[i + 8 * j:i + 8 * j + 8], 'little')
+        a = permute(a)
+
+    out = b''
+    while len(out) < length:
+        out += b''.join(a[j % 5][j // 5].to_bytes(8, 'little') for j in range(rate // 8))
+        a = permute(a)
+    return out[:length]
+
+
+def digest(name, message, length):
+    h = getattr(sha, name)(message)
+    return h.digest(length) if name.startswith('SHAKE') else h.digest()
+
+
+def test_padding_functions():
+    for padfn, first, only in ((sha.multirate_padding, 0x01, 0x81), (sha.sha_padding, 0x06, 0x86),
+                               (sha.shake_padding, 0x1f, 0x9f), (sha.cshake_padding, 0x04, 0x84)):
+        for rate in (72, 104, 136, 144, 168):
+            for used in range(rate):
+                pad = padfn(used, rate)
+                assert (used + len(pad)) % rate == 0, (padfn.__name__, rate, used)
+                if len(pad) == 1:
+                    assert pad == [only]
+                else:
+                    assert pad[0] == first and pad[-1] == 0x80 and not any(pad[1:-1])
+
+    # The SHA3 and SHAKE padding wrap around the rate; Keccak's is only given partial blocks
+    assert sha.sha_padding(136, 136) == sha.sha_padding(0, 136)
+    assert sha.shake_padding(168 * 3 + 167, 168) == [0x9f]
+
+
+def test_vectors():
+    for name, message, expected in SHA3_VECTORS + KECCAK_VECTORS + SHAKE_VECTORS:
+        assert digest(name, message, len(expected) // 2).hex() == expected, name
+
+    for name, message, customization, leaf_size, expected in PARALLEL_HASH_VECTORS:
+        h = getattr(sha, name)(message, customization=customization, leaf_size=leaf_size, workers=1)
+        assert h.hexdigest() == expected, name
+
+    for name, message, customization, expected in CSHAKE_VECTORS:
+        h = getattr(sha, name)(message, customization=customization)
+        assert h.hexdigest(len(expected) // 2) == expected, name
+
+
+def test_padding_edge_cases():
+    # Every message length that leaves 1, 2 or more bytes of padding, for zero to two full blocks before it
+    for name, (rate, length, suffix, hashlib_name) in sorted(PRESETS.items()):
+        lengths = sorted({blocks * rate + extra for blocks in range(3) for extra in (0, 1, rate - 2, rate - 1)})
+
+        for size in lengths:
+            message = os.urandom(size)
+            expected = reference_keccak(rate, suffix, message, length)
+            assert digest(name, message, length) == expected, (name, size)
+
+            if hashlib_name is not None:
+                h = getattr(hashlib, hashlib_name)(message)
+                assert (h.digest(length) if name.startswith('SHAKE') else h.digest()) == expected, (name, size)
+
+
+def check_incremental(size):
+    message = os.urandom(size)
+
+    for name, (rate, length, suffix, hashlib_name) in sorted(PRESETS.items()):
+        h = getattr(sha, name)()
+        i = 0
+        while i < size:
+            step = random.randint(0, 2 * rate)
+            h.update(message[i:i + step])
+            i += step
+
+        got = h.copy().digest(length) if name.startswith('SHAKE') else h.copy().digest()
+        assert got == digest(name, message, length), name
+
+    # Readers and file hashing agree with one-shot hashing
+    reader = sha.xof_reader(sha.SHAKE256(message))
+    out = b''.join(reader.read(random.randint(0, 300)) for _ in range(8))
+    assert out == sha.SHAKE256(message).digest(len(out))
+
+    assert sha.hash_stream(io.BytesIO(message), chunk_size=random.randint(1, 4096)).digest() == \
+        sha.SHA3_512(message).digest()
+
+
+def test_hash_file():
+    # An empty file cannot be memory mapped, so it takes the stream path
+    for size, chunk_size in ((0, 4096), (1, 4096), (5000, 4096), (10000, 1000), (3000, sha.HASH_CHUNK_SIZE)):
+        message = os.urandom(size)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'message')
+            with open(path, 'wb') as f:
+                f.write(message)
+
+            for factory in (sha.SHA3_512, sha.Keccak256, sha.ParallelHash256):
+                expected = factory(message).digest()
+                assert sha.hash_file(path, factory, chunk_size).digest() == expected, (size, factory)
+                assert sha.hash_stream(io.BytesIO(message), factory, chunk_size).digest() == expected
+
+            assert sha.hash_file(path, sha.SHAKE256, chunk_size).digest(100) == sha.SHAKE256(message).digest(100)
+
+
+def test_fork():
+    prefix, suffix = os.urandom(300), os.urandom(200)
+
+    for name, (rate, length, _, _) in sorted(PRESETS.items()):
+        h = getattr(sha, name)(prefix)
+        for tail in (suffix, b'', None):
+            branch = sha.fork(h, tail)
+            got = branch.digest(length) if name.startswith('SHAKE') else branch.digest()
+            assert got == digest(name, prefix + (tail or b''), length), name
+
+        got = h.digest(length) if name.startswith('SHAKE') else h.digest()
+        assert got == digest(name, prefix, length), name
+
+    # Forking after the customization prefix is absorbed, as signature hashes do
+    h = sha.CSHAKE256(customization=b'prefix')
+    assert h.fork(suffix).digest(64) == sha.CSHAKE256(suffix, customization=b'prefix').digest(64)
+
+    h = sha.ParallelHash256(customization=b'prefix', leaf_size=1000)
+    assert h.fork(suffix).digest() == sha.ParallelHash256(suffix, customization=b'prefix', leaf_size=1000).digest()
+    assert h.fork().digest() == sha.ParallelHash256(customization=b'prefix', leaf_size=1000).digest()
+
+
+def test_hash_batch():
+    messages = [os.urandom(random.randint(0, 600)) for _ in range(16)]
+    assert sha.hash_batch(messages, sha.Keccak256) == [sha.Keccak256(m).digest() for m in messages]
+    assert sha.hash_batch(messages, sha.SHA3_256) == [sha.SHA3_256(m).digest() for m in messages]
+    assert sha.hash_batch(messages, sha.SHAKE128, 300) == [sha.SHAKE128(m).digest(300) for m in messages]
+
+
+def test_parallel_hash_workers():
+    # Enough small leaves that updates hand whole batches to the worker pool
+    message = os.urandom(20 * 1000 + random.randint(1, 999))
+
+    for factory in (sha.ParallelHash128, sha.ParallelHash256):
+        expected = factory(message, leaf_size=1000, workers=1).digest()
+        assert factory(message, leaf_size=1000, workers=2).digest() == expected
+
+        h = factory(leaf_size=1000, workers=2)
+        i = 0
+        while i < len(message):
+            step = random.randint(0, 3000)
+            h.update(message[i:i + step])
+            i += step
+        assert h.digest() == expected
+
+    # The buffer stays under the cap however many workers there are
+    max_buffer = sha.PARALLEL_HASH_MAX_BUFFER
+    sha.PARALLEL_HASH_MAX_BUFFER = 4000
+    try:
+        h = sha.ParallelHash256(leaf_size=1000, workers=64)
+        for i in range(0, len(message), 1500):
+            h.update(message[i:i + 1500])
+            assert len(h._pending) < 4000
+        assert h.digest() == sha.ParallelHash256(message, leaf_size=1000, workers=1).digest()
+    finally:
+        sha.PARALLEL_HASH_MAX_BUFFER = max_buffer
+
+    # Pools are shut down cleanly, and created again when next needed
+    parallel.shutdown_pools()
+    assert sha.ParallelHash256(message, leaf_size=1000, workers=2).digest() == \
+        sha.ParallelHash256(message, leaf_size=1000, workers=1).digest()
+
+
+def test_permutations():
+    lanes = [int.from_bytes(os.urandom(8), 'little') for _ in range(25)]
+
+    state = sha.KeccakState(1088, 1600)
+    state.s = list(lanes)
+    sha.keccak_f(state)
+    assert sha.keccak_f1600_lanes(lanes) == state.s
+
+    if sha.numpy is not None:
+        batch = sha.keccak_f1600_batch(sha.numpy.array([lanes, [0] * 25], dtype=sha.numpy.uint64))
+        assert [int(lane) for lane in batch[0]] == state.s
+        assert [int(lane) for lane in batch[1]] == sha.keccak_f1600_lanes([0] * 25)
+
+
+if __name__ == '__main__':
+    backends = [backend for backend in sha.SHA_BACKENDS if backend == 'python' or sha.hashlib_available()]
+    print('Backends: %s (default %s)' % (', '.join(backends), sha.get_backend()))
+
+    test_padding_functions()
+    test_permutations()
+
+    for backend in backends:
+        print('Known answer tests, backend %s' % backend)
+        sha.set_backend(backend)
+        test_vectors()
+        test_padding_edge_cases()
+        test_hash_batch()
+        test_fork()
+        test_hash_file()
+        test_parallel_hash_workers()
+
+        for i in range(8):
+            size = random.randint(0, 1 << random.randint(4, 12))
+            print('Incremental test %s, backend %s, %s bytes' % (i + 1, backend, size))
+            check_incremental(size)
+    sha.set_backend(None)
+    print('Done')